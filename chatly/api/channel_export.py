@@ -0,0 +1,231 @@
+"""
+Export of the history of channels (for compliance and backup)
+
+The export runs in a background job and writes one JSON object per line (NDJSON) - a "channel" line
+followed by a "message" line for every message, with its reactions, poll results and file reference.
+Messages are read in batches with keyset pagination on (channel_id, seq), so only one batch is in memory at a time.
+
+Writes are throttled to a maximum number of bytes per second (`chatly_export_bytes_per_second` in the site config),
+so that an export can run on a live site without competing with chat traffic.
+When the export is ready, the user gets a realtime event with the URL of the (private) file.
+"""
+
+import json
+import os
+import time
+import zipfile
+
+import frappe
+from frappe import _
+
+from chatly.api.chat_stream import get_page_query
+from chatly.permissions import get_accessible_channels, get_readable_channels
+
+# Number of messages read from the database at a time
+EXPORT_BATCH_SIZE = 500
+# Default maximum write rate of an export
+EXPORT_BYTES_PER_SECOND = 1024 * 1024
+
+EXPORT_FORMATS = ("ndjson", "zip")
+
+
+@frappe.whitelist(methods=["POST"])
+def export_channels(channel_ids: list | str | None = None, export_format: str = "ndjson"):
+	"""
+	API to export the history of channels. If no channels are given, all channels the user can read are exported.
+
+	export_format: "ndjson" (a single file) or "zip" (an NDJSON file per channel)
+
+	The export runs in the background - the user gets a `chatly:channel_export_ready` event with the file URL.
+	"""
+	if export_format not in EXPORT_FORMATS:
+		frappe.throw(_("Export format should be one of {0}").format(", ".join(EXPORT_FORMATS)))
+
+	if isinstance(channel_ids, str):
+		channel_ids = json.loads(channel_ids)
+
+	if channel_ids:
+		channel_ids = list(dict.fromkeys(channel_ids))
+		if len(get_readable_channels(channel_ids)) != len(channel_ids):
+			frappe.throw(_("You don't have permission to view this channel"), frappe.PermissionError)
+	else:
+		channel_ids = get_accessible_channels()
+
+	# One export per user at a time
+	job_id = f"chatly_channel_export:{frappe.session.user}"
+
+	frappe.enqueue(
+		run_export,
+		queue="long",
+		job_id=job_id,
+		deduplicate=True,
+		channel_ids=sorted(channel_ids),
+		export_format=export_format,
+	)
+
+	return job_id
+
+
+def run_export(channel_ids: list, export_format: str = "ndjson"):
+	"""
+	Write the export to a private file and notify the user - runs in a background job as the user
+	"""
+	timestamp = frappe.utils.now_datetime().strftime("%Y%m%d%H%M%S")
+	file_name = f"chatly-export-{frappe.generate_hash(length=6)}-{timestamp}.{export_format}"
+	path = frappe.get_site_path("private", "files", file_name)
+
+	throttle = ByteRateLimiter(
+		frappe.conf.get("chatly_export_bytes_per_second") or EXPORT_BYTES_PER_SECOND
+	)
+
+	if export_format == "zip":
+		with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+			for channel_id in channel_ids:
+				with archive.open(f"{channel_id}.ndjson", "w") as f:
+					write_channel(f, channel_id, throttle)
+	else:
+		with open(path, "wb") as f:
+			for channel_id in channel_ids:
+				write_channel(f, channel_id, throttle)
+
+	file_doc = frappe.get_doc(
+		{
+			"doctype": "File",
+			"file_name": file_name,
+			"file_url": f"/private/files/{file_name}",
+			"is_private": 1,
+			"file_size": os.path.getsize(path),
+		}
+	).insert(ignore_permissions=True)
+
+	frappe.publish_realtime(
+		"chatly:channel_export_ready",
+		{"file_url": file_doc.file_url, "channels": len(channel_ids)},
+		user=frappe.session.user,
+		after_commit=True,
+	)
+	frappe.db.commit()  # nosemgrep
+
+
+def write_channel(f, channel_id: str, throttle: "ByteRateLimiter"):
+	for line in iter_channel_lines(channel_id):
+		data = line.encode()
+		f.write(data)
+		throttle.consume(len(data))
+
+
+def iter_channel_lines(channel_id: str):
+	"""
+	Lines of the export of a channel - the channel, and then its messages (oldest first)
+	"""
+	channel = frappe.db.get_value(
+		"Chatly Channel",
+		channel_id,
+		[
+			"name",
+			"channel_name",
+			"type",
+			"channel_description",
+			"is_direct_message",
+			"is_archived",
+			"owner",
+			"creation",
+		],
+		as_dict=True,
+	)
+	if not channel:
+		# Deleted while the export was running
+		return
+
+	yield to_line({"type": "channel", **channel})
+
+	from_seq = None
+	while True:
+		messages = get_page_query(channel_id, EXPORT_BATCH_SIZE, from_seq, older=False).run(
+			as_dict=True
+		)
+
+		polls = get_poll_results([message.poll_id for message in messages if message.poll_id])
+
+		for message in messages[:EXPORT_BATCH_SIZE]:
+			yield to_line(
+				{
+					"type": "message",
+					"name": message.name,
+					"seq": message.seq,
+					"channel_id": message.channel_id,
+					"owner": message.owner,
+					"creation": message.creation,
+					"modified": message.modified,
+					"message_type": message.message_type,
+					"text": message.text,
+					"content": message.content,
+					"file": message.file,
+					"is_edited": message.is_edited,
+					"is_reply": message.is_reply,
+					"linked_message": message.linked_message,
+					"is_bot_message": message.is_bot_message,
+					"bot": message.bot,
+					"link_doctype": message.link_doctype,
+					"link_document": message.link_document,
+					"reactions": json.loads(message.message_reactions or "{}"),
+					"poll": polls.get(message.poll_id),
+				}
+			)
+
+		# End the read transaction between batches, so that a long export does not hold an old snapshot
+		frappe.db.commit()  # nosemgrep
+
+		if len(messages) <= EXPORT_BATCH_SIZE:
+			break
+
+		from_seq = messages[EXPORT_BATCH_SIZE - 1].seq
+
+
+def get_poll_results(poll_ids: list) -> dict:
+	"""
+	Questions and results of the polls in a batch of messages - poll ID -> poll
+	"""
+	if not poll_ids:
+		return {}
+
+	polls = {
+		poll.name: {**poll, "options": []}
+		for poll in frappe.get_all(
+			"Chatly Poll",
+			filters={"name": ("in", poll_ids)},
+			fields=["name", "question", "is_anonymous", "is_multi_choice", "is_disabled", "total_votes"],
+		)
+	}
+
+	for option in frappe.get_all(
+		"Chatly Poll Option",
+		filters={"parent": ("in", list(polls)), "parenttype": "Chatly Poll"},
+		fields=["parent", "option", "votes"],
+		order_by="idx asc",
+	):
+		polls[option.parent]["options"].append({"option": option.option, "votes": option.votes})
+
+	return polls
+
+
+def to_line(row: dict) -> str:
+	return json.dumps(row, default=str, ensure_ascii=False) + "\n"
+
+
+class ByteRateLimiter:
+	"""
+	Sleeps whenever more bytes were written than allowed by the rate since the limiter was created
+	"""
+
+	def __init__(self, bytes_per_second: int):
+		self.bytes_per_second = bytes_per_second
+		self.start = time.monotonic()
+		self.written = 0
+
+	def consume(self, size: int):
+		self.written += size
+
+		ahead_by = self.written / self.bytes_per_second - (time.monotonic() - self.start)
+		if ahead_by > 0:
+			time.sleep(ahead_by)
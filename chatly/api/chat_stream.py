@@ -1,17 +1,215 @@
-import datetime
+import json
 
 import frappe
 from frappe import _
 from frappe.query_builder import Order
-
+from frappe.utils import cint, get_datetime
+
+from chatly.chatly_channel_management.doctype.chatly_channel_counter.chatly_channel_counter import (
+	get_channel_counters,
+)
+from chatly.conditional_requests import is_not_modified, make_etag
+from chatly.message_cache import (
+	TAIL_SIZE,
+	get_cached_messages,
+	get_tail_version,
+	set_cached_messages,
+)
+from chatly.permissions import get_readable_channels
 from chatly.utils import track_channel_visit
 
 
+def get_message_query(message):
+	"""
+	Base query with the fields of a message that are sent to the chat stream
+	"""
+	return frappe.qb.from_(message).select(
+		message.name,
+		message.owner,
+		message.creation,
+		message.modified,
+		message.text,
+		message.file,
+		message.message_type,
+		message.message_reactions,
+		message.is_reply,
+		message.linked_message,
+		message._liked_by,
+		message.channel_id,
+		message.thumbnail_width,
+		message.thumbnail_height,
+		message.file_thumbnail,
+		message.link_doctype,
+		message.link_document,
+		message.replied_message_details,
+		message.content,
+		message.is_edited,
+		message.poll_id,
+		message.is_bot_message,
+		message.bot,
+		message.hide_link_preview,
+		message.seq,
+	)
+
+
+def get_page_query(
+	channel_id: str,
+	limit: int,
+	from_seq: int | None = None,
+	older: bool = True,
+	include_from_message: bool = False,
+):
+	"""
+	Query for a page of messages in a channel - older or newer than the cursor message (or the latest messages if there is no cursor)
+
+	Messages are ordered by their sequence number in the channel, so every page is a range scan on the (channel_id, seq) index.
+	The query fetches `limit + 1` rows - the extra row tells us if there are more messages beyond this page.
+	"""
+	# Cannot use `get_all` as it does not apply the `order_by` clause to multiple fields
+	message = frappe.qb.DocType("Chatly Message")
+
+	query = get_message_query(message).where(message.channel_id == channel_id)
+
+	if from_seq is not None:
+		if older:
+			condition = message.seq <= from_seq if include_from_message else message.seq < from_seq
+		else:
+			condition = message.seq >= from_seq if include_from_message else message.seq > from_seq
+
+		query = query.where(condition)
+
+	order = Order.desc if older else Order.asc
+
+	return query.orderby(message.seq, order=order).limit(limit + 1)
+
+
+def get_cursor_message(message_id: str) -> frappe._dict:
+	"""
+	Sequence number and creation of the message that a page starts from.
+	Throws if the message does not exist (or was deleted), instead of silently paging from the latest messages.
+	"""
+	cursor = frappe.get_cached_value(
+		"Chatly Message", message_id, ["seq", "creation"], as_dict=True
+	)
+	if not cursor:
+		frappe.throw(_("Message {0} does not exist").format(message_id), frappe.DoesNotExistError)
+
+	return cursor
+
+
+# Columns of a message in the compact wire format.
+# Columns that are usually empty come last, so that the trailing nulls of most rows can be dropped.
+COMPACT_COLUMNS = (
+	"name",
+	"seq",
+	"owner",
+	"channel_id",
+	"creation",
+	"modified",
+	"message_type",
+	"is_reply",
+	"is_edited",
+	"is_bot_message",
+	"hide_link_preview",
+	"text",
+	"content",
+	"message_reactions",
+	"_liked_by",
+	"file",
+	"file_thumbnail",
+	"thumbnail_width",
+	"thumbnail_height",
+	"linked_message",
+	"replied_message_details",
+	"link_doctype",
+	"link_document",
+	"poll_id",
+	"bot",
+)
+
+# Columns that are stored as JSON strings - these are sent parsed in the compact format
+COMPACT_JSON_COLUMNS = ("message_reactions", "replied_message_details")
+
+# Columns whose values repeat across messages - these are sent once in a lookup list,
+# and rows only contain the index of the value in that list
+COMPACT_INTERNED_COLUMNS = {"owner": "owners", "channel_id": "channels"}
+
+
+def pack_messages(messages: list) -> dict:
+	"""
+	Packs a list of messages into the compact wire format:
+
+	{
+		"columns": ["name", "seq", "owner", ...],
+		"rows": [["message-1", 42, 0, ...], ...],
+		"owners": ["Administrator", ...],
+		"channels": ["general", ...],
+	}
+
+	Each row has the values of the columns in order, with trailing nulls dropped.
+	Owners and channel IDs are replaced by their index in the "owners" and "channels" lists,
+	and reactions and replied message details are parsed instead of being sent as strings.
+	"""
+	lookups = {table: {} for table in COMPACT_INTERNED_COLUMNS.values()}
+	rows = []
+
+	for message in messages:
+		row = []
+		for column in COMPACT_COLUMNS:
+			value = message.get(column)
+
+			if value is not None and column in COMPACT_INTERNED_COLUMNS:
+				lookup = lookups[COMPACT_INTERNED_COLUMNS[column]]
+				value = lookup.setdefault(value, len(lookup))
+			elif value and column in COMPACT_JSON_COLUMNS:
+				value = json.loads(value)
+
+			row.append(value)
+
+		while row and row[-1] is None:
+			row.pop()
+
+		rows.append(row)
+
+	return {
+		"columns": COMPACT_COLUMNS,
+		"rows": rows,
+		**{table: list(lookup) for table, lookup in lookups.items()},
+	}
+
+
+def pack_response(response: dict, compact: bool = False) -> dict:
+	"""
+	Replaces the list of messages in an API response with its compact form if the client asked for it
+	"""
+	if not compact:
+		return response
+
+	return {**response, "messages": pack_messages(response["messages"])}
+
+
+def fetch_page(query, limit: int):
+	"""
+	Runs a query built by `get_page_query` and returns the page of messages along with a flag for whether there are more messages
+	"""
+	messages = query.run(as_dict=True)
+
+	has_more = len(messages) > limit
+
+	return messages[:limit], has_more
+
+
 @frappe.whitelist()
-def get_messages(channel_id: str, limit: int = 20, base_message: str | None = None):
+def get_messages(
+	channel_id: str, limit: int = 20, base_message: str | None = None, compact: bool = False
+):
 	"""
 	API to get list of messages for a channel, ordered by creation date (newest first)
 
+	If `compact` is set, the messages are returned in the compact wire format (see `pack_messages`)
+
+	The latest messages are tagged with an ETag. If the client sends it back (If-None-Match)
+	and nothing changed in the channel, an empty 304 response is returned.
 	"""
 
 	# Check permission for channel access
@@ -20,195 +218,315 @@ def get_messages(channel_id: str, limit: int = 20, base_message: str | None = No
 
 	# Fetch messages for the channel
 	if base_message:
-		return get_messages_around_base(channel_id, base_message)
+		return pack_response(get_messages_around_base(channel_id, base_message), compact)
 
-	# Cannot use `get_all` as it does not apply the `order_by` clause to multiple fields
-	message = frappe.qb.DocType("Chatly Message")
+	# The version must be read before the messages - a change in between only makes the ETag stale
+	etag = make_etag("messages", channel_id, get_tail_version(channel_id), limit, compact)
 
-	messages = (
-		frappe.qb.from_(message)
-		.select(
-			message.name,
-			message.owner,
-			message.creation,
-			message.modified,
-			message.text,
-			message.file,
-			message.message_type,
-			message.message_reactions,
-			message.is_reply,
-			message.linked_message,
-			message._liked_by,
-			message.channel_id,
-			message.thumbnail_width,
-			message.thumbnail_height,
-			message.file_thumbnail,
-			message.link_doctype,
-			message.link_document,
-			message.replied_message_details,
-			message.content,
-			message.is_edited,
-			message.poll_id,
-			message.is_bot_message,
-			message.bot,
-			message.hide_link_preview,
-		)
-		.where(message.channel_id == channel_id)
-		.orderby(message.creation, order=Order.desc)
-		.orderby(message.name, order=Order.desc)
-		.limit(limit)
-		.run(as_dict=True)
+	if is_not_modified(etag):
+		track_channel_visit(channel_id=channel_id, commit=True)
+		return
+
+	messages, has_old_messages = fetch_latest_messages(channel_id, limit)
+
+	track_channel_visit(channel_id=channel_id, commit=True)
+	return pack_response(
+		{
+			"messages": messages,
+			"has_old_messages": has_old_messages,
+			"has_new_messages": False,
+		},
+		compact,
 	)
 
-	has_old_messages = False
-
-	# Check if older messages are available
-	if len(messages) == limit:
-		# Check if there are more messages available
-		older_message = frappe.db.get_all(
-			"Chatly Message",
-			pluck="name",
-			filters={"channel_id": channel_id, "creation": ("<", messages[-1].creation)},
-			order_by="creation desc, name desc",
-			limit=1,
+
+def fetch_latest_messages(channel_id: str, limit: int = 20):
+	"""
+	Fetches the latest messages in a channel - served from the hot-tail cache when possible.
+	On a cache miss, the whole tail is fetched from the database and cached for the next request.
+	"""
+	cached = get_cached_messages(channel_id, limit)
+	if cached is not None:
+		return cached
+
+	if limit >= TAIL_SIZE:
+		return fetch_page(get_page_query(channel_id, limit), limit)
+
+	version = get_tail_version(channel_id)
+	messages, _has_more = fetch_page(get_page_query(channel_id, TAIL_SIZE), TAIL_SIZE)
+	set_cached_messages(channel_id, messages, version)
+
+	return messages[:limit], len(messages) > limit
+
+
+# Maximum number of channels that can be prefetched in one request
+MAX_PREFETCH_CHANNELS = 50
+
+
+@frappe.whitelist()
+def get_messages_for_channels(
+	channel_ids: list[str] | str, limit: int = 20, compact: bool = False
+):
+	"""
+	API to get the latest messages of multiple channels in one request - used to prefetch channels on startup
+
+	Channels that the user cannot read are left out of the response.
+	Prefetching a channel is not a visit, so unread counts are not reset.
+	"""
+	if isinstance(channel_ids, str):
+		channel_ids = json.loads(channel_ids)
+
+	# Remove duplicates but keep the order
+	channel_ids = list(dict.fromkeys(channel_ids))
+
+	if len(channel_ids) > MAX_PREFETCH_CHANNELS:
+		frappe.throw(
+			_("You can only fetch messages of {0} channels at a time").format(MAX_PREFETCH_CHANNELS)
 		)
 
-		if len(older_message) > 0:
-			has_old_messages = True
+	readable_channels = set(get_readable_channels(channel_ids))
+	channel_ids = [channel_id for channel_id in channel_ids if channel_id in readable_channels]
+
+	pages = fetch_latest_messages_for_channels(channel_ids, limit)
 
-	track_channel_visit(channel_id=channel_id, commit=True)
 	return {
-		"messages": messages,
-		"has_old_messages": has_old_messages,
-		"has_new_messages": False,
+		"channels": {
+			channel_id: pack_response(
+				{
+					"messages": pages[channel_id][0],
+					"has_old_messages": pages[channel_id][1],
+					"has_new_messages": False,
+				},
+				compact,
+			)
+			for channel_id in channel_ids
+		}
 	}
 
 
-def get_messages_around_base(channel_id: str, base_message: str):
+def fetch_latest_messages_for_channels(channel_ids: list[str], limit: int = 20) -> dict:
 	"""
-	Get 10 messages before base message and 10 messages after
+	Fetches the latest messages of multiple channels - same as `fetch_latest_messages`,
+	but the channels that are not cached are fetched from the database in a single query.
+
+	Returns a dict of channel ID to (messages, has_old_messages)
 	"""
-	# Fetch older messages for the channel
-	from_timestamp = frappe.get_cached_value("Chatly Message", base_message, "creation")
+	pages = {}
+	uncached_channels = []
 
-	# TODO: Optimize this to use a complex SQL query to fetch around the main message
-	older_messages = fetch_older_messages(channel_id, base_message, from_timestamp, 10)
-	newer_messages = fetch_newer_messages(
-		channel_id, base_message, from_timestamp, 10, include_from_message=True
-	)
+	for channel_id in channel_ids:
+		cached = get_cached_messages(channel_id, limit)
+		if cached is not None:
+			pages[channel_id] = cached
+		else:
+			uncached_channels.append(channel_id)
 
-	combined_messages = newer_messages.get("messages", []) + older_messages.get("messages", [])
+	if not uncached_channels:
+		return pages
+
+	# Fetch the whole tail so that it can be cached for the next request
+	page_size = max(limit, TAIL_SIZE)
+	versions = {channel_id: get_tail_version(channel_id) for channel_id in uncached_channels}
+
+	query = None
+	for channel_id in uncached_channels:
+		page_query = get_page_query(channel_id, page_size)
+		query = page_query if query is None else query.union_all(page_query)
+
+	messages_by_channel = {channel_id: [] for channel_id in uncached_channels}
+	for row in query.run(as_dict=True):
+		messages_by_channel[row.channel_id].append(row)
+
+	for channel_id, messages in messages_by_channel.items():
+		# The order of rows in a UNION is not guaranteed, so sort them here
+		messages.sort(key=lambda m: m.seq, reverse=True)
+
+		if limit < TAIL_SIZE:
+			set_cached_messages(channel_id, messages[:TAIL_SIZE], versions[channel_id])
+
+		pages[channel_id] = (messages[:limit], len(messages) > limit)
+
+	return pages
+
+
+def get_messages_around_base(channel_id: str, base_message: str, limit: int = 10):
+	"""
+	Get 10 messages before base message and 10 messages after (including the base message)
+	"""
+	base = get_cursor_message(base_message)
+
+	response = fetch_messages_around(channel_id, base.seq, limit)
 
 	return {
-		**older_messages,
-		**newer_messages,
-		"messages": combined_messages,
-		"from_timestamp": from_timestamp,
+		**response,
+		"from_timestamp": base.creation,
 	}
 
 
 @frappe.whitelist()
-def get_older_messages(channel_id: str, from_message: str, limit: int = 20):
+def get_messages_around_date(channel_id: str, date: str, limit: int = 10, compact: bool = False):
 	"""
-	API to get older messages for a channel, ordered by creation date (newest first)
+	API to open a channel at a date - gets the messages around the first message sent at or after the given date/time
+	(or the last message of the channel, if no message was sent after it)
 
-	Function is split into two to avoid duplicate perm check and timestamp check
+	The response is the same as `get_messages` with a base message, along with the name of the base message
+	so that the client can scroll to it.
 	"""
 
 	# Check permission for channel access
 	if not frappe.has_permission(doctype="Chatly Channel", doc=channel_id, ptype="read"):
 		frappe.throw(_("You do not have permission to access this channel"), frappe.PermissionError)
-	# Fetch older messages for the channel
-	from_timestamp = frappe.get_cached_value("Chatly Message", from_message, "creation")
 
-	return fetch_older_messages(channel_id, from_message, from_timestamp, limit)
+	limit = min(cint(limit) or 10, 100)
+	base_message = get_message_nearest_to_date(channel_id, get_datetime(date))
+
+	if not base_message:
+		return pack_response(
+			{
+				"messages": [],
+				"has_old_messages": False,
+				"has_new_messages": False,
+				"from_timestamp": None,
+				"base_message": None,
+			},
+			compact,
+		)
+
+	response = fetch_messages_around(channel_id, base_message.seq, limit)
 
+	return pack_response(
+		{
+			**response,
+			"from_timestamp": base_message.creation,
+			"base_message": base_message.name,
+		},
+		compact,
+	)
 
-def fetch_older_messages(
-	channel_id: str, from_message: str, from_timestamp: datetime.datetime, limit: int = 20
-):
-	# Cannot use `get_all` as it does not apply the `order_by` clause to multiple fields
+
+def get_message_nearest_to_date(channel_id: str, date):
+	"""
+	Gets the first message in the channel sent at or after the date - or the last message before it if there is none
+
+	The creation timestamp of that message is found with a single seek on the (channel_id, creation) index.
+	Messages with the same creation timestamp are then ordered by their sequence number, which is the order
+	of the message stream (live messages get their sequence number when they are inserted, not by name).
+	"""
 	message = frappe.qb.DocType("Chatly Message")
 
-	messages = (
+	query = (
 		frappe.qb.from_(message)
-		.select(
-			message.name,
-			message.owner,
-			message.creation,
-			message.modified,
-			message.text,
-			message.file,
-			message.message_type,
-			message.message_reactions,
-			message.is_reply,
-			message.linked_message,
-			message._liked_by,
-			message.channel_id,
-			message.thumbnail_width,
-			message.thumbnail_height,
-			message.file_thumbnail,
-			message.link_doctype,
-			message.link_document,
-			message.replied_message_details,
-			message.content,
-			message.is_edited,
-			message.poll_id,
-			message.is_bot_message,
-			message.bot,
-			message.hide_link_preview,
-		)
+		.select(message.creation)
 		.where(message.channel_id == channel_id)
-		.where(
-			(message.creation < from_timestamp)
-			| ((message.creation == from_timestamp) & (message.name < from_message))
+		.limit(1)
+	)
+
+	order = Order.asc
+	creation = (
+		query.where(message.creation >= date)
+		.orderby(message.creation, order=order)
+		.run(pluck=True)
+	)
+
+	if not creation:
+		# The date is after the last message, so open the channel at its latest message
+		order = Order.desc
+		creation = (
+			query.where(message.creation < date)
+			.orderby(message.creation, order=order)
+			.run(pluck=True)
 		)
-		.orderby(message.creation, order=Order.desc)
-		.orderby(message.name, order=Order.desc)
-		.limit(limit)
+
+	if not creation:
+		return None
+
+	rows = (
+		frappe.qb.from_(message)
+		.select(message.name, message.seq, message.creation)
+		.where(message.channel_id == channel_id)
+		.where(message.creation == creation[0])
+		.orderby(message.seq, order=order)
+		.limit(1)
 		.run(as_dict=True)
 	)
 
-	has_old_messages = False
-
-	# Check if older messages are available
-	if len(messages) == limit:
-		# Check if there are more messages available
-		older_message = frappe.db.get_all(
-			"Chatly Message",
-			pluck="name",
-			filters={
-				"channel_id": channel_id,
-				"creation": ("<=", messages[-1].creation),
-				"name": ["!=", messages[-1].name],
-			},
-			order_by="creation desc, name desc",
-			limit=1,
-		)
+	return rows[0] if rows else None
 
-		if len(older_message) > 0:
-			has_old_messages = True
 
-	return {"messages": messages, "has_old_messages": has_old_messages}
+def fetch_messages_around(channel_id: str, base_seq: int, limit: int = 10):
+	"""
+	Fetches `limit` messages older than the base message and `limit` messages newer than it (including the base message)
+
+	Both halves are fetched in a single round trip - each half of the UNION fetches one extra row
+	so that we know whether there are more messages beyond the window without running another query.
+	"""
+	older_query = get_page_query(channel_id, limit, base_seq, older=True)
+	newer_query = get_page_query(
+		channel_id, limit, base_seq, older=False, include_from_message=True
+	)
+
+	rows = older_query.union_all(newer_query).run(as_dict=True)
+
+	# The order of rows in a UNION is not guaranteed, so split and sort them here
+	older_messages = sorted(
+		(row for row in rows if row.seq < base_seq), key=lambda m: m.seq, reverse=True
+	)
+	newer_messages = sorted((row for row in rows if row.seq >= base_seq), key=lambda m: m.seq)
+
+	has_old_messages = len(older_messages) > limit
+	has_new_messages = len(newer_messages) > limit
+
+	newer_messages = newer_messages[:limit]
+	# The newer messages are in ascending order, so reverse them
+	newer_messages.reverse()
+
+	return {
+		"messages": newer_messages + older_messages[:limit],
+		"has_old_messages": has_old_messages,
+		"has_new_messages": has_new_messages,
+	}
 
 
 @frappe.whitelist()
-def get_newer_messages(channel_id: str, from_message: str, limit: int = 20):
+def get_older_messages(channel_id: str, from_message: str, limit: int = 20, compact: bool = False):
 	"""
 	API to get older messages for a channel, ordered by creation date (newest first)
+
+	Function is split into two to avoid duplicate perm check and timestamp check
 	"""
 
 	# Check permission for channel access
 	if not frappe.has_permission(doctype="Chatly Channel", doc=channel_id, ptype="read"):
 		frappe.throw(_("You do not have permission to access this channel"), frappe.PermissionError)
-
 	# Fetch older messages for the channel
-	from_timestamp = frappe.get_cached_value("Chatly Message", from_message, "creation")
+	from_seq = get_cursor_message(from_message).seq
 
-	response = fetch_newer_messages(
-		channel_id, from_message, from_timestamp, limit, include_from_message=False
+	return pack_response(fetch_older_messages(channel_id, from_seq, limit), compact)
+
+
+def fetch_older_messages(channel_id: str, from_seq: int, limit: int = 20):
+	messages, has_old_messages = fetch_page(
+		get_page_query(channel_id, limit, from_seq, older=True), limit
 	)
 
+	return {"messages": messages, "has_old_messages": has_old_messages}
+
+
+@frappe.whitelist()
+def get_newer_messages(channel_id: str, from_message: str, limit: int = 20, compact: bool = False):
+	"""
+	API to get older messages for a channel, ordered by creation date (newest first)
+	"""
+
+	# Check permission for channel access
+	if not frappe.has_permission(doctype="Chatly Channel", doc=channel_id, ptype="read"):
+		frappe.throw(_("You do not have permission to access this channel"), frappe.PermissionError)
+
+	# Fetch newer messages for the channel
+	from_seq = get_cursor_message(from_message).seq
+
+	response = fetch_newer_messages(channel_id, from_seq, limit, include_from_message=False)
+
 	if response.get("has_new_messages") == False:
 		# If no newer messages are available, we can track it as a visit to the channel
 		# There are cases when we want to publish the unread count update event for a specific user
@@ -216,85 +534,117 @@ def get_newer_messages(channel_id: str, from_message: str, limit: int = 20):
 		# Now if the user scrolls to the bottom, we need to update the unread count
 		track_channel_visit(channel_id=channel_id, commit=True, publish_event_for_user=True)
 
-	return response
+	return pack_response(response, compact)
 
 
 def fetch_newer_messages(
-	channel_id: str,
-	from_message: str,
-	from_timestamp: datetime.datetime,
-	limit: int = 20,
-	include_from_message: bool = False,
+	channel_id: str, from_seq: int, limit: int = 20, include_from_message: bool = False
 ):
+	messages, has_new_messages = fetch_page(
+		get_page_query(
+			channel_id, limit, from_seq, older=False, include_from_message=include_from_message
+		),
+		limit,
+	)
 
-	message = frappe.qb.DocType("Chatly Message")
+	# The messages are in ascending order, so reverse them
+	messages.reverse()
+	return {"messages": messages, "has_new_messages": has_new_messages}
 
-	if include_from_message:
-		condition = (message.creation > from_timestamp) | (
-			(message.creation == from_timestamp) & (message.name >= from_message)
-		)
 
-	else:
-		condition = (message.creation > from_timestamp) | (
-			(message.creation == from_timestamp) & (message.name > from_message)
-		)
+# Maximum number of changes returned by `get_channel_changes`.
+# If a client has missed more than this, it's cheaper to reload the channel.
+MAX_CHANGES_PER_SYNC = 500
 
-	messages = (
-		frappe.qb.from_(message)
-		.select(
-			message.name,
-			message.owner,
-			message.creation,
-			message.modified,
-			message.text,
-			message.file,
-			message.message_type,
-			message.message_reactions,
-			message.is_reply,
-			message.linked_message,
-			message._liked_by,
-			message.channel_id,
-			message.thumbnail_width,
-			message.thumbnail_height,
-			message.file_thumbnail,
-			message.link_doctype,
-			message.link_document,
-			message.replied_message_details,
-			message.content,
-			message.is_edited,
-			message.poll_id,
-			message.is_bot_message,
-			message.bot,
-			message.hide_link_preview,
-		)
-		.where(message.channel_id == channel_id)
-		.where(condition)
-		.orderby(message.creation, order=Order.asc)
-		.orderby(message.name, order=Order.asc)
-		.limit(limit)
+
+@frappe.whitelist()
+def get_channel_changes(channel_id: str, since_version: int | None = None, compact: bool = False):
+	"""
+	API to get everything that changed in a channel since the given version (cursor)
+
+	Returns the IDs of messages that were created, edited or deleted, the latest details of the created/edited messages,
+	and the latest reactions of messages that were only reacted to.
+	If `since_version` is not given, only the current version of the channel is returned.
+
+	If the changes since the cursor are no longer available (or there are too many of them),
+	`reset` is set and the client should reload the channel.
+
+	If `compact` is set, the messages are returned in the compact wire format (see `pack_messages`)
+	"""
+
+	# Check permission for channel access
+	if not frappe.has_permission(doctype="Chatly Channel", doc=channel_id, ptype="read"):
+		frappe.throw(_("You do not have permission to access this channel"), frappe.PermissionError)
+
+	current_version = get_channel_counters(channel_id).change_version or 0
+
+	response = {
+		"version": current_version,
+		"reset": False,
+		"created": [],
+		"edited": [],
+		"deleted": [],
+		"reactions": {},
+		"messages": [],
+	}
+
+	if since_version is None or since_version == current_version:
+		return pack_response(response, compact)
+
+	change = frappe.qb.DocType("Chatly Message Change")
+
+	changes = (
+		frappe.qb.from_(change)
+		.select(change.version, change.message_id, change.change_type, change.message_reactions)
+		.where(change.channel_id == channel_id)
+		.where(change.version > since_version)
+		.orderby(change.version, order=Order.asc)
+		.limit(MAX_CHANGES_PER_SYNC + 1)
 		.run(as_dict=True)
 	)
 
-	has_new_messages = False
-
-	# Check if newer messages are available
-	if len(messages) == limit:
-		# Check if there are more messages available
-		newer_message = frappe.db.get_all(
-			"Chatly Message",
-			pluck="name",
-			filters={
-				"channel_id": channel_id,
-				"creation": (">=", messages[-1].creation),
-				"name": ["!=", messages[-1].name],
-			},
-			order_by="creation asc, name asc",
-			limit=1,
-		)
+	# Versions of a channel are dense - if the first change is not the one right after the cursor,
+	# older changes have been deleted (or the cursor is from a channel that was deleted and created again)
+	if (
+		since_version > current_version
+		or len(changes) > MAX_CHANGES_PER_SYNC
+		or not changes
+		or changes[0].version != since_version + 1
+	):
+		response["reset"] = True
+		return pack_response(response, compact)
+
+	# Collapse the changes to the latest state of each message
+	message_states = {}
+	reactions = {}
+	for message_change in changes:
+		message_id = message_change.message_id
+		if message_change.change_type == "Reacted":
+			reactions[message_id] = json.loads(message_change.message_reactions or "{}")
+		elif message_change.change_type == "Edited" and message_states.get(message_id) == "Created":
+			# The client does not have the message yet, so the edit is a part of the creation
+			continue
+		else:
+			message_states[message_id] = message_change.change_type
+
+	for message_id, state in message_states.items():
+		response[state.lower()].append(message_id)
+
+	# The details of created and edited messages already have the latest reactions
+	response["reactions"] = {
+		message_id: message_reactions
+		for message_id, message_reactions in reactions.items()
+		if message_id not in message_states
+	}
 
-		if len(newer_message) > 0:
-			has_new_messages = True
+	changed_messages = response["created"] + response["edited"]
+	if changed_messages:
+		message = frappe.qb.DocType("Chatly Message")
+		response["messages"] = (
+			get_message_query(message)
+			.where(message.name.isin(changed_messages))
+			.orderby(message.seq, order=Order.desc)
+			.run(as_dict=True)
+		)
 
-	# The messages are in ascending order, so reverse them
-	messages.reverse()
-	return {"messages": messages, "has_new_messages": has_new_messages}
+	return pack_response(response, compact)
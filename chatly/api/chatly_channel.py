@@ -1,8 +1,20 @@
 import frappe
 from frappe import _
-from frappe.query_builder import Order
 
 from chatly.api.chatly_users import get_current_chatly_user
+from chatly.channel_last_message import (
+	apply_last_messages,
+	get_last_message,
+	get_last_messages_digest,
+)
+from chatly.conditional_requests import (
+	CHANNEL_LIST_VERSION_KEY,
+	get_membership_version_key,
+	get_version,
+	is_not_modified,
+	make_etag,
+)
+from chatly.permissions import get_accessible_channels
 
 
 @frappe.whitelist()
@@ -10,11 +22,17 @@ def get_all_channels(hide_archived=True):
 	"""
 	Fetches all channels where current user is a member - both channels and DMs
 	To be used on the web app.
+
+	The response is tagged with an ETag - if the client sends it back (If-None-Match)
+	and none of the user's channels has changed since, an empty 304 response is returned.
 	"""
 
 	if hide_archived == "false":
 		hide_archived = False
 
+	if is_not_modified(get_channel_list_etag(hide_archived)):
+		return
+
 	# 1. Get "channels" - public, open, private, and DMs
 	channels = get_channel_list(hide_archived)
 
@@ -38,6 +56,25 @@ def get_all_channels(hide_archived=True):
 	return {"channels": channel_list, "dm_channels": dm_list}
 
 
+def get_channel_list_etag(hide_archived=False) -> str:
+	"""
+	ETag of the channel list of the current user, built from:
+	1. The version of the channels (bumped when any channel is created, changed or deleted - rare)
+	2. The membership version of the user (bumped when the user joins or leaves a channel)
+	3. The last messages of the channels the user can read - messages in other channels do not change it
+	"""
+	user = frappe.session.user
+
+	return make_etag(
+		"channels",
+		get_version(CHANNEL_LIST_VERSION_KEY),
+		get_version(get_membership_version_key(user)),
+		get_last_messages_digest(sorted(get_accessible_channels(user))),
+		user,
+		bool(hide_archived),
+	)
+
+
 def get_channel_list(hide_archived=False):
 	"""
 	get List of all channels where current user is a member (all includes public, private, open, and DM channels)
@@ -69,25 +106,21 @@ def get_channel_list(hide_archived=False):
 	if hide_archived:
 		query = query.where(channel.is_archived == 0)
 
-	query = query.orderby(channel.last_message_timestamp, order=Order.desc)
+	# The latest last messages are in Redis - they are applied (and the channels sorted) below
+	channels = query.run(as_dict=True)
 
-	return query.run(as_dict=True)
+	return apply_last_messages(channels)
 
 
 @frappe.whitelist()
 def get_last_message_details(channel_id: str):
 
 	if frappe.has_permission(doctype="Chatly Channel", doc=channel_id, ptype="read"):
-		last_message_timestamp = frappe.get_cached_value(
-			"Chatly Channel", channel_id, "last_message_timestamp"
-		)
-		last_message_details = frappe.get_cached_value(
-			"Chatly Channel", channel_id, "last_message_details"
-		)
+		last_message = get_last_message(channel_id)
 
 		return {
-			"last_message_timestamp": last_message_timestamp,
-			"last_message_details": last_message_details,
+			"last_message_timestamp": last_message["last_message_timestamp"],
+			"last_message_details": last_message["last_message_details"],
 		}
 
 
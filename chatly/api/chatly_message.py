@@ -3,11 +3,30 @@ from datetime import timedelta
 
 import frappe
 from frappe import _
-from frappe.query_builder import Case, JoinType, Order
-from frappe.query_builder.functions import Coalesce, Count
+from frappe.query_builder import Order
+from frappe.query_builder.functions import Count
+from frappe.utils import cint
 
+from chatly.api.chat_stream import get_cursor_message, get_page_query
 from chatly.api.chatly_channel import get_peer_user_id
-from chatly.utils import get_channel_member, track_channel_visit
+from chatly.channel_visits import get_pending_visits
+from chatly.chatly_channel_management.doctype.chatly_channel_counter.chatly_channel_counter import (
+	get_channel_counters,
+)
+from chatly.chatly_channel_management.doctype.chatly_channel_member.chatly_channel_member import (
+	get_unread_count,
+)
+from chatly.chatly_messaging.doctype.chatly_message_attachment.chatly_message_attachment import (
+	FILE_CATEGORIES,
+)
+from chatly.chatly_messaging.doctype.chatly_saved_message.chatly_saved_message import (
+	save_message as save_bookmark,
+)
+from chatly.message_cache import invalidate_tail_after_commit
+from chatly.message_ingestion import insert_messages
+from chatly.pagination import paginate
+from chatly.permissions import get_accessible_channels
+from chatly.utils import track_channel_visit
 
 
 @frappe.whitelist(methods=["POST"])
@@ -43,6 +62,38 @@ def send_message(channel_id, text, is_reply, linked_message=None, json_content=N
 		return "message sent"
 
 
+@frappe.whitelist(methods=["POST"])
+def send_messages(channel_id: str, messages: list | str):
+	"""
+	Send many text messages to a channel at once (for importers and integrations)
+
+	messages: list of {text, json_content, is_reply, linked_message} - sent in the given order
+
+	Returns the names of the messages sent
+	"""
+	if isinstance(messages, str):
+		messages = json.loads(messages)
+
+	docs = []
+	for message in messages:
+		clean_text = (message.get("text") or "").replace("<li><br></li>", "").strip()
+		if not clean_text:
+			continue
+
+		docs.append(
+			{
+				"channel_id": channel_id,
+				"text": clean_text,
+				"message_type": "Text",
+				"is_reply": message.get("is_reply") or 0,
+				"linked_message": message.get("linked_message"),
+				"json": message.get("json_content"),
+			}
+		)
+
+	return insert_messages(docs)
+
+
 @frappe.whitelist()
 def fetch_recent_files(channel_id):
 	"""
@@ -62,79 +113,52 @@ def fetch_recent_files(channel_id):
 	return files
 
 
-def get_messages(channel_id):
-
-	messages = frappe.db.get_all(
-		"Chatly Message",
-		filters={"channel_id": channel_id},
-		fields=[
-			"name",
-			"owner",
-			"creation",
-			"modified",
-			"text",
-			"file",
-			"message_type",
-			"message_reactions",
-			"is_reply",
-			"linked_message",
-			"_liked_by",
-			"channel_id",
-			"thumbnail_width",
-			"thumbnail_height",
-			"file_thumbnail",
-			"link_doctype",
-			"link_document",
-			"replied_message_details",
-			"content",
-			"is_edited",
-		],
-		order_by="creation asc",
-	)
-
-	return messages
-
-
-@frappe.whitelist()
+@frappe.whitelist(methods=["POST"])
 def save_message(message_id, add=False):
 	"""
-	Save the message as a bookmark
+	Save the message as a bookmark (add="Yes"), or remove the bookmark (add="No")
 	"""
-	from frappe.desk.like import toggle_like
+	frappe.has_permission("Chatly Message", doc=message_id, ptype="read", throw=True)
 
-	toggle_like("Chatly Message", message_id, add)
+	liked_by = save_bookmark(message_id, frappe.session.user, add in ("Yes", True, 1, "1", "true"))
 
-	liked_by = frappe.db.get_value("Chatly Message", message_id, "_liked_by")
+	# `_liked_by` is a part of the cached messages in the chat stream
+	invalidate_tail_after_commit(frappe.get_cached_value("Chatly Message", message_id, "channel_id"))
 
 	frappe.publish_realtime(
 		"message_saved",
 		{
 			"message_id": message_id,
-			"liked_by": liked_by,
+			"liked_by": json.dumps(liked_by),
 		},
 		user=frappe.session.user,
+		after_commit=True,
 	)
 
 	return "message saved"
 
 
 @frappe.whitelist()
-def get_saved_messages():
+def get_saved_messages(page_length=20, cursor=None):
 	"""
-	Fetches list of all messages liked by the user
-	Check if the user has permission to view the message
+	Fetches the messages saved by the user (most recently saved first), a page at a time
+	Only messages in channels the user can read are returned
+
+	Returns the messages and the cursor for the next page (None on the last page)
 	"""
 
+	accessible_channels = get_accessible_channels()
+	if not accessible_channels:
+		return {"messages": [], "next_cursor": None}
+
+	saved_message = frappe.qb.DocType("Chatly Saved Message")
 	chatly_message = frappe.qb.DocType("Chatly Message")
-	chatly_channel = frappe.qb.DocType("Chatly Channel")
-	chatly_channel_member = frappe.qb.DocType("Chatly Channel Member")
 
+	# A range scan on the (user, creation) index of the bookmarks of the user
 	query = (
-		frappe.qb.from_(chatly_message)
-		.join(chatly_channel, JoinType.left)
-		.on(chatly_message.channel_id == chatly_channel.name)
-		.join(chatly_channel_member, JoinType.left)
-		.on(chatly_channel.name == chatly_channel_member.channel_id)
+		frappe.qb.from_(saved_message)
+		.join(chatly_message)
+		.on(saved_message.message_id == chatly_message.name)
 		.select(
 			chatly_message.name,
 			chatly_message.owner,
@@ -145,28 +169,36 @@ def get_saved_messages():
 			chatly_message.message_type,
 			chatly_message.message_reactions,
 			chatly_message._liked_by,
+			saved_message.name.as_("saved_id"),
+			saved_message.creation.as_("saved_on"),
 		)
-		.where(chatly_message._liked_by.like("%" + frappe.session.user + "%"))
-		.where(
-			(chatly_channel.type.isin(["Open", "Public"]))
-			| (chatly_channel_member.user_id == frappe.session.user)
-		)
-		.orderby(chatly_message.creation, order=Order.asc)
-		.distinct()
-	)  # Add DISTINCT keyword to retrieve only unique messages
+		.where(saved_message.user == frappe.session.user)
+		.where(saved_message.channel_id.isin(accessible_channels))
+	)
+
+	messages, next_cursor = paginate(
+		query,
+		[saved_message.creation, saved_message.name],
+		["saved_on", "saved_id"],
+		min(cint(page_length) or 20, 100),
+		cursor,
+	)
 
-	messages = query.run(as_dict=True)
+	return {"messages": messages, "next_cursor": next_cursor}
 
-	return messages
 
+def parse_messages(messages, previous_message=None):
+	return list(iter_message_blocks(messages, previous_message))
 
-def parse_messages(messages):
 
-	messages_with_date_header = []
-	previous_message = None
+def iter_message_blocks(messages, previous_message=None):
+	"""
+	Yields a date block before the first message of every day, and a message block for every message (oldest first)
 
-	for i in range(len(messages)):
-		message = messages[i]
+	`previous_message` is the message just before the first one (from the previous page) -
+	so that continuations and date headers are correct across page boundaries.
+	"""
+	for message in messages:
 		is_continuation = (
 			previous_message
 			and message["owner"] == previous_message["owner"]
@@ -174,15 +206,13 @@ def parse_messages(messages):
 		)
 		message["is_continuation"] = int(bool(is_continuation))
 
-		if i == 0 or message["creation"].date() != previous_message["creation"].date():
-			messages_with_date_header.append({"block_type": "date", "data": message["creation"].date()})
+		if not previous_message or message["creation"].date() != previous_message["creation"].date():
+			yield {"block_type": "date", "data": message["creation"].date()}
 
-		messages_with_date_header.append({"block_type": "message", "data": message})
+		yield {"block_type": "message", "data": message}
 
 		previous_message = message
 
-	return messages_with_date_header
-
 
 def check_permission(channel_id):
 	if frappe.get_cached_value("Chatly Channel", channel_id, "type") == "Private":
@@ -197,50 +227,89 @@ def check_permission(channel_id):
 
 
 @frappe.whitelist()
-def get_messages_with_dates(channel_id):
+def get_messages_with_dates(channel_id, limit=100, before_message=None):
+	"""
+	Latest `limit` messages of the channel (or the ones before `before_message`) with date blocks, oldest first
+	"""
 	check_permission(channel_id)
-	messages = get_messages(channel_id)
-	track_channel_visit(channel_id=channel_id, publish_event_for_user=True, commit=True)
-	return parse_messages(messages)
+
+	limit = min(cint(limit) or 100, 500)
+	before_seq = get_cursor_message(before_message).seq if before_message else None
+
+	# The extra row fetched by the page query is the message just before the page
+	rows = get_page_query(channel_id, limit, before_seq).run(as_dict=True)
+	messages = rows[:limit][::-1]
+	previous_message = rows[limit] if len(rows) > limit else None
+
+	if not before_message:
+		track_channel_visit(channel_id=channel_id, publish_event_for_user=True, commit=True)
+
+	return parse_messages(messages, previous_message)
 
 
 @frappe.whitelist()
 def get_unread_count_for_channels():
+	"""
+	Unread message counts of all channels of the user
+
+	Counts are calculated from the counters of the channel (last message sequence number, deleted messages)
+	and of the channel member (last seen sequence number, messages deleted since) - so this does not read any messages.
+	"""
 
 	channel = frappe.qb.DocType("Chatly Channel")
+	counter = frappe.qb.DocType("Chatly Channel Counter")
 	channel_member = frappe.qb.DocType("Chatly Channel Member")
-	message = frappe.qb.DocType("Chatly Message")
-	query = (
+	channels = (
 		frappe.qb.from_(channel)
+		.left_join(counter)
+		.on(counter.name == channel.name)
 		.left_join(channel_member)
 		.on(
 			(channel.name == channel_member.channel_id) & (channel_member.user_id == frappe.session.user)
 		)
 		.where((channel.type == "Open") | (channel_member.user_id == frappe.session.user))
 		.where(channel.is_archived == 0)
-		.left_join(message)
-		.on(channel.name == message.channel_id)
-	)
-
-	channels_query = (
-		query.select(
+		.select(
 			channel.name,
 			channel.is_direct_message,
-			Count(Case().when(message.creation > Coalesce(channel_member.last_visit, "2000-11-11"), 1)).as_(
-				"unread_count"
-			),
+			counter.last_message_seq,
+			counter.deleted_message_count,
+			channel_member.name.as_("channel_member"),
+			channel_member.last_seen_seq,
+			channel_member.deleted_unread_count,
 		)
-		.groupby(channel.name)
 		.run(as_dict=True)
 	)
 
+	# Visits that are not written to the database yet
+	pending_visits = get_pending_visits(frappe.session.user)
+
 	total_unread_count_in_channels = 0
 	total_unread_count_in_dms = 0
-	for channel in channels_query:
+	channels_query = []
+	for channel in channels:
+		unread_count = get_unread_count(
+			channel.last_message_seq,
+			channel.deleted_message_count,
+			channel.channel_member,
+			channel.last_seen_seq,
+			channel.deleted_unread_count,
+			pending_visits.get(channel.name),
+			channel.name,
+		)
+
 		if channel.is_direct_message:
-			total_unread_count_in_dms += channel["unread_count"]
+			total_unread_count_in_dms += unread_count
 		else:
-			total_unread_count_in_channels += channel["unread_count"]
+			total_unread_count_in_channels += unread_count
+
+		channels_query.append(
+			{
+				"name": channel.name,
+				"is_direct_message": channel.is_direct_message,
+				"unread_count": unread_count,
+			}
+		)
 
 	result = {
 		"total_unread_count_in_channels": total_unread_count_in_channels,
@@ -252,35 +321,41 @@ def get_unread_count_for_channels():
 
 @frappe.whitelist()
 def get_unread_count_for_channel(channel_id):
-	channel_member = get_channel_member(channel_id=channel_id)
-	if channel_member:
-		last_timestamp = frappe.get_cached_value("Chatly Channel Member", channel_member, "last_visit")
+	channel_type = frappe.db.get_value("Chatly Channel", channel_id, "type")
+	if not channel_type:
+		return 0
 
-		return frappe.db.count(
-			"Chatly Message",
-			filters={
-				"channel_id": channel_id,
-				"creation": (">", last_timestamp),
-			},
+	channel = get_channel_counters(channel_id)
+
+	channel_member = frappe.db.get_value(
+		"Chatly Channel Member",
+		{"channel_id": channel_id, "user_id": frappe.session.user},
+		["name", "last_seen_seq", "deleted_unread_count"],
+		as_dict=True,
+	)
+	if channel_member:
+		return get_unread_count(
+			channel.last_message_seq,
+			channel_member=channel_member.name,
+			last_seen_seq=channel_member.last_seen_seq,
+			deleted_unread_count=channel_member.deleted_unread_count,
+			pending_visit=get_pending_visits(frappe.session.user).get(channel_id),
+			channel_id=channel_id,
 		)
 	else:
-		if frappe.get_cached_value("Chatly Channel", channel_id, "type") == "Open":
-			return frappe.db.count(
-				"Chatly Message",
-				filters={
-					"channel_id": channel_id,
-				},
-			)
+		if channel_type == "Open":
+			return get_unread_count(channel.last_message_seq, channel.deleted_message_count)
 		else:
 			return 0
 
-	return 0
-
 
 @frappe.whitelist()
 def get_timeline_message_content(doctype, docname):
+	accessible_channels = get_accessible_channels()
+	if not accessible_channels:
+		return []
+
 	channel = frappe.qb.DocType("Chatly Channel")
-	channel_member = frappe.qb.DocType("Chatly Channel Member")
 	message = frappe.qb.DocType("Chatly Message")
 	user = frappe.qb.DocType("User")
 	query = (
@@ -300,13 +375,9 @@ def get_timeline_message_content(doctype, docname):
 		)
 		.join(channel)
 		.on(message.channel_id == channel.name)
-		.join(channel_member)
-		.on(
-			(message.channel_id == channel_member.channel_id) & (message.owner == channel_member.user_id)
-		)
 		.join(user)
 		.on(message.owner == user.name)
-		.where((channel.type != "Private") | (channel_member.user_id == frappe.session.user))
+		.where(message.channel_id.isin(accessible_channels))
 		.where(message.link_doctype == doctype)
 		.where(message.link_document == docname)
 	)
@@ -332,154 +403,108 @@ def get_timeline_message_content(doctype, docname):
 	return timeline_contents
 
 
-file_extensions = {
-	"doc": [
-		"doc",
-		"docx",
-		"odt",
-		"ott",
-		"rtf",
-		"txt",
-		"dot",
-		"dotx",
-		"docm",
-		"dotm",
-		"pages",
-	],
-	"ppt": [
-		"ppt",
-		"pptx",
-		"odp",
-		"otp",
-		"pps",
-		"ppsx",
-		"pot",
-		"potx",
-		"pptm",
-		"ppsm",
-		"potm",
-		"ppam",
-		"ppa",
-		"key",
-	],
-	"xls": [
-		"xls",
-		"xlsx",
-		"csv",
-		"ods",
-		"ots",
-		"xlsb",
-		"xlsm",
-		"xlt",
-		"xltx",
-		"xltm",
-		"xlam",
-		"xla",
-		"numbers",
-	],
-}
+# The number of files in a channel is cached for this long (see `get_count_for_pagination_of_files`)
+FILE_COUNT_CACHE_SECONDS = 300
 
 
 @frappe.whitelist()
 def get_all_files_shared_in_channel(
-	channel_id, file_name=None, file_type=None, start_after=0, page_length=None
+	channel_id, file_name=None, file_type=None, page_length=10, cursor=None
 ):
+	"""
+	Files shared in a channel (latest first), a page at a time - from the attachment catalogue of the channel
+
+	Returns the files and the cursor for the next page (None on the last page)
+	"""
 
 	# check if the user has permission to view the channel
 	check_permission(channel_id)
 
+	attachment = frappe.qb.DocType("Chatly Message Attachment")
 	message = frappe.qb.DocType("Chatly Message")
 	user = frappe.qb.DocType("Chatly User")
-	file = frappe.qb.DocType("File")
 
+	# Only the messages and users of the files on the page are joined (by their primary keys)
 	query = (
-		frappe.qb.from_(message)
-		.join(file)
-		.on(message.name == file.attached_to_name)
-		.join(user)
-		.on(message.owner == user.name)
+		frappe.qb.from_(attachment)
+		.join(message)
+		.on(attachment.message_id == message.name)
+		.left_join(user)
+		.on(attachment.owner == user.name)
 		.select(
-			file.name,
-			file.file_name,
-			file.file_type,
-			file.file_size,
-			file.file_url,
-			message.owner,
-			message.creation,
-			message.message_type,
+			attachment.name,
+			attachment.file_name,
+			attachment.file_extension.as_("file_type"),
+			attachment.file_category,
+			attachment.file_size,
+			attachment.file_url,
+			attachment.owner,
+			attachment.creation,
+			attachment.message_type,
 			message.thumbnail_width,
 			message.thumbnail_height,
 			message.file_thumbnail,
 			user.full_name,
 			user.user_image,
-			message.name.as_("message_id"),
+			attachment.message_id,
 		)
-		.where(message.channel_id == channel_id)
+		.where(attachment.channel_id == channel_id)
 	)
-
-	# search for file name
-	if file_name:
-		query = query.where(file.file_name.like("%" + file_name + "%"))
-
-	# search for file type
-	if file_type:
-		if file_type == "image":
-			query = query.where(message.message_type == "Image")
-		elif file_type == "pdf":
-			query = query.where(file.file_type == "pdf")
-		else:
-			# Get the list of extensions for the given file type
-			extensions = file_extensions.get(file_type)
-			if extensions:
-				query = query.where((file.file_type).isin(extensions))
-	else:
-		query = query.where(message.message_type.isin(["Image", "File"]))
-
-	files = (
-		query.orderby(message.creation, order=Order["desc"])
-		.limit(page_length)
-		.offset(start_after)
-		.run(as_dict=True)
+	query = filter_files(query, attachment, file_name, file_type)
+
+	# Keyset pagination on the (channel_id, creation) index - a deep page costs the same as the first one
+	files, next_cursor = paginate(
+		query,
+		[attachment.creation, attachment.name],
+		["creation", "name"],
+		min(cint(page_length) or 10, 100),
+		cursor,
 	)
 
-	return files
+	return {"files": files, "next_cursor": next_cursor}
 
 
 @frappe.whitelist()
 def get_count_for_pagination_of_files(channel_id, file_name=None, file_type=None):
+	"""
+	Number of files shared in a channel - only an estimate, since it is cached for a few minutes.
+	Pagination of the files does not need it, it is only shown to the user.
+	"""
 
 	# check if the user has permission to view the channel
 	check_permission(channel_id)
 
-	message = frappe.qb.DocType("Chatly Message")
-	# user = frappe.qb.DocType("Chatly User")
-	file = frappe.qb.DocType("File")
+	cache_key = f"chatly:file_count:{channel_id}:{file_type or ''}:{file_name or ''}"
+	count = frappe.cache().get_value(cache_key)
+	if count is not None:
+		return count
+
+	attachment = frappe.qb.DocType("Chatly Message Attachment")
 
 	query = (
-		frappe.qb.from_(message)
-		.join(file, JoinType.left)
-		.on(message.name == file.attached_to_name)
-		.select(Count(message.name).as_("count"))
-		.where(message.channel_id == channel_id)
+		frappe.qb.from_(attachment)
+		.select(Count(attachment.name).as_("count"))
+		.where(attachment.channel_id == channel_id)
 	)
+	query = filter_files(query, attachment, file_name, file_type)
+	count = query.run(as_dict=True)[0]["count"]
+
+	frappe.cache().set_value(cache_key, count, expires_in_sec=FILE_COUNT_CACHE_SECONDS)
+
+	return count
+
+
+def filter_files(query, attachment, file_name=None, file_type=None):
+	"""
+	Filters for the name and type (image, pdf, doc, ppt or xls) of the files shared in a channel
+	"""
 
 	# search for file name
 	if file_name:
-		query = query.where(file.file_name.like("%" + file_name + "%"))
+		query = query.where(attachment.file_name.like("%" + file_name + "%"))
 
 	# search for file type
-	if file_type:
-		if file_type == "image":
-			query = query.where(message.message_type == "Image")
-		elif file_type == "pdf":
-			query = query.where(file.file_type == "pdf")
-		else:
-			# Get the list of extensions for the given file type
-			extensions = file_extensions.get(file_type)
-			if extensions:
-				query = query.where((file.file_type).isin(extensions))
-	else:
-		query = query.where(message.message_type.isin(["Image", "File"]))
-	count = query.run(as_dict=True)
+	if file_type in FILE_CATEGORIES:
+		query = query.where(attachment.file_category == file_type)
 
-	return count[0]["count"]
+	return query
@@ -4,6 +4,13 @@ import frappe
 from frappe import _
 from frappe.utils.caching import redis_cache
 
+from chatly.conditional_requests import (
+	USER_LIST_VERSION_KEY,
+	get_version,
+	is_not_modified,
+	make_etag,
+)
+
 
 @frappe.whitelist(methods=["GET"])
 def get_current_chatly_user():
@@ -41,6 +48,10 @@ def get_list():
 			title=_("Insufficient permissions. Please contact your administrator."),
 		)
 
+	# The list is the same for all users - the client can skip downloading it if it has the latest version
+	if is_not_modified(make_etag("users", get_version(USER_LIST_VERSION_KEY))):
+		return
+
 	# Get users is cached since this won't change frequently
 	return get_users()
 
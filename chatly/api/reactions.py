@@ -3,6 +3,11 @@ import json
 import frappe
 from frappe import _
 
+from chatly.chatly_messaging.doctype.chatly_message_change.chatly_message_change import (
+	record_message_change,
+)
+from chatly.message_cache import invalidate_tail_after_commit
+
 
 @frappe.whitelist(methods=["POST"])
 def react(message_id: str, reaction: str):
@@ -82,6 +87,8 @@ def calculate_message_reaction(message_id):
 		json.dumps(total_reactions),
 		update_modified=False,
 	)
+	invalidate_tail_after_commit(channel_id)
+	record_message_change(channel_id, message_id, "Reacted", json.dumps(total_reactions))
 	frappe.publish_realtime(
 		"message_reacted",
 		{
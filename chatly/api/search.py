@@ -1,9 +1,35 @@
 import json
 import operator
+import re
+import time
 from functools import reduce
 
 import frappe
-from pypika import JoinType, Order
+from frappe.utils import cint
+from pypika import CustomFunction, Order
+from pypika.functions import Substring
+from pypika.terms import Term, ValueWrapper
+from pypika.utils import format_alias_sql
+
+from chatly.chatly.doctype.chatly_name_token.chatly_name_token import get_matching_names
+from chatly.chatly_messaging.doctype.chatly_message.chatly_message import CONTENT_FULLTEXT_INDEX
+from chatly.chatly_messaging.doctype.chatly_message_attachment.chatly_message_attachment import (
+	FILE_CATEGORIES,
+)
+from chatly.pagination import paginate
+from chatly.permissions import get_accessible_channels
+
+# Words shorter than this are not in the full-text index (innodb_ft_min_token_size)
+FULLTEXT_MIN_WORD_LENGTH = 3
+
+# Search results have a snippet of this many characters of the message, instead of the whole message
+SNIPPET_LENGTH = 200
+# Characters of the snippet before the match
+SNIPPET_CONTEXT = 60
+
+Greatest = CustomFunction("GREATEST", ["a", "b"])
+Locate = CustomFunction("LOCATE", ["substring", "string"])
+CharLength = CustomFunction("CHAR_LENGTH", ["string"])
 
 
 @frappe.whitelist()
@@ -19,63 +45,22 @@ def get_search_result(
 	message_type=None,
 	channel_type=None,
 	my_channel_only=False,
-	sort_field="creation",
+	sort_field=None,
 	sort_order="desc",
 	page_length=10,
-	start_after=0,
+	cursor=None,
 ):
 	doctype = frappe.qb.DocType(doctype)
 	channel_member = frappe.qb.DocType("Chatly Channel Member")
 	channel = frappe.qb.DocType("Chatly Channel")
-	message = frappe.qb.DocType("Chatly Message")
+	saved_message = frappe.qb.DocType("Chatly Saved Message")
 
-	file_extensions = {
-		"pdf": "pdf",
-		"doc": [
-			"doc",
-			"docx",
-			"odt",
-			"ott",
-			"rtf",
-			"txt",
-			"dot",
-			"dotx",
-			"docm",
-			"dotm",
-			"pages",
-		],
-		"ppt": [
-			"ppt",
-			"pptx",
-			"odp",
-			"otp",
-			"pps",
-			"ppsx",
-			"pot",
-			"potx",
-			"pptm",
-			"ppsm",
-			"potm",
-			"ppam",
-			"ppa",
-			"key",
-		],
-		"xls": [
-			"xls",
-			"xlsx",
-			"csv",
-			"ods",
-			"ots",
-			"xlsb",
-			"xlsm",
-			"xlt",
-			"xltx",
-			"xltm",
-			"xlam",
-			"xla",
-			"numbers",
-		],
-	}
+	relevance = None
+
+	# Channels that the user can read are resolved once (and cached), instead of joining members on every row
+	accessible_channels = get_accessible_channels()
+	if not accessible_channels:
+		return {"results": [], "next_cursor": None}
 
 	query = (
 		frappe.qb.from_(doctype)
@@ -86,24 +71,39 @@ def get_search_result(
 			doctype.creation,
 			doctype.message_type,
 			doctype.channel_id,
-			doctype.text,
-			doctype.content,
 		)
-		.join(channel, JoinType.left)
-		.on(doctype.channel_id == channel.name)
-		.join(channel_member, JoinType.left)
-		.on(channel_member.channel_id == doctype.channel_id)
-		.where((channel.type != "Private") | (channel_member.user_id == frappe.session.user))
+		.where(doctype.channel_id.isin(accessible_channels))
 	)
+	channel_field = doctype.channel_id
 
 	if filter_type == "File":
-		query = query.where(doctype.message_type != "Text").distinct()
+		# Files are searched in the attachment catalogue (named after their messages) instead of the messages
+		doctype = frappe.qb.DocType("Chatly Message Attachment")
+		query = (
+			frappe.qb.from_(doctype)
+			.select(
+				doctype.name,
+				doctype.file_url.as_("file"),
+				doctype.file_name,
+				doctype.file_category,
+				doctype.owner,
+				doctype.creation,
+				doctype.message_type,
+				doctype.channel_id,
+			)
+			.where(doctype.channel_id.isin(accessible_channels))
+		)
+		channel_field = doctype.channel_id
 
 	if filter_type == "Message":
-		query = query.where(doctype.message_type == "Text").distinct()
+		# Only a snippet of the content around the match is read (see `get_snippet`), not the whole message
+		query = query.where(doctype.message_type == "Text").select(
+			*get_snippet_fields(doctype.content, search_text)
+		)
+	elif filter_type != "File" and filter_type != "Channel":
+		query = query.select(doctype.text, doctype.content)
 
 	if filter_type == "Channel":
-		channel = doctype
 		query = (
 			frappe.qb.from_(doctype)
 			.select(
@@ -115,20 +115,26 @@ def get_search_result(
 				doctype.channel_description,
 				doctype.is_archived,
 			)
-			.join(channel_member, JoinType.left)
-			.on(channel_member.channel_id == doctype.name)
 			.where(doctype.is_direct_message == 0)
-			.where((doctype.type != "Private") | (channel_member.user_id == frappe.session.user))
-			.distinct()
+			.where(doctype.name.isin(accessible_channels))
 		)
+		channel_field = doctype.name
 
 	if search_text:
 		if filter_type == "File":
-			query = query.where(doctype.file.like("/private/files/%" + search_text + "%"))
+			query = query.where(doctype.file_name.like("%" + search_text + "%"))
 		elif filter_type == "Message":
-			query = query.where(doctype.content.like("%" + search_text + "%"))
+			condition, relevance = get_content_search(doctype.content, search_text)
+			query = query.where(condition)
+			if relevance:
+				relevance = relevance.as_("relevance")
+				query = query.select(relevance)
 		elif filter_type == "Channel":
-			query = query.where(doctype.channel_name.like("%" + search_text + "%"))
+			matching_channels = get_matching_names("Chatly Channel", search_text)
+			if matching_channels is None:
+				# The search text has no words (like "#"), so no channel name can match it
+				return {"results": [], "next_cursor": None}
+			query = query.where(doctype.name.isin(matching_channels))
 
 	if from_user:
 		query = query.where(doctype.owner == from_user)
@@ -143,37 +149,290 @@ def get_search_result(
 		query = query.where(doctype.message_type == message_type)
 
 	if file_type and file_type != "[]":
-		file_type = json.loads(file_type)
-		filters = []
-		for type in file_type:
-			if type != "image" and type in file_extensions:
-				if isinstance(file_extensions[type], list):
-					filters.append(
-						reduce(
-							operator.or_,
-							[doctype.file.like("/private/files/%." + ext) for ext in file_extensions[type]],
-						)
-					)
-				else:
-					filters.append(doctype.file.like("/private/files/%." + file_extensions[type]))
-		if filters:
-			if "image" in file_type:
-				query = query.where((doctype.message_type == "Image") | (reduce(operator.or_, filters)))
-			else:
-				query = query.where(reduce(operator.or_, filters))
+		# A category ("pdf") or a JSON list of categories
+		file_types = json.loads(file_type) if file_type.startswith("[") else [file_type]
+		file_categories = [category for category in file_types if category in FILE_CATEGORIES]
+		if file_categories:
+			query = query.where(doctype.file_category.isin(file_categories))
 
 	if channel_type:
 		query = query.where(doctype.type == channel_type)
 
 	if my_channel_only:
-		query = query.where((channel.type == "Open") | (channel_member.user_id == frappe.session.user))
+		# Open channels and the channels the user is a member of
+		member_channels = (
+			frappe.qb.from_(channel_member)
+			.select(channel_member.channel_id)
+			.where(channel_member.user_id == frappe.session.user)
+		)
+		open_channels = frappe.qb.from_(channel).select(channel.name).where(channel.type == "Open")
+		query = query.where(channel_field.isin(member_channels) | channel_field.isin(open_channels))
 
 	if saved == "true":
-		query = query.where(message._liked_by.like(f"%{frappe.session.user}%"))
+		saved_messages = (
+			frappe.qb.from_(saved_message)
+			.select(saved_message.message_id)
+			.where(saved_message.user == frappe.session.user)
+		)
+		query = query.where(doctype.name.isin(saved_messages))
+
+	# Pages are fetched with a cursor on the sort values (and the name to break ties), not an offset
+	order = sort_order
+	if sort_field:
+		sort_fields, keys = [doctype[sort_field], doctype.name], [sort_field, "name"]
+		query = query.select(doctype[sort_field])
+	elif relevance:
+		# Most relevant messages first, and the latest ones among equally relevant messages
+		sort_fields = [relevance, doctype.creation, doctype.name]
+		keys = ["relevance", "creation", "name"]
+		order = "desc"
+	else:
+		sort_fields, keys = [doctype.creation, doctype.name], ["creation", "name"]
 
-	return (
-		query.orderby(doctype[sort_field], order=Order[sort_order])
-		.limit(page_length)
-		.offset(start_after)
+	results, next_cursor = paginate(
+		query, sort_fields, keys, min(cint(page_length) or 10, 100), cursor, Order[order]
+	)
+
+	if filter_type == "Message":
+		words = get_search_words(search_text)
+		for row in results:
+			snippet = get_snippet(
+				row.pop("snippet"), row.pop("snippet_start"), row.pop("content_length"), words
+			)
+			row.update(snippet)
+
+	return {"results": results, "next_cursor": next_cursor}
+
+
+@frappe.whitelist()
+def get_typeahead_results(search_text: str, limit: int = 10):
+	"""
+	Channels and users with a name that has a word starting with every word of the search text (for pickers).
+	Only channels that the user can read are returned. Direct messages are found by the name of the user.
+	"""
+	frappe.has_permission("Chatly User", throw=True)
+
+	limit = min(cint(limit) or 10, 50)
+
+	matching_channels = get_matching_names("Chatly Channel", search_text)
+	if matching_channels is None:
+		return {"channels": [], "users": []}
+
+	channels = []
+	accessible_channels = get_accessible_channels()
+	if accessible_channels:
+		channel = frappe.qb.DocType("Chatly Channel")
+		channels = (
+			frappe.qb.from_(channel)
+			.select(channel.name, channel.channel_name, channel.type, channel.is_archived)
+			.where(channel.name.isin(matching_channels))
+			.where(channel.name.isin(accessible_channels))
+			.orderby(channel.channel_name)
+			.limit(limit)
+			.run(as_dict=True)
+		)
+
+	user = frappe.qb.DocType("Chatly User")
+	users = (
+		frappe.qb.from_(user)
+		.select(
+			user.name,
+			user.full_name,
+			user.user_image,
+			user.type,
+			user.availability_status,
+		)
+		.where(user.name.isin(get_matching_names("Chatly User", search_text)))
+		.where(user.enabled == 1)
+		.orderby(user.full_name)
+		.limit(limit)
 		.run(as_dict=True)
 	)
+
+	return {"channels": channels, "users": users}
+
+
+def get_search_words(search_text: str | None) -> list:
+	return list(dict.fromkeys(re.findall(r"\w+", (search_text or "").lower())))
+
+
+def get_snippet_fields(field, search_text: str | None) -> list:
+	"""
+	Columns for a window of SNIPPET_LENGTH characters of the content, starting a little before the first
+	occurrence of the longest word of the search text - computed by the database, in the query that matches
+
+	Returns the snippet, its (1-based) start and the length of the whole content.
+	"""
+	words = get_search_words(search_text)
+
+	if frappe.db.db_type != "mariadb":
+		# The window is cut in Python (see `get_snippet`)
+		return [
+			field.as_("snippet"),
+			ValueWrapper(1).as_("snippet_start"),
+			ValueWrapper(None).as_("content_length"),
+		]
+
+	start = ValueWrapper(1)
+	if words:
+		start = Greatest(Locate(max(words, key=len), field) - SNIPPET_CONTEXT, 1)
+
+	return [
+		Substring(field, start, SNIPPET_LENGTH).as_("snippet"),
+		start.as_("snippet_start"),
+		CharLength(field).as_("content_length"),
+	]
+
+
+def get_snippet(text: str | None, start: int, content_length: int | None, words: list) -> dict:
+	"""
+	A snippet of the content of a message (cut at word boundaries, with "…" where it was cut), and the offsets
+	of the words of the search text in it - [[start, end], ...] in UTF-16 code units, so that they can be used
+	directly with JavaScript strings.
+	"""
+	text = text or ""
+	start = start or 1
+
+	if content_length is None:
+		# The whole content was read - cut the window here
+		content_length = len(text)
+		position = text.lower().find(max(words, key=len)) if words else -1
+		start = max(position - SNIPPET_CONTEXT, 0) + 1
+		text = text[start - 1 : start - 1 + SNIPPET_LENGTH]
+
+	cut_at_start = start > 1
+	cut_at_end = start - 1 + len(text) < content_length
+
+	# Drop the partial words at the edges of the window (unless they are long, like paths in logs)
+	if cut_at_start:
+		text = re.sub(r"^\S{0,30}\s+", "", text, count=1)
+	if cut_at_end:
+		text = re.sub(r"\s+\S{0,30}$", "", text, count=1)
+
+	text = " ".join(text.split())
+	snippet = ("… " if cut_at_start else "") + text + (" …" if cut_at_end else "")
+
+	spans = []
+	for word in words:
+		# Indexed words are matched as prefixes of words (like the full-text search), short words anywhere
+		pattern = re.escape(word)
+		if len(word) >= FULLTEXT_MIN_WORD_LENGTH:
+			pattern = rf"\b{pattern}\w*"
+		spans.extend(match.span() for match in re.finditer(pattern, snippet, re.IGNORECASE))
+
+	highlights = []
+	for span_start, span_end in sorted(spans):
+		if highlights and span_start <= highlights[-1][1]:
+			highlights[-1][1] = max(highlights[-1][1], span_end)
+		else:
+			highlights.append([span_start, span_end])
+
+	return {
+		"snippet": snippet,
+		"highlights": [
+			[get_utf16_length(snippet[:a]), get_utf16_length(snippet[:b])] for a, b in highlights
+		],
+	}
+
+
+def get_utf16_length(text: str) -> int:
+	return len(text.encode("utf-16-le")) // 2
+
+
+class MatchAgainst(Term):
+	"""
+	MATCH (column) AGAINST (query IN BOOLEAN MODE) - a full-text search condition, and its relevance score
+	"""
+
+	def __init__(self, field, search_query: str, alias=None):
+		super().__init__(alias=alias)
+		self.field = field
+		self.search_query = search_query
+
+	def get_sql(self, with_alias=False, **kwargs):
+		sql = "MATCH({}) AGAINST ({} IN BOOLEAN MODE)".format(
+			self.field.get_sql(**kwargs), frappe.db.escape(self.search_query)
+		)
+		if with_alias:
+			return format_alias_sql(sql, self.alias, **kwargs)
+		return sql
+
+
+def get_search_terms(search_text: str) -> tuple[str, list]:
+	"""
+	Splits the search text into a boolean mode full-text query - every word is required and matched as a prefix
+	(so "depl serv" finds "deployed the server") - and the words that are too short to be in the full-text index
+	"""
+	words = get_search_words(search_text)
+
+	fulltext_query = " ".join(f"+{word}*" for word in words if len(word) >= FULLTEXT_MIN_WORD_LENGTH)
+	short_words = [word for word in words if len(word) < FULLTEXT_MIN_WORD_LENGTH]
+
+	return fulltext_query, short_words
+
+
+def get_content_search(field, search_text: str):
+	"""
+	Condition to search the content of messages, and the relevance of a message (None if it is not ranked)
+
+	Uses the full-text index on MariaDB. Words that are not in the index (and databases without it) use LIKE.
+	"""
+	fulltext_query, short_words = get_search_terms(search_text)
+
+	if frappe.db.db_type != "mariadb" or not (fulltext_query or short_words):
+		return field.like(f"%{search_text}%"), None
+
+	conditions = [field.like(f"%{word}%") for word in short_words]
+
+	relevance = None
+	if fulltext_query:
+		relevance = MatchAgainst(field, fulltext_query)
+		conditions.append(relevance > 0)
+
+	return reduce(operator.and_, conditions), relevance
+
+
+def run_benchmark(search_text: str, runs: int = 20) -> dict:
+	"""
+	Compare the latency (in ms) of searching the content of messages with LIKE vs. the full-text index
+
+	Usage: bench --site <site> execute chatly.api.search.run_benchmark --kwargs "{'search_text': 'deploy'}"
+	"""
+	frappe.only_for("System Manager")
+
+	if not frappe.db.has_index("tabChatly Message", CONTENT_FULLTEXT_INDEX):
+		frappe.throw("The full-text index on Chatly Message is missing - run bench migrate")
+
+	message = frappe.qb.DocType("Chatly Message")
+	condition, relevance = get_content_search(message.content, search_text)
+
+	like_query = (
+		frappe.qb.from_(message)
+		.select(message.name)
+		.where(message.content.like(f"%{search_text}%"))
+		.orderby(message.creation, order=Order.desc)
+		.limit(10)
+	)
+
+	fulltext_query = frappe.qb.from_(message).select(message.name).where(condition).limit(10)
+	if relevance:
+		fulltext_query = fulltext_query.orderby(relevance, order=Order.desc)
+
+	def measure(query) -> dict:
+		timings = []
+		for _i in range(runs):
+			start = time.monotonic()
+			query.run()
+			timings.append((time.monotonic() - start) * 1000)
+
+		timings.sort()
+		return {
+			"p50": round(timings[len(timings) // 2], 2),
+			"p95": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+		}
+
+	return {
+		"messages": frappe.db.count("Chatly Message"),
+		"like_ms": measure(like_query),
+		"fulltext_ms": measure(fulltext_query),
+	}
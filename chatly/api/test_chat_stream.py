@@ -1,9 +1,39 @@
 import datetime
+import json
+from unittest.mock import patch
 
 import frappe
 from frappe.tests.utils import FrappeTestCase
 
-from chatly.api.chat_stream import get_messages, get_newer_messages, get_older_messages
+from chatly.api.channel_export import iter_channel_lines
+from chatly.api.chat_stream import (
+	get_channel_changes,
+	get_messages,
+	get_messages_around_date,
+	get_messages_for_channels,
+	get_newer_messages,
+	get_older_messages,
+)
+from chatly.api.chatly_message import get_messages_with_dates, send_messages
+from chatly.api.search import get_search_result
+from chatly.chatly_messaging.doctype.chatly_message_change.chatly_message_change import (
+	record_message_change,
+)
+from chatly.conditional_requests import make_etag
+from chatly.message_cache import (
+	get_cached_messages,
+	get_tail_version,
+	invalidate_tail,
+	push_message,
+)
+from chatly.patches.v1_7.set_message_seq import set_message_seq_for_channel
+from chatly.permissions import (
+	ACCESSIBLE_CHANNELS_KEY,
+	channel_has_permission,
+	clear_accessible_channels,
+	fetch_accessible_channels,
+	get_accessible_channels,
+)
 
 CHANNEL_ID = "test-channel"
 
@@ -29,6 +59,7 @@ def create_messages():
 				"content": f"Test Message {i}",
 				"channel_id": CHANNEL_ID,
 				"message_type": "Text",
+				"seq": i + 1,
 				"creation": creation,
 				"modified": creation,
 			}
@@ -36,6 +67,43 @@ def create_messages():
 		message.db_insert()
 
 
+def create_messages_with_equal_creation(reference_message: str, count: int = 5):
+	"""
+	Create test messages with the exact same creation timestamp as the reference message
+	These messages are only ordered by their name - the channel is renumbered in that order
+	"""
+	creation = frappe.db.get_value("Chatly Message", reference_message, "creation")
+
+	for i in range(count):
+		message = frappe.get_doc(
+			{
+				"doctype": "Chatly Message",
+				"name": f"{reference_message}-{i}",
+				"text": f"Test Message Tie {i}",
+				"content": f"Test Message Tie {i}",
+				"channel_id": CHANNEL_ID,
+				"message_type": "Text",
+				"creation": creation,
+				"modified": creation,
+			}
+		)
+		message.db_insert()
+
+	set_message_seq_for_channel(CHANNEL_ID)
+
+
+def get_all_message_names():
+	"""
+	Get the names of all messages in the channel, ordered by sequence number (newest first)
+	"""
+	return frappe.get_all(
+		"Chatly Message",
+		filters={"channel_id": CHANNEL_ID},
+		order_by="seq desc",
+		pluck="name",
+	)
+
+
 def create_channel():
 	channel_doc = frappe.get_doc(
 		{
@@ -268,3 +336,420 @@ class TestChatStream(FrappeTestCase):
 		# Loop over and check indexes of all messages
 		for i, message in enumerate(response["messages"]):
 			self.assertEqual(message.text, f"Test Message {99-i}")
+
+	def test_pages_from_missing_message(self):
+		"""
+		Pages from a message that does not exist (or was deleted) should not fall back to the latest messages
+		"""
+		with self.assertRaises(frappe.DoesNotExistError):
+			get_older_messages(CHANNEL_ID, "missing-message")
+
+		with self.assertRaises(frappe.DoesNotExistError):
+			get_newer_messages(CHANNEL_ID, "missing-message")
+
+		with self.assertRaises(frappe.DoesNotExistError):
+			get_messages(CHANNEL_ID, base_message="missing-message")
+
+	def test_get_messages_around_base_with_equal_creation(self):
+		"""
+		Get messages around a base message which shares its creation timestamp with other messages
+		Messages with the same timestamp should be ordered by their name - none of them should be skipped or repeated
+		"""
+		create_messages_with_equal_creation(f"{CHANNEL_ID}-50")
+		all_messages = get_all_message_names()
+
+		for base_message_id in [f"{CHANNEL_ID}-50", f"{CHANNEL_ID}-50-0", f"{CHANNEL_ID}-50-2"]:
+			response = get_messages(CHANNEL_ID, base_message=base_message_id)
+
+			base_index = all_messages.index(base_message_id)
+			# 9 newer messages + the base message + 10 older messages
+			expected_messages = all_messages[max(base_index - 9, 0) : base_index + 11]
+
+			self.assertEqual([message.name for message in response["messages"]], expected_messages)
+			self.assertEqual(response["has_old_messages"], True)
+			self.assertEqual(response["has_new_messages"], True)
+
+	def test_get_messages_around_date(self):
+		"""
+		Chat Stream `get_messages_around_date` API
+		The API should return the messages around the first message sent at or after the date
+		"""
+		date = datetime.datetime.now() - datetime.timedelta(days=30, hours=12)
+		response = get_messages_around_date(CHANNEL_ID, str(date))
+
+		self.assertEqual(response["base_message"], f"{CHANNEL_ID}-70")
+		self.assertEqual(
+			[message.text for message in response["messages"]],
+			[f"Test Message {79-i}" for i in range(20)],
+		)
+		self.assertEqual(response["has_old_messages"], True)
+		self.assertEqual(response["has_new_messages"], True)
+
+		# Messages with the same timestamp as the date - the first one in sequence is the base message
+		create_messages_with_equal_creation(f"{CHANNEL_ID}-50")
+		creation = frappe.db.get_value("Chatly Message", f"{CHANNEL_ID}-50", "creation")
+		response = get_messages_around_date(CHANNEL_ID, str(creation))
+		self.assertEqual(response["base_message"], f"{CHANNEL_ID}-50")
+
+		# No message after the date - the channel is opened at its latest message
+		response = get_messages_around_date(
+			CHANNEL_ID, str(datetime.datetime.now() + datetime.timedelta(days=1))
+		)
+		self.assertEqual(response["base_message"], f"{CHANNEL_ID}-99")
+		self.assertEqual(len(response["messages"]), 11)
+		self.assertEqual(response["has_new_messages"], False)
+
+		# Before the first message - the channel is opened at its first message
+		response = get_messages_around_date(
+			CHANNEL_ID, str(datetime.datetime.now() - datetime.timedelta(days=365))
+		)
+		self.assertEqual(response["base_message"], f"{CHANNEL_ID}-0")
+		self.assertEqual(response["has_old_messages"], False)
+
+	def test_paginate_over_equal_creation(self):
+		"""
+		Paginating with a small limit across messages with the same timestamp should return every message exactly once
+		"""
+		create_messages_with_equal_creation(f"{CHANNEL_ID}-50")
+		all_messages = get_all_message_names()
+
+		# Page through the channel from the newest message to the oldest
+		response = get_messages(CHANNEL_ID, limit=2)
+		fetched_messages = [message.name for message in response["messages"]]
+		while response["has_old_messages"]:
+			response = get_older_messages(CHANNEL_ID, fetched_messages[-1], limit=2)
+			fetched_messages += [message.name for message in response["messages"]]
+
+		self.assertEqual(fetched_messages, all_messages)
+
+		# Page through the channel from the oldest message to the newest
+		fetched_messages = [all_messages[-1]]
+		response = {"has_new_messages": True}
+		while response["has_new_messages"]:
+			response = get_newer_messages(CHANNEL_ID, fetched_messages[0], limit=2)
+			fetched_messages = [message.name for message in response["messages"]] + fetched_messages
+
+		self.assertEqual(fetched_messages, all_messages)
+
+	def test_get_messages_from_cache(self):
+		"""
+		The latest messages should be served from the hot-tail cache after the first request
+		New messages pushed to the cache should show up on top, and invalidation should fall back to the database
+		"""
+		invalidate_tail(CHANNEL_ID)
+		self.assertIsNone(get_cached_messages(CHANNEL_ID, 20))
+
+		response = get_messages(CHANNEL_ID)
+		expected_messages = [message.name for message in response["messages"]]
+
+		cached_messages, has_old_messages = get_cached_messages(CHANNEL_ID, 20)
+		self.assertEqual([message.name for message in cached_messages], expected_messages)
+		self.assertEqual(has_old_messages, True)
+
+		response = get_messages(CHANNEL_ID)
+		self.assertEqual([message.name for message in response["messages"]], expected_messages)
+		self.assertEqual(response["has_old_messages"], True)
+
+		# A new message should be added to the top of the cached messages
+		new_message = frappe.get_doc(
+			{
+				"doctype": "Chatly Message",
+				"name": f"{CHANNEL_ID}-100",
+				"text": "Test Message 100",
+				"content": "Test Message 100",
+				"channel_id": CHANNEL_ID,
+				"message_type": "Text",
+				"seq": 101,
+				"creation": datetime.datetime.now(),
+			}
+		)
+		new_message.db_insert()
+		push_message(CHANNEL_ID, new_message.name)
+
+		response = get_messages(CHANNEL_ID)
+		self.assertEqual(
+			[message.name for message in response["messages"]],
+			[new_message.name] + expected_messages[:19],
+		)
+
+		# After invalidation, the messages are fetched from the database again
+		invalidate_tail(CHANNEL_ID)
+		self.assertIsNone(get_cached_messages(CHANNEL_ID, 20))
+		response = get_messages(CHANNEL_ID)
+		self.assertEqual(response["messages"][0].text, "Test Message 100")
+
+	def test_get_messages_not_modified(self):
+		"""
+		Chat Stream `get_messages` API with conditional requests
+		If the client sends the ETag of the latest response, it should get an empty 304 response until the channel changes
+		"""
+		invalidate_tail(CHANNEL_ID)
+		etag = make_etag("messages", CHANNEL_ID, get_tail_version(CHANNEL_ID), 20, False)
+
+		with patch("frappe.get_request_header", return_value=etag):
+			self.assertIsNone(get_messages(CHANNEL_ID))
+			self.assertEqual(frappe.local.response.pop("http_status_code"), 304)
+
+			# The channel changed, so the client's copy is stale
+			invalidate_tail(CHANNEL_ID)
+			response = get_messages(CHANNEL_ID)
+			self.assertEqual(len(response["messages"]), 20)
+			self.assertNotIn("http_status_code", frappe.local.response)
+
+	def test_get_messages_for_channels(self):
+		"""
+		Chat Stream `get_messages_for_channels` API
+		The API should return the same latest messages as `get_messages` for every channel the user can read
+		"""
+		invalidate_tail(CHANNEL_ID)
+		expected_messages = [message.name for message in get_messages(CHANNEL_ID)["messages"]]
+
+		for cached in (False, True):
+			if not cached:
+				invalidate_tail(CHANNEL_ID)
+
+			response = get_messages_for_channels(json.dumps([CHANNEL_ID, "does-not-exist"]))
+
+			# Channels that do not exist (or cannot be read) are left out
+			self.assertEqual(list(response["channels"]), [CHANNEL_ID])
+
+			page = response["channels"][CHANNEL_ID]
+			self.assertEqual([message.name for message in page["messages"]], expected_messages)
+			self.assertEqual(page["has_old_messages"], True)
+			self.assertEqual(page["has_new_messages"], False)
+
+	def test_get_channel_changes(self):
+		"""
+		Chat Stream `get_channel_changes` API
+		The API should return the latest state of every message that changed since the cursor
+		"""
+		version = get_channel_changes(CHANNEL_ID)["version"]
+
+		reactions = {"👍": {"count": 1, "users": ["Administrator"], "reaction": "👍"}}
+
+		record_message_change(CHANNEL_ID, f"{CHANNEL_ID}-99", "Edited")
+		record_message_change(CHANNEL_ID, f"{CHANNEL_ID}-98", "Reacted", json.dumps({}))
+		record_message_change(CHANNEL_ID, f"{CHANNEL_ID}-97", "Deleted")
+		record_message_change(CHANNEL_ID, f"{CHANNEL_ID}-98", "Reacted", json.dumps(reactions))
+		record_message_change(CHANNEL_ID, f"{CHANNEL_ID}-99", "Reacted", json.dumps(reactions))
+
+		response = get_channel_changes(CHANNEL_ID, since_version=version)
+
+		self.assertEqual(response["version"], version + 5)
+		self.assertEqual(response["reset"], False)
+		self.assertEqual(response["created"], [])
+		self.assertEqual(response["edited"], [f"{CHANNEL_ID}-99"])
+		self.assertEqual(response["deleted"], [f"{CHANNEL_ID}-97"])
+		# Only the latest reactions are returned, and not for messages whose details are returned
+		self.assertEqual(response["reactions"], {f"{CHANNEL_ID}-98": reactions})
+		self.assertEqual([message.name for message in response["messages"]], [f"{CHANNEL_ID}-99"])
+
+		# Nothing changed since the latest version
+		response = get_channel_changes(CHANNEL_ID, since_version=version + 5)
+		self.assertEqual(response["reset"], False)
+		self.assertEqual(response["edited"], [])
+		self.assertEqual(response["reactions"], {})
+
+		# If the changes after the cursor are no longer available, the client needs to reload the channel
+		frappe.db.delete("Chatly Message Change", {"channel_id": CHANNEL_ID, "version": version + 1})
+		response = get_channel_changes(CHANNEL_ID, since_version=version)
+		self.assertEqual(response["reset"], True)
+
+	def test_get_messages_compact(self):
+		"""
+		Chat Stream `get_messages` API with the compact wire format
+		The rows should have the same messages as the regular format, with owners and channels interned
+		"""
+		reactions = {"👍": {"count": 1, "users": ["Administrator"], "reaction": "👍"}}
+		frappe.db.set_value(
+			"Chatly Message", f"{CHANNEL_ID}-99", "message_reactions", json.dumps(reactions)
+		)
+		invalidate_tail(CHANNEL_ID)
+
+		expected_messages = get_messages(CHANNEL_ID)["messages"]
+		response = get_messages(CHANNEL_ID, compact=True)
+
+		self.assertEqual(response["has_old_messages"], True)
+		self.assertEqual(response["has_new_messages"], False)
+
+		packed = response["messages"]
+		columns = list(packed["columns"])
+		self.assertEqual(len(packed["rows"]), len(expected_messages))
+		self.assertEqual(packed["channels"], [CHANNEL_ID])
+		self.assertEqual(packed["owners"], [expected_messages[0].owner])
+
+		for row, message in zip(packed["rows"], expected_messages):
+			# Trailing nulls are dropped
+			self.assertLess(len(row), len(columns))
+			self.assertEqual(row[columns.index("name")], message.name)
+			self.assertEqual(row[columns.index("seq")], message.seq)
+			self.assertEqual(row[columns.index("text")], message.text)
+			self.assertEqual(row[columns.index("channel_id")], 0)
+			self.assertEqual(row[columns.index("owner")], 0)
+
+		# Reactions are sent parsed
+		self.assertEqual(packed["rows"][0][columns.index("message_reactions")], reactions)
+
+	def test_send_messages_in_bulk(self):
+		"""
+		Messages inserted in bulk should get consecutive sequence numbers (in the given order),
+		their content and a change feed entry - and show up in the latest messages of the channel
+		"""
+		# The test messages are inserted directly, so the channel counter has to be set
+		frappe.db.set_value("Chatly Channel Counter", CHANNEL_ID, "last_message_seq", 100)
+		version = get_channel_changes(CHANNEL_ID)["version"]
+
+		names = send_messages(
+			CHANNEL_ID,
+			json.dumps([{"text": f"<p>Bulk Message {i}</p>"} for i in range(3)] + [{"text": " "}]),
+		)
+
+		# Empty messages are skipped
+		self.assertEqual(len(names), 3)
+
+		messages = frappe.get_all(
+			"Chatly Message",
+			filters={"name": ("in", names)},
+			fields=["name", "seq", "content"],
+			order_by="seq asc",
+		)
+		self.assertEqual([message.name for message in messages], names)
+		self.assertEqual([message.seq for message in messages], [101, 102, 103])
+		self.assertEqual(messages[0].content, "Bulk Message 0")
+
+		response = get_channel_changes(CHANNEL_ID, since_version=version)
+		self.assertEqual(response["version"], version + 3)
+
+		invalidate_tail(CHANNEL_ID)
+		latest_messages = [message.name for message in get_messages(CHANNEL_ID)["messages"]]
+		self.assertEqual(latest_messages[:3], names[::-1])
+
+	def test_send_messages_in_bulk_sanitizes_html(self):
+		"""
+		Messages inserted in bulk should be sanitized the same way as messages inserted one at a time
+		"""
+		frappe.db.set_value("Chatly Channel Counter", CHANNEL_ID, "last_message_seq", 100)
+
+		names = send_messages(
+			CHANNEL_ID,
+			json.dumps(
+				[{"text": '<p>Hello<script>alert(1)</script><img src="x" onerror="alert(1)"></p>'}]
+			),
+		)
+
+		text = frappe.db.get_value("Chatly Message", names[0], "text")
+		self.assertIn("Hello", text)
+		self.assertNotIn("<script>", text)
+		self.assertNotIn("onerror", text)
+
+	def test_export_channel(self):
+		"""
+		The export of a channel should have the channel followed by all of its messages (oldest first)
+		"""
+		with patch("chatly.api.channel_export.EXPORT_BATCH_SIZE", 30):
+			lines = [json.loads(line) for line in iter_channel_lines(CHANNEL_ID)]
+
+		self.assertEqual(lines[0]["type"], "channel")
+		self.assertEqual(lines[0]["name"], CHANNEL_ID)
+
+		messages = lines[1:]
+		self.assertEqual([message["name"] for message in messages], get_all_message_names()[::-1])
+		self.assertEqual(messages[0]["text"], "Test Message 0")
+		self.assertEqual(messages[0]["reactions"], {})
+
+	def test_get_messages_with_dates(self):
+		"""
+		Pages of messages with dates should add up to the same blocks as a single larger page -
+		date headers and continuations are computed across page boundaries
+		"""
+
+		def get_blocks(**kwargs):
+			return [
+				(
+					block["block_type"],
+					block["data"]["name"] if block["block_type"] == "message" else block["data"],
+					block["data"]["is_continuation"] if block["block_type"] == "message" else None,
+				)
+				for block in get_messages_with_dates(CHANNEL_ID, **kwargs)
+			]
+
+		latest_page = get_blocks(limit=30)
+		self.assertEqual(latest_page[-1][1], f"{CHANNEL_ID}-99")
+
+		older_page = get_blocks(limit=30, before_message=latest_page[1][1])
+		self.assertEqual(older_page + latest_page, get_blocks(limit=60))
+
+		# The 49th and 50th messages are on the same day - so there is no date header between them
+		blocks = get_blocks(limit=60)
+		index = blocks.index(("message", f"{CHANNEL_ID}-49", 0))
+		self.assertEqual(blocks[index + 1][1], f"{CHANNEL_ID}-50")
+
+		# A page before a message that does not exist is not the latest page
+		with self.assertRaises(frappe.DoesNotExistError):
+			get_messages_with_dates(CHANNEL_ID, before_message="missing-message")
+
+	def test_accessible_channels_cache(self):
+		"""
+		Accessible channels should be cached per user until they are cleared
+		"""
+		clear_accessible_channels()
+		self.assertIn(CHANNEL_ID, get_accessible_channels())
+		self.assertIn(
+			CHANNEL_ID, frappe.cache().hget(ACCESSIBLE_CHANNELS_KEY, frappe.session.user)
+		)
+
+		clear_accessible_channels(frappe.session.user)
+		self.assertIsNone(frappe.cache().hget(ACCESSIBLE_CHANNELS_KEY, frappe.session.user))
+
+	def test_accessible_channels_of_owner(self):
+		"""
+		The owner of a Private channel without members can read it - same as `channel_has_permission`
+		"""
+		owner = "test-channel-owner@example.com"
+		channel = frappe.get_doc(
+			{"doctype": "Chatly Channel", "channel_name": "test-owner-channel", "type": "Private"}
+		).insert()
+		channel.db_set("owner", owner)
+
+		try:
+			self.assertTrue(channel_has_permission(channel, owner))
+			self.assertIn(channel.name, fetch_accessible_channels(owner))
+
+			frappe.get_doc(
+				{
+					"doctype": "Chatly Channel Member",
+					"channel_id": channel.name,
+					"user_id": "Administrator",
+				}
+			).db_insert()
+
+			self.assertFalse(channel_has_permission(channel, owner))
+			self.assertNotIn(channel.name, fetch_accessible_channels(owner))
+		finally:
+			frappe.delete_doc("Chatly Channel", channel.name, force=True)
+
+	def test_search_pagination(self):
+		"""
+		Pages of search results fetched with cursors should add up to all the results, without gaps or repeats
+		"""
+		names = []
+		cursor = None
+		while True:
+			page = get_search_result(
+				"Message", "Chatly Message", in_channel=CHANNEL_ID, page_length=30, cursor=cursor
+			)
+			names += [message.name for message in page["results"]]
+			cursor = page["next_cursor"]
+			if not cursor:
+				break
+
+		self.assertEqual(len(names), 100)
+		self.assertEqual(
+			names,
+			frappe.get_all(
+				"Chatly Message",
+				filters={"channel_id": CHANNEL_ID},
+				order_by="creation desc, name desc",
+				pluck="name",
+			),
+		)
@@ -0,0 +1,58 @@
+from frappe.tests.utils import FrappeTestCase
+
+from chatly.api.search import (
+	SNIPPET_CONTEXT,
+	SNIPPET_LENGTH,
+	get_search_result,
+	get_search_terms,
+	get_search_words,
+	get_snippet,
+)
+
+
+class TestSearch(FrappeTestCase):
+	def test_get_search_terms(self):
+		"""
+		Every word should be required and matched as a prefix - boolean mode operators are dropped,
+		and words that are too short for the full-text index are returned separately
+		"""
+		self.assertEqual(
+			get_search_terms('Deploy "the" server -now to QA'),
+			("+deploy* +the* +server* +now*", ["to", "qa"]),
+		)
+		self.assertEqual(get_search_terms("+++"), ("", []))
+
+	def test_get_snippet(self):
+		"""
+		The snippet should be cut at word boundaries around the match, with the offsets of the matched words
+		(in UTF-16 code units, like JavaScript strings)
+		"""
+		content = "word " * 40 + "🎉 we deployed it to qa " + "word " * 40
+		start = content.find("deployed") + 1 - SNIPPET_CONTEXT
+		window = content[start - 1 : start - 1 + SNIPPET_LENGTH]
+
+		result = get_snippet(window, start, len(content), get_search_words("deploy qa"))
+		snippet = result["snippet"]
+
+		self.assertTrue(snippet.startswith("… word"))
+		self.assertTrue(snippet.endswith("word …"))
+		self.assertLessEqual(len(snippet), SNIPPET_LENGTH + 4)
+
+		utf16 = snippet.encode("utf-16-le")
+		self.assertEqual(
+			[utf16[a * 2 : b * 2].decode("utf-16-le") for a, b in result["highlights"]],
+			["deployed", "qa"],
+		)
+
+		# The window is cut here if the database returned the whole content
+		self.assertEqual(get_snippet(content, 1, None, ["deployed"])["snippet"], snippet)
+
+	def test_search_channels_without_words(self):
+		"""
+		Searching channels for text without any words should return no results (instead of an error)
+		"""
+		for search_text in ["#", "--"]:
+			self.assertEqual(
+				get_search_result("Channel", "Chatly Channel", search_text),
+				{"results": [], "next_cursor": None},
+			)
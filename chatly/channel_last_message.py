@@ -0,0 +1,291 @@
+"""
+Last message of every channel, kept in Redis
+
+The channel list shows the last message (and its timestamp) of every channel. Writing it to the Chatly Channel row
+on every message makes concurrent senders in a busy channel wait on the row lock of the channel.
+Instead, the last message is written to a Redis hash (channel ID -> last message) and the channels that changed
+are written to the database in batches by a scheduled job.
+
+Readers should use `get_last_messages` (or `apply_last_messages`), which fall back to the database.
+"""
+
+import hashlib
+import json
+import threading
+import time
+
+import frappe
+from frappe.query_builder import Case
+from frappe.utils import get_datetime
+
+LAST_MESSAGE_KEY = "chatly:channel_last_message"
+# Channels whose last message has not been written to the database yet
+DIRTY_CHANNELS_KEY = "chatly:channel_last_message_dirty"
+
+# Number of channels written to the database in one UPDATE
+PERSIST_BATCH_SIZE = 500
+
+
+def set_last_message(channel_id: str, last_message_timestamp, last_message_details: str | None):
+	"""
+	Set the last message of a channel - written to the database by `persist_last_messages`
+	"""
+	cache = frappe.cache()
+
+	value = json.dumps(
+		{
+			"last_message_timestamp": str(last_message_timestamp) if last_message_timestamp else None,
+			"last_message_details": last_message_details,
+		}
+	)
+
+	pipeline = cache.pipeline()
+	pipeline.hset(cache.make_key(LAST_MESSAGE_KEY), channel_id, value)
+	pipeline.sadd(cache.make_key(DIRTY_CHANNELS_KEY), channel_id)
+	pipeline.execute()
+
+
+def get_last_messages(channel_ids: list) -> dict:
+	"""
+	Last messages of the given channels that are in Redis - channel ID -> {last_message_timestamp, last_message_details}
+
+	Channels that are not in Redis are not in the result - their last message is the one in the database.
+	"""
+	return {
+		channel_id: parse_last_message(value)
+		for channel_id, value in get_last_message_values(channel_ids).items()
+		if value
+	}
+
+
+def get_last_message_values(channel_ids: list) -> dict:
+	"""
+	Raw values of the last messages of the given channels in Redis - channel ID -> value (None if not in Redis)
+	"""
+	if not channel_ids:
+		return {}
+
+	cache = frappe.cache()
+	values = cache.pipeline().hmget(cache.make_key(LAST_MESSAGE_KEY), channel_ids).execute()[0]
+
+	return dict(zip(channel_ids, values))
+
+
+def parse_last_message(value) -> dict:
+	last_message = json.loads(value)
+	if last_message["last_message_timestamp"]:
+		last_message["last_message_timestamp"] = get_datetime(last_message["last_message_timestamp"])
+	return last_message
+
+
+def get_last_messages_digest(channel_ids: list) -> str:
+	"""
+	Digest of the last messages of the given channels that are in Redis - changes whenever any of them gets a new last message
+
+	Channels that are not in Redis still have the last message in the database, which only changes through Redis.
+	"""
+	if not channel_ids:
+		return ""
+
+	cache = frappe.cache()
+	values = cache.pipeline().hmget(cache.make_key(LAST_MESSAGE_KEY), channel_ids).execute()[0]
+
+	digest = hashlib.sha1()
+	for value in values:
+		digest.update(value or b"-")
+		digest.update(b"\0")
+
+	return digest.hexdigest()
+
+
+def get_last_message(channel_id: str) -> dict:
+	"""
+	Last message of a channel - {last_message_timestamp, last_message_details}
+	"""
+	last_message = get_last_messages([channel_id]).get(channel_id)
+	if last_message:
+		return last_message
+
+	return frappe.db.get_value(
+		"Chatly Channel",
+		channel_id,
+		["last_message_timestamp", "last_message_details"],
+		as_dict=True,
+	) or {"last_message_timestamp": None, "last_message_details": None}
+
+
+def apply_last_messages(channels: list) -> list:
+	"""
+	Replace the last message of the channels (fetched from the database) with the newer one from Redis,
+	and sort the channels by their last message (latest first)
+	"""
+	last_messages = get_last_messages([channel.name for channel in channels])
+
+	for channel in channels:
+		if last_message := last_messages.get(channel.name):
+			channel.update(last_message)
+
+	# Channels without messages go last
+	return sorted(
+		channels,
+		key=lambda channel: (
+			channel.last_message_timestamp is not None,
+			channel.last_message_timestamp or 0,
+		),
+		reverse=True,
+	)
+
+
+def delete_last_message(channel_id: str):
+	cache = frappe.cache()
+
+	pipeline = cache.pipeline()
+	pipeline.hdel(cache.make_key(LAST_MESSAGE_KEY), channel_id)
+	pipeline.srem(cache.make_key(DIRTY_CHANNELS_KEY), channel_id)
+	pipeline.execute()
+
+
+def persist_last_messages():
+	"""
+	Write the last messages of the channels that changed to the database - runs every minute
+
+	Channels are removed from the dirty set only after their batch is committed, so if writing a batch fails,
+	its channels are written in the next run.
+	"""
+	cache = frappe.cache()
+	dirty_channels_key = cache.make_key(DIRTY_CHANNELS_KEY)
+
+	while True:
+		channel_ids = cache.pipeline().srandmember(dirty_channels_key, PERSIST_BATCH_SIZE)
+		channel_ids = [channel_id.decode() for channel_id in channel_ids.execute()[0]]
+
+		if not channel_ids:
+			break
+
+		values = get_last_message_values(channel_ids)
+		last_messages = {
+			channel_id: parse_last_message(value) for channel_id, value in values.items() if value
+		}
+		if last_messages:
+			persist_batch(last_messages)
+			frappe.db.commit()  # nosemgrep
+
+		mark_channels_persisted(values)
+
+		if len(channel_ids) < PERSIST_BATCH_SIZE:
+			break
+
+
+def mark_channels_persisted(values: dict):
+	"""
+	Remove the channels from the dirty set - except the ones that got a new last message after
+	their values were read, which are written in the next batch (or run)
+	"""
+	cache = frappe.cache()
+
+	# Removing the channels and reading their last messages again is atomic, and `set_last_message`
+	# sets the last message and marks the channel dirty atomically - so no new last message is missed
+	pipeline = cache.pipeline()
+	pipeline.srem(cache.make_key(DIRTY_CHANNELS_KEY), *values)
+	pipeline.hmget(cache.make_key(LAST_MESSAGE_KEY), list(values))
+	current_values = pipeline.execute()[1]
+
+	changed_channels = [
+		channel_id
+		for channel_id, value in zip(values, current_values)
+		if value != values[channel_id]
+	]
+	if changed_channels:
+		cache.sadd(DIRTY_CHANNELS_KEY, *changed_channels)
+
+
+def persist_batch(last_messages: dict):
+	channel = frappe.qb.DocType("Chatly Channel")
+
+	last_message_timestamp = Case()
+	last_message_details = Case()
+	for channel_id, last_message in last_messages.items():
+		last_message_timestamp = last_message_timestamp.when(
+			channel.name == channel_id, last_message["last_message_timestamp"]
+		)
+		last_message_details = last_message_details.when(
+			channel.name == channel_id, last_message["last_message_details"]
+		)
+
+	(
+		frappe.qb.update(channel)
+		.set(channel.last_message_timestamp, last_message_timestamp)
+		.set(channel.last_message_details, last_message_details)
+		.where(channel.name.isin(list(last_messages)))
+		.run()
+	)
+
+
+def run_benchmark(channel_id: str, senders: int = 50, messages_per_sender: int = 20) -> dict:
+	"""
+	Measure the throughput and latency of sending messages to a single channel from many concurrent senders.
+	Each sender sends messages with `send_message` (and commits), like the API does.
+
+	The run is repeated with the old behaviour - writing the last message to the Chatly Channel row
+	in the same transaction - to compare the two.
+
+	Usage: bench --site <site> execute chatly.channel_last_message.run_benchmark --kwargs "{'channel_id': 'benchmark'}"
+	Use a scratch channel - the messages sent by the benchmark are not deleted.
+	"""
+	from chatly.api.chatly_message import send_message
+
+	frappe.only_for("System Manager")
+
+	site = frappe.local.site
+
+	def send(write_channel_row: bool):
+		send_message(channel_id, "<p>Benchmark message</p>", is_reply=0)
+
+		if write_channel_row:
+			frappe.db.set_value(
+				"Chatly Channel",
+				channel_id,
+				{
+					"last_message_timestamp": frappe.utils.now(),
+					"last_message_details": json.dumps({"content": "Benchmark message"}),
+				},
+				update_modified=False,
+			)
+
+		frappe.db.commit()  # nosemgrep
+
+	def measure(write_channel_row: bool) -> dict:
+		timings = []
+
+		def sender():
+			frappe.init(site=site)
+			frappe.connect()
+			try:
+				for _i in range(messages_per_sender):
+					start = time.monotonic()
+					send(write_channel_row)
+					timings.append((time.monotonic() - start) * 1000)
+			finally:
+				frappe.destroy()
+
+		threads = [threading.Thread(target=sender) for _i in range(senders)]
+		start = time.monotonic()
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		elapsed = time.monotonic() - start
+
+		timings.sort()
+		return {
+			"messages_per_second": round(len(timings) / elapsed, 2),
+			"p50_ms": round(timings[len(timings) // 2], 2),
+			"p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+		}
+
+	return {
+		"senders": senders,
+		"messages_per_sender": messages_per_sender,
+		"send_message": measure(write_channel_row=False),
+		"send_message_with_channel_row_write": measure(write_channel_row=True),
+	}
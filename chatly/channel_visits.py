@@ -0,0 +1,208 @@
+"""
+Write buffer for the last visits of users to channels
+
+The last visit of a user to a channel is updated every time they load the latest messages of the channel
+or send a message in it. Instead of updating Chatly Channel Member (and committing) on every request,
+the visit is recorded in a Redis hash per user (channel ID -> timestamp and last seen message sequence number),
+and a scheduled job writes the pending visits to the database in batches.
+
+Anything that reads `last_visit` or `last_seen_seq` should merge the pending visits of the user (see `get_pending_visits`).
+"""
+
+import json
+
+import frappe
+from frappe.query_builder import Case
+from frappe.query_builder.functions import Coalesce, Count
+from pypika import CustomFunction
+from redis.exceptions import ResponseError
+
+# Set of users who have visits that are not written to the database yet
+PENDING_USERS_KEY = "chatly:pending_visit_users"
+
+Greatest = CustomFunction("GREATEST", ["a", "b"])
+
+
+def get_pending_key(user: str) -> str:
+	return f"chatly:pending_visits:{user}"
+
+
+def get_flushing_key(user: str) -> str:
+	return f"chatly:flushing_visits:{user}"
+
+
+def record_visit(channel_id: str, user: str, last_seen_seq: int, timestamp: str | None = None):
+	"""
+	Record the visit of a user to a channel - written to the database by `flush_pending_visits`
+
+	`last_seen_seq` is the sequence number of the last message in the channel at the time of the visit
+	"""
+	cache = frappe.cache()
+
+	visit = json.dumps([timestamp or frappe.utils.now(), last_seen_seq])
+
+	pipeline = cache.pipeline()
+	pipeline.hset(cache.make_key(get_pending_key(user)), channel_id, visit)
+	pipeline.sadd(cache.make_key(PENDING_USERS_KEY), user)
+	pipeline.execute()
+
+
+def record_visit_if_newer(
+	channel_id: str, user: str, last_seen_seq: int, timestamp: str | None = None
+):
+	"""
+	Record the visit of a user to a channel, unless a pending visit of the user has already seen that message
+
+	Used for visits that are recorded late (like the visit of the sender of a message, recorded in a background job),
+	where the user may have visited the channel again in the meantime.
+	"""
+	cache = frappe.cache()
+	pending_key = cache.make_key(get_pending_key(user))
+	flushing_key = cache.make_key(get_flushing_key(user))
+
+	visit = json.dumps([timestamp or frappe.utils.now(), last_seen_seq])
+
+	def update(pipeline):
+		# Retried if a visit is recorded (or the visits are flushed) between the check and the update
+		pending_visits = [pipeline.hget(key, channel_id) for key in (pending_key, flushing_key)]
+		if any(visit and json.loads(visit)[1] >= last_seen_seq for visit in pending_visits):
+			return
+
+		pipeline.multi()
+		pipeline.hset(pending_key, channel_id, visit)
+		pipeline.sadd(cache.make_key(PENDING_USERS_KEY), user)
+
+	cache.transaction(update, pending_key, flushing_key)
+
+
+def get_pending_visits(user: str) -> dict:
+	"""
+	Visits of the user that are not in the database yet - channel ID -> (timestamp, last seen sequence number)
+	"""
+	cache = frappe.cache()
+
+	pipeline = cache.pipeline()
+	# Visits that are being written to the database right now are not committed yet either
+	pipeline.hgetall(cache.make_key(get_flushing_key(user)))
+	pipeline.hgetall(cache.make_key(get_pending_key(user)))
+	flushing, pending = pipeline.execute()
+
+	return decode_visits({**flushing, **pending})
+
+
+def get_pending_visits_to_channel(channel_id: str, users: list) -> dict:
+	"""
+	Visits of the given users to a channel that are not in the database yet - user -> (timestamp, last seen sequence number)
+	"""
+	cache = frappe.cache()
+
+	pipeline = cache.pipeline()
+	for user in users:
+		pipeline.hget(cache.make_key(get_flushing_key(user)), channel_id)
+		pipeline.hget(cache.make_key(get_pending_key(user)), channel_id)
+	results = pipeline.execute()
+
+	pending_visits = {}
+	for user, flushing, pending in zip(users, results[::2], results[1::2]):
+		if visit := pending or flushing:
+			pending_visits[user] = tuple(json.loads(visit))
+
+	return pending_visits
+
+
+def decode_visits(visits: dict) -> dict:
+	# The hashes are read with raw HGETALL (the cache wrapper expects pickled values), so keys and values are bytes
+	return {channel_id.decode(): tuple(json.loads(visit)) for channel_id, visit in visits.items()}
+
+
+def flush_pending_visits():
+	"""
+	Write the pending visits of all users to the database - runs every minute
+	"""
+	cache = frappe.cache()
+
+	for user in cache.smembers(PENDING_USERS_KEY):
+		flush_user_visits(user.decode())
+
+
+def flush_user_visits(user: str):
+	"""
+	Write the pending visits of a user to the database with a single UPDATE
+	"""
+	cache = frappe.cache()
+	flushing_key = cache.make_key(get_flushing_key(user))
+
+	# Remove the user from the set first - a visit recorded after this adds them back
+	cache.srem(PENDING_USERS_KEY, user)
+
+	try:
+		# Visits recorded from now on go to a new hash, and are written in the next run
+		if not cache.renamenx(cache.make_key(get_pending_key(user)), flushing_key):
+			# The previous run failed midway - write those visits first, and the pending ones in the next run
+			cache.sadd(PENDING_USERS_KEY, user)
+	except ResponseError:
+		# No pending visits
+		if not cache.exists(get_flushing_key(user)):
+			return
+
+	visits = decode_visits(cache.pipeline().hgetall(flushing_key).execute()[0])
+
+	if visits:
+		channel_member = frappe.qb.DocType("Chatly Channel Member")
+
+		last_visit = Case()
+		last_seen_seq = Case()
+		deleted_unread_count = Case()
+		for channel_id, (timestamp, seq) in visits.items():
+			# Visits recorded late (see `record_visit_if_newer`) never move the last seen message back
+			new_last_seen_seq = Greatest(channel_member.last_seen_seq, seq)
+
+			last_visit = last_visit.when(channel_member.channel_id == channel_id, timestamp)
+			last_seen_seq = last_seen_seq.when(channel_member.channel_id == channel_id, new_last_seen_seq)
+			deleted_unread_count = deleted_unread_count.when(
+				channel_member.channel_id == channel_id,
+				get_deleted_unread_count(channel_id, new_last_seen_seq),
+			)
+
+		(
+			frappe.qb.update(channel_member)
+			# Set before the last seen message - MariaDB uses the new value of a column in the assignments after it
+			.set(
+				channel_member.deleted_unread_count,
+				deleted_unread_count.else_(channel_member.deleted_unread_count),
+			)
+			.set(channel_member.last_visit, last_visit.else_(channel_member.last_visit))
+			.set(channel_member.last_seen_seq, last_seen_seq.else_(channel_member.last_seen_seq))
+			.where(channel_member.user_id == user)
+			.where(channel_member.channel_id.isin(list(visits)))
+			.run()
+		)
+
+		# Commit before dropping the visits from Redis, so that readers always see them in one of the two places
+		frappe.db.commit()  # nosemgrep
+
+	cache.delete(flushing_key)
+
+
+def get_deleted_unread_count(channel_id: str, last_seen_seq):
+	"""
+	Number of messages after the last seen message that were deleted - the messages after it that were sent,
+	minus the ones that are still there (a range scan on the (channel_id, seq) index).
+
+	Messages deleted while a visit was pending are only the deleted unread messages if they were sent after the visit,
+	so the counter is recalculated (instead of being reset) when the visit is written.
+	"""
+	counter = frappe.qb.DocType("Chatly Channel Counter")
+	message = frappe.qb.DocType("Chatly Message")
+
+	last_message_seq = (
+		frappe.qb.from_(counter).select(counter.last_message_seq).where(counter.name == channel_id)
+	)
+	remaining_messages = (
+		frappe.qb.from_(message)
+		.select(Count("*"))
+		.where(message.channel_id == channel_id)
+		.where(message.seq > last_seen_seq)
+	)
+
+	return Greatest(Coalesce(last_message_seq, 0) - last_seen_seq - remaining_messages, 0)
@@ -0,0 +1,115 @@
+# Copyright (c) 2026, The Commit Company and contributors
+# For license information, please see license.txt
+
+import re
+
+import frappe
+from frappe.model.document import Document
+
+# Tokens are stored up to this length - longer words are matched on their first characters
+MAX_TOKEN_LENGTH = 140
+
+
+class ChatlyNameToken(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		reference_doctype: DF.Literal["Chatly Channel", "Chatly User"]
+		reference_name: DF.DynamicLink
+		token: DF.Data
+	# end: auto-generated types
+
+	pass
+
+
+def get_name_tokens(name: str | None) -> list:
+	"""
+	Words of a name in lowercase - "Dev-Ops Team" has the tokens ["dev", "ops", "team"]
+	"""
+	words = re.findall(r"\w+", (name or "").lower())
+	return list(dict.fromkeys(word[:MAX_TOKEN_LENGTH] for word in words))
+
+
+def index_name(reference_doctype: str, reference_name: str, name: str | None):
+	"""
+	Replace the tokens of a channel or user with the words of its (new) name
+	"""
+	remove_name(reference_doctype, reference_name)
+
+	tokens = get_name_tokens(name)
+	if not tokens:
+		return
+
+	now = frappe.utils.now_datetime()
+	user = frappe.session.user
+
+	frappe.db.bulk_insert(
+		"Chatly Name Token",
+		[
+			"name",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+			"token",
+			"reference_doctype",
+			"reference_name",
+		],
+		[
+			[frappe.generate_hash(), now, now, user, user, token, reference_doctype, reference_name]
+			for token in tokens
+		],
+	)
+
+
+def remove_name(reference_doctype: str, reference_name: str):
+	frappe.db.delete(
+		"Chatly Name Token",
+		{"reference_doctype": reference_doctype, "reference_name": reference_name},
+	)
+
+
+def get_matching_names(reference_doctype: str, search_text: str):
+	"""
+	Subquery for the channels or users with a name that has a word starting with every word of the search text,
+	so "jo sm" matches "John Smith" and "Smith, Joanna". Every word is a range scan on the token index.
+
+	Returns None if the search text has no words.
+	"""
+	words = get_name_tokens(search_text)
+	if not words:
+		return None
+
+	name_token = frappe.qb.DocType("Chatly Name Token")
+
+	def match(word: str):
+		return (
+			frappe.qb.from_(name_token)
+			.select(name_token.reference_name)
+			.where(name_token.token.like(escape_like(word) + "%"))
+			.where(name_token.reference_doctype == reference_doctype)
+		)
+
+	query = match(words[0])
+	for word in words[1:]:
+		query = query.where(name_token.reference_name.isin(match(word)))
+
+	return query.distinct()
+
+
+def escape_like(text: str) -> str:
+	return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def on_doctype_update():
+	"""
+	Add indexes to Chatly Name Token table
+	"""
+	# Prefix matches on the token are range scans on this index
+	frappe.db.add_index("Chatly Name Token", ["token", "reference_doctype"])
+	frappe.db.add_index("Chatly Name Token", ["reference_doctype", "reference_name"])
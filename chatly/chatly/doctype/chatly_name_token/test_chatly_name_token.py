@@ -0,0 +1,47 @@
+# Copyright (c) 2026, The Commit Company and contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from chatly.api.search import get_typeahead_results
+from chatly.chatly.doctype.chatly_name_token.chatly_name_token import get_name_tokens
+
+CHANNEL_ID = "test-typeahead"
+
+
+class TestChatlyNameToken(FrappeTestCase):
+	def setUp(self):
+		frappe.get_doc(
+			{
+				"doctype": "Chatly Channel",
+				"name": CHANNEL_ID,
+				"channel_name": "Dev-Ops Team",
+				"type": "Public",
+			}
+		).insert()
+
+	def tearDown(self):
+		frappe.delete_doc("Chatly Channel", CHANNEL_ID)
+
+	def test_name_tokens(self):
+		self.assertEqual(get_name_tokens("Dev-Ops  team dev"), ["dev", "ops", "team"])
+		self.assertEqual(get_name_tokens(None), [])
+
+	def test_typeahead(self):
+		"""
+		Channels should be found by the start of every word, and the index should follow renames
+		"""
+
+		def get_channels(search_text):
+			return [channel.name for channel in get_typeahead_results(search_text)["channels"]]
+
+		self.assertIn(CHANNEL_ID, get_channels("te op"))
+		self.assertNotIn(CHANNEL_ID, get_channels("eam"))
+
+		channel = frappe.get_doc("Chatly Channel", CHANNEL_ID)
+		channel.channel_name = "Platform Team"
+		channel.save()
+
+		self.assertIn(CHANNEL_ID, get_channels("plat"))
+		self.assertNotIn(CHANNEL_ID, get_channels("dev"))
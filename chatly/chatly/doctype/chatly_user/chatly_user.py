@@ -5,6 +5,9 @@ import frappe
 from frappe import _
 from frappe.model.document import Document
 
+from chatly.chatly.doctype.chatly_name_token.chatly_name_token import index_name, remove_name
+from chatly.conditional_requests import USER_LIST_VERSION_KEY, bump_version_after_commit
+
 
 class ChatlyUser(Document):
 	# begin: auto-generated types
@@ -58,11 +61,15 @@ class ChatlyUser(Document):
 	def on_update(self):
 		self.invalidate_user_list_cache()
 
+		if self.has_value_changed("full_name"):
+			index_name(self.doctype, self.name, self.full_name)
+
 	def on_trash(self):
 		"""
 		Remove the Chatly User from all channels
 		"""
 		frappe.db.delete("Chatly Channel Member", {"user_id": self.user})
+		remove_name(self.doctype, self.name)
 
 	def after_delete(self):
 		"""
@@ -81,6 +88,10 @@ class ChatlyUser(Document):
 		from chatly.api.chatly_users import get_users
 
 		get_users.clear_cache()
+		# Clear it again after the commit, since a concurrent request could have cached the old list
+		# (which would then be served with the new ETag)
+		frappe.db.after_commit.add(get_users.clear_cache)
+		bump_version_after_commit(USER_LIST_VERSION_KEY)
 
 	def update_photo_from_user(self):
 		"""
@@ -4,6 +4,7 @@
 import frappe
 from frappe.model.document import Document
 
+from chatly.message_ingestion import insert_messages
 from chatly.utils import get_chatly_user
 
 
@@ -149,6 +150,33 @@ class ChatlyBot(Document):
 		doc.insert(ignore_permissions=True)
 		return doc.name
 
+	def send_messages(self, channel_id: str, messages: list) -> list:
+		"""
+		Send many text messages to a channel at once - faster than calling send_message for each message
+
+		channel_id: The channel_id of the channel to send the messages to
+		messages: List of messages - each one a dict with text, and optionally link_doctype and link_document
+
+		Push notifications are not sent for these messages.
+
+		Returns the message IDs of the messages sent (in the same order)
+		"""
+		return insert_messages(
+			[
+				{
+					"channel_id": channel_id,
+					"text": message.get("text"),
+					"message_type": "Text",
+					"is_bot_message": 1,
+					"bot": self.chatly_user,
+					"link_doctype": message.get("link_doctype"),
+					"link_document": message.get("link_document"),
+				}
+				for message in messages
+			],
+			ignore_permissions=True,
+		)
+
 	def create_direct_message_channel(self, user_id: str) -> str:
 		"""
 		Creates a direct message channel between the bot and a user
@@ -5,6 +5,15 @@ import frappe
 from frappe import _
 from frappe.model.document import Document
 
+from chatly.channel_last_message import delete_last_message
+from chatly.chatly.doctype.chatly_name_token.chatly_name_token import index_name, remove_name
+from chatly.chatly_channel_management.doctype.chatly_channel_counter.chatly_channel_counter import (
+	create_channel_counter,
+)
+from chatly.conditional_requests import CHANNEL_LIST_VERSION_KEY, bump_version_after_commit
+from chatly.message_cache import invalidate_tail_after_commit
+from chatly.permissions import clear_accessible_channels_after_commit
+
 
 class ChatlyChannel(Document):
 	# begin: auto-generated types
@@ -42,10 +51,32 @@ class ChatlyChannel(Document):
 
 		# delete all messages when channel is deleted
 		frappe.db.delete("Chatly Message", {"channel_id": self.name})
+		invalidate_tail_after_commit(self.name)
+		frappe.db.delete("Chatly Message Change", {"channel_id": self.name})
+		frappe.db.delete("Chatly Channel Counter", {"channel_id": self.name})
+		frappe.db.delete("Chatly Saved Message", {"channel_id": self.name})
+		frappe.db.delete("Chatly Message Attachment", {"channel_id": self.name})
+		remove_name(self.doctype, self.name)
 
 		# Delete the pinned channels
 		frappe.db.delete("Chatly Pinned Channels", {"channel_id": self.name})
 
+		delete_last_message(self.name)
+
+		bump_version_after_commit(CHANNEL_LIST_VERSION_KEY)
+		clear_accessible_channels_after_commit()
+
+	def on_update(self):
+		bump_version_after_commit(CHANNEL_LIST_VERSION_KEY)
+
+		# Open and Public channels can be read by everyone - a new channel (or a changed type) affects all users
+		if self.has_value_changed("type"):
+			clear_accessible_channels_after_commit()
+
+		# Direct message channels are named after their users, so they are found by the names of the users
+		if not self.is_direct_message and self.has_value_changed("channel_name"):
+			index_name(self.doctype, self.name, self.channel_name)
+
 	def after_insert(self):
 		"""
 		After inserting a channel, we need to check if it is a direct message channel or not.
@@ -57,6 +88,8 @@ class ChatlyChannel(Document):
 		For all other channels, we will add the current user as a member if it is not created by a bot.
 		If it is created by a bot, we will add the bot as a member.
 		"""
+		create_channel_counter(self.name)
+
 		# add current user as channel member
 		if not frappe.flags.in_test:
 
@@ -151,3 +184,4 @@ class ChatlyChannel(Document):
 	def autoname(self):
 		if self.is_direct_message == 0:
 			self.name = self.channel_name.strip().lower().replace(" ", "-")
+
@@ -1,9 +1,56 @@
 # Copyright (c) 2023, The Commit Company and contributors
 # See license.txt
 
-# import frappe
+from unittest.mock import patch
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from chatly.api.chatly_channel import get_channel_list_etag
+from chatly.channel_last_message import (
+	DIRTY_CHANNELS_KEY,
+	delete_last_message,
+	persist_last_messages,
+	set_last_message,
+)
+from chatly.conditional_requests import bump_version, get_membership_version_key
+
 
 class TestChatlyChannel(FrappeTestCase):
-	pass
+	def tearDown(self):
+		for channel_id in ["test-etag-member", "test-etag-other", "test-persist-failure"]:
+			delete_last_message(channel_id)
+
+	@patch("chatly.api.chatly_channel.get_accessible_channels", return_value=["test-etag-member"])
+	def test_channel_list_etag(self, _get_accessible_channels):
+		"""
+		The ETag of the channel list should only change for messages in the channels of the user
+		"""
+		etag = get_channel_list_etag()
+
+		# A message in a channel that the user cannot read
+		set_last_message("test-etag-other", frappe.utils.now(), '{"message_id": "other"}')
+		self.assertEqual(get_channel_list_etag(), etag)
+
+		# A message in a channel of the user
+		set_last_message("test-etag-member", frappe.utils.now(), '{"message_id": "member"}')
+		new_etag = get_channel_list_etag()
+		self.assertNotEqual(new_etag, etag)
+
+		# The user joined or left a channel
+		bump_version(get_membership_version_key(frappe.session.user))
+		self.assertNotEqual(get_channel_list_etag(), new_etag)
+
+	def test_persist_last_messages_failure(self):
+		"""
+		Channels should stay dirty if writing their last messages to the database fails
+		"""
+		set_last_message("test-persist-failure", frappe.utils.now(), '{"message_id": "failure"}')
+
+		with patch("chatly.channel_last_message.persist_batch", side_effect=frappe.QueryDeadlockError):
+			self.assertRaises(frappe.QueryDeadlockError, persist_last_messages)
+
+		self.assertTrue(frappe.cache().sismember(DIRTY_CHANNELS_KEY, "test-persist-failure"))
+
+		persist_last_messages()
+		self.assertFalse(frappe.cache().sismember(DIRTY_CHANNELS_KEY, "test-persist-failure"))
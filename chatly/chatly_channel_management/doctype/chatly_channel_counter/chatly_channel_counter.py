@@ -0,0 +1,64 @@
+# Copyright (c) 2026, The Commit Company and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+COUNTER_FIELDS = ["last_message_seq", "deleted_message_count", "change_version"]
+
+
+class ChatlyChannelCounter(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		change_version: DF.Int
+		channel_id: DF.Link
+		deleted_message_count: DF.Int
+		last_message_seq: DF.Int
+	# end: auto-generated types
+
+	pass
+
+
+def increment_channel_counters(channel_id: str, **increments: int) -> frappe._dict:
+	"""
+	Atomically increment counters of a channel with a single UPDATE and return the new values of all counters
+
+	The counters are kept in their own row (instead of the Chatly Channel row) so that the lock taken here
+	does not block anything else that reads or writes the channel. The lock is held till the transaction is committed,
+	so the values of a counter are always committed in the order in which they were assigned.
+	"""
+	counter = frappe.qb.DocType("Chatly Channel Counter")
+
+	query = frappe.qb.update(counter).where(counter.name == channel_id)
+	for fieldname, increment in increments.items():
+		query = query.set(counter[fieldname], counter[fieldname] + increment)
+	query.run()
+
+	counters = frappe.db.get_value("Chatly Channel Counter", channel_id, COUNTER_FIELDS, as_dict=True)
+	if counters is None:
+		# Channels created before the counters were moved to this table
+		create_channel_counter(channel_id)
+		return increment_channel_counters(channel_id, **increments)
+
+	return counters
+
+
+def get_channel_counters(channel_id: str) -> frappe._dict:
+	"""
+	Current values of the counters of a channel (all zero if nothing was sent in it yet)
+	"""
+	return frappe.db.get_value(
+		"Chatly Channel Counter", channel_id, COUNTER_FIELDS, as_dict=True
+	) or frappe._dict.fromkeys(COUNTER_FIELDS, 0)
+
+
+def create_channel_counter(channel_id: str, **values: int):
+	frappe.get_doc(
+		{"doctype": "Chatly Channel Counter", "name": channel_id, "channel_id": channel_id, **values}
+	).db_insert(ignore_if_duplicate=True)
@@ -0,0 +1,72 @@
+# Copyright (c) 2026, The Commit Company and contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from chatly.chatly_channel_management.doctype.chatly_channel_counter.chatly_channel_counter import (
+	get_channel_counters,
+	increment_channel_counters,
+)
+
+CHANNEL_ID = "test-channel-counter"
+
+
+class TestChatlyChannelCounter(FrappeTestCase):
+	def setUp(self):
+		frappe.get_doc(
+			{
+				"doctype": "Chatly Channel",
+				"name": CHANNEL_ID,
+				"channel_name": "Test Channel Counter",
+				"type": "Public",
+			}
+		).insert()
+
+	def tearDown(self):
+		frappe.delete_doc("Chatly Channel", CHANNEL_ID)
+
+	def test_message_counters(self):
+		"""
+		Sending and deleting messages should update the counters of the channel
+		"""
+		messages = [
+			frappe.get_doc(
+				{
+					"doctype": "Chatly Message",
+					"channel_id": CHANNEL_ID,
+					"text": f"Test Message {i}",
+					"message_type": "Text",
+				}
+			).insert()
+			for i in range(2)
+		]
+
+		self.assertEqual([message.seq for message in messages], [1, 2])
+		self.assertEqual(
+			frappe.get_all(
+				"Chatly Message Change",
+				filters={"channel_id": CHANNEL_ID},
+				order_by="version asc",
+				pluck="message_id",
+			),
+			[message.name for message in messages],
+		)
+
+		messages[0].delete()
+
+		counters = get_channel_counters(CHANNEL_ID)
+		self.assertEqual(counters.last_message_seq, 2)
+		self.assertEqual(counters.change_version, 3)
+		self.assertEqual(counters.deleted_message_count, 1)
+
+	def test_missing_counter(self):
+		"""
+		Counters of a channel without a counter row should start from zero
+		"""
+		frappe.db.delete("Chatly Channel Counter", {"channel_id": CHANNEL_ID})
+		self.assertEqual(get_channel_counters(CHANNEL_ID).last_message_seq, 0)
+
+		counters = increment_channel_counters(CHANNEL_ID, last_message_seq=3, change_version=3)
+		self.assertEqual(counters.last_message_seq, 3)
+		self.assertEqual(counters.change_version, 3)
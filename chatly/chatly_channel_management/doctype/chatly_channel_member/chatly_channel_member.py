@@ -4,8 +4,24 @@
 import frappe
 from frappe import _
 from frappe.model.document import Document
+from frappe.query_builder.functions import Count
 
+from chatly.chatly_channel_management.doctype.chatly_channel_counter.chatly_channel_counter import (
+	get_channel_counters,
+)
+from chatly.conditional_requests import bump_version_after_commit, get_membership_version_key
 from chatly.notification import subscribe_user_to_topic, unsubscribe_user_to_topic
+from chatly.permissions import clear_accessible_channels_after_commit
+
+# Channels with messages deleted since they were last reconciled (see `reconcile_unread_counts`)
+RECONCILE_CHANNELS_KEY = "chatly:reconcile_unread_channels"
+# Channel ID -> last member reconciled, for channels that could not be finished in one run
+RECONCILE_CURSORS_KEY = "chatly:reconcile_unread_cursor"
+
+# Number of members reconciled in one query (and transaction)
+RECONCILE_BATCH_SIZE = 500
+# Maximum number of members reconciled in one run - the rest are reconciled in the next runs
+RECONCILE_MAX_MEMBERS = 10000
 
 
 class ChatlyChannelMember(Document):
@@ -19,7 +35,9 @@ class ChatlyChannelMember(Document):
 
 		allow_notifications: DF.Check
 		channel_id: DF.Link
+		deleted_unread_count: DF.Int
 		is_admin: DF.Check
+		last_seen_seq: DF.Int
 		last_visit: DF.Datetime
 		user_id: DF.Link
 	# end: auto-generated types
@@ -39,7 +57,16 @@ class ChatlyChannelMember(Document):
 
 		self.allow_notifications = 1
 
+		# Messages sent before the member joined are not unread
+		if not self.last_seen_seq:
+			self.last_seen_seq = get_channel_counters(self.channel_id).last_message_seq or 0
+
 	def after_delete(self):
+		# The channel list of the user depends on the channels they are a member of
+		bump_version_after_commit(get_membership_version_key(self.user_id))
+		clear_accessible_channels_after_commit(self.user_id)
+		self.clear_owner_accessible_channels(member_count=0)
+
 		if (
 			frappe.db.count("Chatly Channel Member", {"channel_id": self.channel_id}) == 0
 			and frappe.db.get_value("Chatly Channel", self.channel_id, "type") == "Private"
@@ -105,10 +132,29 @@ class ChatlyChannelMember(Document):
 				is_member = False
 		return is_member
 
+	def clear_owner_accessible_channels(self, member_count: int):
+		"""
+		The owner of a Private channel can read it only while it has no members,
+		so their channel list changes when the first member joins or the last one leaves
+		"""
+		channel_members = frappe.db.count("Chatly Channel Member", {"channel_id": self.channel_id})
+		if channel_members != member_count:
+			return
+
+		channel_type, owner = frappe.db.get_value(
+			"Chatly Channel", self.channel_id, ["type", "owner"]
+		) or (None, None)
+		if channel_type == "Private" and owner != self.user_id:
+			clear_accessible_channels_after_commit(owner)
+
 	def after_insert(self):
 		"""
 		Subscribe the user to the topic if the channel is not a DM
 		"""
+		bump_version_after_commit(get_membership_version_key(self.user_id))
+		clear_accessible_channels_after_commit(self.user_id)
+		self.clear_owner_accessible_channels(member_count=1)
+
 		is_direct_message = frappe.db.get_value("Chatly Channel", self.channel_id, "is_direct_message")
 
 		if not is_direct_message and self.allow_notifications:
@@ -139,3 +185,165 @@ def on_doctype_update():
 	"""
 	# Index the selector (channel or message type) first for faster queries (less rows to sort in the next step)
 	frappe.db.add_index("Chatly Channel Member", ["channel_id", "user_id"])
+
+
+def get_unread_count(
+	last_message_seq: int,
+	deleted_message_count: int = 0,
+	channel_member: str | None = None,
+	last_seen_seq: int = 0,
+	deleted_unread_count: int = 0,
+	pending_visit: tuple | None = None,
+	channel_id: str | None = None,
+) -> int:
+	"""
+	Number of unread messages of a user in a channel, calculated from the counters of the channel and the member
+
+	Unread messages are the ones after the last visit of the member, minus the ones that were deleted since.
+	If the user is not a member (of an open channel), all messages in the channel are unread.
+	"""
+	if pending_visit and pending_visit[1] > (last_seen_seq or 0):
+		# The visit is not written to the database yet - see `chatly.channel_visits`
+		pending_seq = pending_visit[1]
+		if deleted_unread_count and pending_seq < (last_message_seq or 0) and channel_id:
+			# Some of the deleted messages may have been sent before the pending visit, so the counter
+			# cannot be used - count the messages after the visit instead (a range scan on (channel_id, seq))
+			unread_count = frappe.db.count(
+				"Chatly Message", {"channel_id": channel_id, "seq": (">", pending_seq)}
+			)
+		else:
+			unread_count = (last_message_seq or 0) - pending_seq
+	elif channel_member:
+		unread_count = (last_message_seq or 0) - (last_seen_seq or 0) - (deleted_unread_count or 0)
+	else:
+		unread_count = (last_message_seq or 0) - (deleted_message_count or 0)
+
+	return max(unread_count, 0)
+
+
+def record_deleted_message(channel_id: str, seq: int):
+	"""
+	Messages that are deleted before a member has seen them are not unread anymore
+
+	The deleted message count of the channel is incremented by the caller, along with its other counters
+	"""
+	if not seq:
+		return
+
+	channel_member = frappe.qb.DocType("Chatly Channel Member")
+	(
+		frappe.qb.update(channel_member)
+		.set(channel_member.deleted_unread_count, channel_member.deleted_unread_count + 1)
+		.where(channel_member.channel_id == channel_id)
+		.where(channel_member.last_seen_seq < seq)
+		.run()
+	)
+
+	frappe.cache().sadd(RECONCILE_CHANNELS_KEY, channel_id)
+
+
+def reconcile_unread_counts():
+	"""
+	Recalculate the deleted unread messages of members who have unread messages - runs every hour
+
+	The counters can drift when a message is deleted while the visit of a member is being written,
+	so we count the messages after the last visit of every member and correct the counter if needed.
+	Only channels with messages deleted since they were last reconciled are checked, and at most
+	`RECONCILE_MAX_MEMBERS` members are reconciled in one run.
+	"""
+	cache = frappe.cache()
+
+	remaining = RECONCILE_MAX_MEMBERS
+	for channel_id in cache.sscan_iter(cache.make_key(RECONCILE_CHANNELS_KEY)):
+		if remaining <= 0:
+			break
+
+		remaining -= reconcile_channel_unread_counts(channel_id.decode(), remaining)
+
+
+def reconcile_channel_unread_counts(channel_id: str, max_members: int) -> int:
+	"""
+	Reconcile the members of a channel who have unread messages in batches (ordered by name)
+	and return the number of members reconciled
+
+	If the channel is not finished, it is continued from the last member in the next run.
+	"""
+	cache = frappe.cache()
+	channel_member = frappe.qb.DocType("Chatly Channel Member")
+
+	# Messages deleted from now on mark the channel again
+	cache.srem(RECONCILE_CHANNELS_KEY, channel_id)
+	cursor = cache.hget(RECONCILE_CURSORS_KEY, channel_id)
+	last_message_seq = get_channel_counters(channel_id).last_message_seq
+
+	reconciled = 0
+	try:
+		while reconciled < max_members:
+			batch_size = min(RECONCILE_BATCH_SIZE, max_members - reconciled)
+
+			query = (
+				frappe.qb.from_(channel_member)
+				.select(
+					channel_member.name,
+					channel_member.last_seen_seq,
+					channel_member.deleted_unread_count,
+				)
+				.where(channel_member.channel_id == channel_id)
+				.where(channel_member.last_seen_seq < last_message_seq)
+				.orderby(channel_member.name)
+				.limit(batch_size)
+			)
+			if cursor:
+				query = query.where(channel_member.name > cursor)
+
+			members = query.run(as_dict=True)
+			reconcile_members(channel_id, last_message_seq, members)
+			frappe.db.commit()  # nosemgrep
+			reconciled += len(members)
+
+			if len(members) < batch_size:
+				cache.hdel(RECONCILE_CURSORS_KEY, channel_id)
+				return reconciled
+
+			cursor = members[-1].name
+	except Exception:
+		cache.sadd(RECONCILE_CHANNELS_KEY, channel_id)
+		raise
+
+	cache.hset(RECONCILE_CURSORS_KEY, channel_id, cursor)
+	cache.sadd(RECONCILE_CHANNELS_KEY, channel_id)
+	return reconciled
+
+
+def reconcile_members(channel_id: str, last_message_seq: int, members: list):
+	channel_member = frappe.qb.DocType("Chatly Channel Member")
+	message = frappe.qb.DocType("Chatly Message")
+
+	# Members of a channel often have the same last seen message - count the messages after it only once
+	unread_counts = {}
+
+	for member in members:
+		if member.last_seen_seq not in unread_counts:
+			# Messages sent after the counters were read are not counted
+			unread_counts[member.last_seen_seq] = (
+				frappe.qb.from_(message)
+				.select(Count("*"))
+				.where(message.channel_id == channel_id)
+				.where(message.seq > member.last_seen_seq)
+				.where(message.seq <= last_message_seq)
+				.run()[0][0]
+			)
+
+		deleted_unread_count = (
+			last_message_seq - member.last_seen_seq - unread_counts[member.last_seen_seq]
+		)
+
+		if deleted_unread_count != member.deleted_unread_count:
+			# Skip the member if they visited the channel in the meantime
+			(
+				frappe.qb.update(channel_member)
+				.set(channel_member.deleted_unread_count, deleted_unread_count)
+				.where(channel_member.name == member.name)
+				.where(channel_member.last_seen_seq == member.last_seen_seq)
+				.run()
+			)
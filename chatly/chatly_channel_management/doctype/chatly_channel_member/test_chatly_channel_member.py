@@ -1,9 +1,140 @@
 # Copyright (c) 2023, The Commit Company and contributors
 # See license.txt
 
-# import frappe
+from unittest.mock import patch
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from chatly.channel_visits import (
+	PENDING_USERS_KEY,
+	get_pending_key,
+	get_pending_visits,
+	record_visit,
+	record_visit_if_newer,
+)
+from chatly.chatly_channel_management.doctype.chatly_channel_member.chatly_channel_member import (
+	RECONCILE_CHANNELS_KEY,
+	RECONCILE_CURSORS_KEY,
+	get_unread_count,
+	reconcile_unread_counts,
+)
+
 
 class TestChatlyChannelMember(FrappeTestCase):
-	pass
+	def test_get_unread_count(self):
+		# Member who has seen 7 out of 10 messages, and 1 of the unread ones was deleted
+		self.assertEqual(
+			get_unread_count(10, 4, "member", last_seen_seq=7, deleted_unread_count=1), 2
+		)
+
+		# A pending visit takes precedence over the counters in the database
+		self.assertEqual(
+			get_unread_count(
+				10, 4, "member", last_seen_seq=7, deleted_unread_count=1, pending_visit=("", 9)
+			),
+			1,
+		)
+
+		# Deletions counted in the database apply if the pending visit has not seen any newer message
+		self.assertEqual(
+			get_unread_count(
+				10, 4, "member", last_seen_seq=9, deleted_unread_count=1, pending_visit=("", 9)
+			),
+			0,
+		)
+
+		# All messages in an open channel are unread for a user who is not a member
+		self.assertEqual(get_unread_count(10, 4), 6)
+
+		# Counters never go below 0
+		self.assertEqual(get_unread_count(10, 0, "member", last_seen_seq=10, deleted_unread_count=2), 0)
+
+	def test_record_visit_if_newer(self):
+		"""
+		A visit recorded late should not move the last seen message of a pending visit back
+		"""
+		user = "test-late-visit@example.com"
+		try:
+			record_visit("test-channel", user, 10)
+			record_visit_if_newer("test-channel", user, 5)
+			self.assertEqual(get_pending_visits(user)["test-channel"][1], 10)
+
+			record_visit_if_newer("test-channel", user, 12)
+			self.assertEqual(get_pending_visits(user)["test-channel"][1], 12)
+		finally:
+			frappe.cache().delete_value(get_pending_key(user))
+			frappe.cache().srem(PENDING_USERS_KEY, user)
+
+	@patch(
+		"chatly.chatly_channel_management.doctype.chatly_channel_member.chatly_channel_member.RECONCILE_MAX_MEMBERS",
+		2,
+	)
+	@patch(
+		"chatly.chatly_channel_management.doctype.chatly_channel_member.chatly_channel_member.RECONCILE_BATCH_SIZE",
+		1,
+	)
+	def test_reconcile_unread_counts(self):
+		"""
+		Members of channels with deleted messages should be reconciled in batches, continued in the next run
+		"""
+		channel_id = "test-reconcile-unread"
+		frappe.get_doc(
+			{
+				"doctype": "Chatly Channel",
+				"name": channel_id,
+				"channel_name": "Test Reconcile Unread",
+				"type": "Public",
+			}
+		).insert()
+
+		try:
+			for i in range(3):
+				frappe.get_doc(
+					{
+						"doctype": "Chatly Message",
+						"channel_id": channel_id,
+						"text": f"Test Message {i}",
+						"message_type": "Text",
+					}
+				).insert()
+
+			members = []
+			for i in range(3):
+				member = frappe.get_doc(
+					{
+						"doctype": "Chatly Channel Member",
+						"name": f"{channel_id}-member-{i}",
+						"channel_id": channel_id,
+						"user_id": f"test-reconcile-{i}@example.com",
+						"last_seen_seq": 0,
+						# Drifted counter - no message was deleted
+						"deleted_unread_count": 2,
+					}
+				)
+				member.db_insert()
+				members.append(member.name)
+
+			def get_deleted_unread_counts():
+				return [
+					frappe.db.get_value("Chatly Channel Member", name, "deleted_unread_count")
+					for name in members
+				]
+
+			# Channels without deleted messages are not reconciled
+			reconcile_unread_counts()
+			self.assertEqual(get_deleted_unread_counts(), [2, 2, 2])
+
+			frappe.cache().sadd(RECONCILE_CHANNELS_KEY, channel_id)
+			reconcile_unread_counts()
+			self.assertEqual(get_deleted_unread_counts(), [0, 0, 2])
+			self.assertTrue(frappe.cache().sismember(RECONCILE_CHANNELS_KEY, channel_id))
+
+			reconcile_unread_counts()
+			self.assertEqual(get_deleted_unread_counts(), [0, 0, 0])
+			self.assertFalse(frappe.cache().sismember(RECONCILE_CHANNELS_KEY, channel_id))
+		finally:
+			frappe.cache().srem(RECONCILE_CHANNELS_KEY, channel_id)
+			frappe.cache().hdel(RECONCILE_CURSORS_KEY, channel_id)
+			frappe.db.delete("Chatly Channel Member", {"channel_id": channel_id})
+			frappe.delete_doc("Chatly Channel", channel_id, force=True)
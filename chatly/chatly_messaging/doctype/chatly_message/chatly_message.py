@@ -2,15 +2,35 @@
 # For license information, please see license.txt
 import datetime
 import json
+from functools import partial
 
 import frappe
 from frappe import _
 from frappe.core.utils import html2text
 from frappe.model.document import Document
+from frappe.query_builder import Order
 from frappe.utils import get_datetime, get_system_timezone
 from pytz import timezone, utc
 
+from chatly.chatly_channel_management.doctype.chatly_channel_counter.chatly_channel_counter import (
+	increment_channel_counters,
+)
+from chatly.chatly_channel_management.doctype.chatly_channel_member.chatly_channel_member import (
+	record_deleted_message,
+)
+from chatly.chatly_messaging.doctype.chatly_message_attachment.chatly_message_attachment import (
+	index_message_attachments,
+)
+from chatly.chatly_messaging.doctype.chatly_message_change.chatly_message_change import (
+	record_message_change,
+)
+from chatly.channel_last_message import set_last_message
+from chatly.message_cache import invalidate_tail_after_commit, push_message_after_commit
 from chatly.notification import send_notification_to_topic, send_notification_to_user
+from chatly.unread_fanout import (
+	get_unread_counts_for_members,
+	schedule_unread_count_fanout_after_commit,
+)
 from chatly.utils import track_channel_visit
 
 
@@ -45,6 +65,7 @@ class ChatlyMessage(Document):
 		message_type: DF.Literal["Text", "Image", "File", "Poll"]
 		poll_id: DF.Link | None
 		replied_message_details: DF.JSON | None
+		seq: DF.Int
 		text: DF.LongText | None
 		thumbnail_height: DF.Data | None
 		thumbnail_width: DF.Data | None
@@ -95,6 +116,21 @@ class ChatlyMessage(Document):
 			frappe.throw(_("Poll ID is mandatory for a poll message"))
 
 	def before_insert(self):
+		self.set_seq()
+		self.set_replied_message_details()
+
+	def set_seq(self):
+		"""
+		Assign the next sequence number of the channel to the message.
+		Messages are paginated on (channel_id, seq) since it's a simple integer range scan.
+
+		The version of the change that creates the message is allocated in the same UPDATE of the channel counters.
+		"""
+		counters = increment_channel_counters(self.channel_id, last_message_seq=1, change_version=1)
+		self.seq = counters.last_message_seq
+		self.flags.change_version = counters.change_version
+
+	def set_replied_message_details(self):
 		"""
 		If the message is a reply, update the replied_message_details field
 		"""
@@ -115,33 +151,22 @@ class ChatlyMessage(Document):
 			}
 
 	def after_insert(self):
-		# TODO: Enqueue this
-		self.publish_unread_count_event()
-
-	def publish_unread_count_event(self):
-		frappe.db.set_value(
-			"Chatly Channel", self.channel_id, "last_message_timestamp", self.creation, update_modified=False
-		)
-		frappe.db.set_value(
-			"Chatly Channel",
-			self.channel_id,
-			"last_message_details",
-			json.dumps(
-				{
-					"message_id": self.name,
-					"content": self.content if self.message_type == "Text" else self.file,
-					"message_type": self.message_type,
-					"owner": self.owner,
-					"is_bot_message": self.is_bot_message,
-					"bot": self.bot,
-				}
-			),
+		push_message_after_commit(self.channel_id, self.name)
+		record_message_change(
+			self.channel_id, self.name, "Created", version=self.flags.change_version
 		)
 
+		# Channel metadata, unread counts, push notifications etc. are handled in a background job
+		enqueue_message_pipeline_after_commit(self.channel_id, self.name)
+
+	def publish_unread_count_event(self):
 		channel_doc = frappe.get_cached_doc("Chatly Channel", self.channel_id)
 		# If the message is a direct message, then we can only send it to one user
 		if channel_doc.is_direct_message:
 
+			# The event carries the new unread count, so that clients do not need to fetch it
+			unread_counts = get_unread_counts_for_members(self.channel_id)
+
 			if not channel_doc.is_self_message:
 
 				peer_chatly_user = frappe.db.get_value(
@@ -157,6 +182,7 @@ class ChatlyMessage(Document):
 						"channel_id": self.channel_id,
 						"play_sound": True,
 						"sent_by": self.owner,
+						"unread_count": unread_counts.get(peer_chatly_user),
 					},
 					user=peer_user_id,
 					after_commit=True,
@@ -169,22 +195,14 @@ class ChatlyMessage(Document):
 					"channel_id": self.channel_id,
 					"play_sound": False,
 					"sent_by": self.owner,
+					"unread_count": unread_counts.get(self.owner),
 				},
 				user=self.owner,
 				after_commit=True,
 			)
 		else:
-			# This event needs to be published to all users on Chatly (desk + website)
-			frappe.publish_realtime(
-				"chatly:unread_channel_count_updated",
-				{
-					"channel_id": self.channel_id,
-					"play_sound": False,
-					"sent_by": self.owner,
-				},
-				after_commit=True,
-				room="website",
-			)
+			# Publish the new unread count to every member of the channel (batched for bursts of messages)
+			schedule_unread_count_fanout_after_commit(self.channel_id)
 
 	def process_mentions(self):
 		if not self.json:
@@ -342,7 +360,13 @@ class ChatlyMessage(Document):
 			docname=self.channel_id,
 		)
 
-		self.publish_unread_count_event()
+		invalidate_tail_after_commit(self.channel_id)
+		counters = increment_channel_counters(self.channel_id, change_version=1, deleted_message_count=1)
+		record_message_change(self.channel_id, self.name, "Deleted", version=counters.change_version)
+		record_deleted_message(self.channel_id, self.seq)
+
+		# Update the last message of the channel and the unread counts of the members
+		enqueue_message_pipeline_after_commit(self.channel_id)
 
 		# delete poll if the message is of type poll after deleting the message
 		if self.message_type == "Poll":
@@ -370,6 +394,15 @@ class ChatlyMessage(Document):
 		# TEMP: this is a temp fix for the Desk interface
 		self.publish_deprecated_event_for_desk()
 
+		if self.file and self.has_value_changed("file"):
+			# The file is set after the message is inserted (when the upload is done)
+			index_message_attachments([self])
+
+		if not self.flags.in_insert:
+			# The message is already cached (if it's in the latest messages of the channel) - drop the stale copy
+			invalidate_tail_after_commit(self.channel_id)
+			record_message_change(self.channel_id, self.name, "Edited")
+
 		if self.is_edited:
 			frappe.publish_realtime(
 				"message_edited",
@@ -418,47 +451,154 @@ class ChatlyMessage(Document):
 					"channel_id": self.channel_id,
 					"sender": frappe.session.user,
 					"message_id": self.name,
-					"message_details": {
-						"text": self.text,
-						"content": self.content,
-						"file": self.file,
-						"message_type": self.message_type,
-						"is_edited": 1 if self.is_edited else 0,
-						"is_reply": self.is_reply,
-						"poll_id": self.poll_id,
-						"creation": self.creation,
-						"owner": self.owner,
-						"modified_by": self.modified_by,
-						"modified": self.modified,
-						"linked_message": self.linked_message,
-						"replied_message_details": self.replied_message_details,
-						"link_doctype": self.link_doctype,
-						"link_document": self.link_document,
-						"message_reactions": self.message_reactions,
-						"thumbnail_width": self.thumbnail_width,
-						"thumbnail_height": self.thumbnail_height,
-						"file_thumbnail": self.file_thumbnail,
-						"image_width": self.image_width,
-						"image_height": self.image_height,
-						"name": self.name,
-						"is_bot_message": self.is_bot_message,
-						"bot": self.bot,
-						"hide_link_preview": self.hide_link_preview,
-					},
+					"message_details": self.get_message_details(),
 				},
 				doctype="Chatly Channel",
 				# Adding this to automatically add the room for the event via Frappe
 				docname=self.channel_id,
 				after_commit=after_commit,
 			)
-			# track the visit of the user to the channel if a new message is created
-			frappe.enqueue(method=track_channel_visit, channel_id=self.channel_id, user=self.owner)
 
-			self.send_push_notification()
+	def get_message_details(self) -> dict:
+		"""
+		Details of a new message that are sent to the clients in realtime
+		"""
+		return {
+			"text": self.text,
+			"content": self.content,
+			"file": self.file,
+			"message_type": self.message_type,
+			"is_edited": 1 if self.is_edited else 0,
+			"is_reply": self.is_reply,
+			"poll_id": self.poll_id,
+			"creation": self.creation,
+			"owner": self.owner,
+			"modified_by": self.modified_by,
+			"modified": self.modified,
+			"linked_message": self.linked_message,
+			"replied_message_details": self.replied_message_details,
+			"link_doctype": self.link_doctype,
+			"link_document": self.link_document,
+			"message_reactions": self.message_reactions,
+			"thumbnail_width": self.thumbnail_width,
+			"thumbnail_height": self.thumbnail_height,
+			"file_thumbnail": self.file_thumbnail,
+			"image_width": self.image_width,
+			"image_height": self.image_height,
+			"name": self.name,
+			"is_bot_message": self.is_bot_message,
+			"bot": self.bot,
+			"hide_link_preview": self.hide_link_preview,
+		}
 
 	def on_trash(self):
 		# delete all the reactions for the message
 		frappe.db.delete("Chatly Message Reaction", {"message": self.name})
+		frappe.db.delete("Chatly Saved Message", {"message_id": self.name})
+		frappe.db.delete("Chatly Message Attachment", {"message_id": self.name})
+
+
+def get_last_message_stale_key(channel_id: str) -> str:
+	return f"chatly:channel_last_message_stale:{channel_id}"
+
+
+def enqueue_message_pipeline_after_commit(channel_id: str, message_id: str | None = None):
+	"""
+	Run the side effects of a new (or deleted) message in a background job once the transaction is committed
+	"""
+	frappe.db.after_commit.add(partial(enqueue_message_pipeline, channel_id, message_id))
+
+
+def enqueue_message_pipeline(channel_id: str, message_id: str | None = None):
+	# Mark the last message of the channel as stale before the job is enqueued - see `update_channel_last_message`
+	cache = frappe.cache()
+	cache.set(cache.make_key(get_last_message_stale_key(channel_id)), 1)
+
+	frappe.enqueue(run_message_pipeline, queue="short", channel_id=channel_id, message_id=message_id)
+
+
+def run_message_pipeline(channel_id: str, message_id: str | None = None):
+	"""
+	Side effects of sending a message - runs in a background job (one per message):
+	1. Update the last message of the channel (merged across messages sent in a burst)
+	2. Track the visit of the sender to the channel
+	3. Publish the new unread counts to the members of the channel
+	4. Send push notifications
+
+	If `message_id` is not set (the message was deleted), only the channel and unread counts are updated.
+	"""
+	update_channel_last_message(channel_id)
+
+	if not message_id or not frappe.db.exists("Chatly Message", message_id):
+		schedule_unread_count_fanout_after_commit(channel_id)
+		return
+
+	message = frappe.get_doc("Chatly Message", message_id)
+
+	# The sender has seen the channel till their message - not the messages sent after it, while this job was queued
+	track_channel_visit(channel_id=channel_id, user=message.owner, last_seen_seq=message.seq)
+	message.publish_unread_count_event()
+
+	# File messages without a file were never published to the channel
+	if message.message_type in ("File", "Image") and not message.file:
+		return
+
+	message.send_push_notification()
+
+
+def update_channel_last_message(channel_id: str):
+	"""
+	Set the last message details of the channel from the latest message in it (see `chatly.channel_last_message`)
+
+	Every message marks the last message of its channel as stale. The first job that picks up the mark
+	writes the latest message - so for a burst of messages, the channel is only updated once or twice.
+	"""
+	cache = frappe.cache()
+	if not cache.delete(cache.make_key(get_last_message_stale_key(channel_id))):
+		# Another job has already written the latest message
+		return
+
+	message = frappe.qb.DocType("Chatly Message")
+	last_message = (
+		frappe.qb.from_(message)
+		.select(
+			message.name,
+			message.creation,
+			message.content,
+			message.file,
+			message.message_type,
+			message.owner,
+			message.is_bot_message,
+			message.bot,
+		)
+		.where(message.channel_id == channel_id)
+		.orderby(message.seq, order=Order.desc)
+		.limit(1)
+		.run(as_dict=True)
+	)
+
+	if last_message:
+		last_message = last_message[0]
+		content = last_message.content if last_message.message_type == "Text" else last_message.file
+
+		last_message_timestamp = last_message.creation
+		last_message_details = json.dumps(
+			{
+				"message_id": last_message.name,
+				"content": content,
+				"message_type": last_message.message_type,
+				"owner": last_message.owner,
+				"is_bot_message": last_message.is_bot_message,
+				"bot": last_message.bot,
+			}
+		)
+	else:
+		last_message_timestamp = None
+		last_message_details = None
+
+	# Written to Redis (instead of the channel row) - the channel list is read far more often than it changes.
+	# The ETag of the channel list is derived from these values, so there is no version to bump here.
+	set_last_message(channel_id, last_message_timestamp, last_message_details)
 
 
 def on_doctype_update():
@@ -467,7 +607,26 @@ def on_doctype_update():
 	"""
 	# Index the selector (channel or message type) first for faster queries (less rows to sort in the next step)
 	frappe.db.add_index("Chatly Message", ["channel_id", "creation"])
+	frappe.db.add_index("Chatly Message", ["channel_id", "seq"])
 	frappe.db.add_index("Chatly Message", ["message_type", "creation"])
+	add_content_fulltext_index()
+
+
+# Full-text index on the content of messages, used by message search (see `chatly.api.search`)
+CONTENT_FULLTEXT_INDEX = "content_fulltext"
+
+
+def add_content_fulltext_index():
+	# FULLTEXT indexes are only supported on MariaDB - search falls back to LIKE on other databases
+	if frappe.db.db_type != "mariadb":
+		return
+
+	if frappe.db.has_index("tabChatly Message", CONTENT_FULLTEXT_INDEX):
+		return
+
+	frappe.db.sql_ddl(
+		f"ALTER TABLE `tabChatly Message` ADD FULLTEXT INDEX `{CONTENT_FULLTEXT_INDEX}` (`content`)"
+	)
 
 
 def get_milliseconds_since_epoch(timestamp: str) -> str:
@@ -0,0 +1,181 @@
+# Copyright (c) 2026, The Commit Company and contributors
+# For license information, please see license.txt
+
+import os
+
+import frappe
+from frappe.model.document import Document
+
+# Extensions (lowercase) of the categories that files can be browsed and searched by
+FILE_CATEGORIES = {
+	"image": ["jpg", "jpeg", "png", "gif", "webp", "svg", "bmp", "heic"],
+	"pdf": ["pdf"],
+	"doc": [
+		"doc",
+		"docx",
+		"odt",
+		"ott",
+		"rtf",
+		"txt",
+		"dot",
+		"dotx",
+		"docm",
+		"dotm",
+		"pages",
+	],
+	"ppt": [
+		"ppt",
+		"pptx",
+		"odp",
+		"otp",
+		"pps",
+		"ppsx",
+		"pot",
+		"potx",
+		"pptm",
+		"ppsm",
+		"potm",
+		"ppam",
+		"ppa",
+		"key",
+	],
+	"xls": [
+		"xls",
+		"xlsx",
+		"csv",
+		"ods",
+		"ots",
+		"xlsb",
+		"xlsm",
+		"xlt",
+		"xltx",
+		"xltm",
+		"xlam",
+		"xla",
+		"numbers",
+	],
+}
+
+EXTENSION_CATEGORIES = {
+	extension: category for category, extensions in FILE_CATEGORIES.items() for extension in extensions
+}
+
+
+class ChatlyMessageAttachment(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		channel_id: DF.Link
+		file: DF.Link | None
+		file_category: DF.Literal["image", "pdf", "doc", "ppt", "xls", "other"]
+		file_extension: DF.Data | None
+		file_name: DF.Data | None
+		file_size: DF.Int
+		file_url: DF.SmallText | None
+		message_id: DF.Link
+		message_type: DF.Literal["File", "Image"]
+	# end: auto-generated types
+
+	pass
+
+
+def get_file_extension(file_name: str) -> str:
+	return os.path.splitext(file_name or "")[1].lstrip(".").lower()
+
+
+def get_file_category(extension: str, message_type: str | None = None) -> str:
+	if message_type == "Image":
+		return "image"
+	return EXTENSION_CATEGORIES.get(extension, "other")
+
+
+def index_message_attachments(messages: list):
+	"""
+	Add the files of messages to the attachment catalogue (or update them, if the file of a message changed)
+
+	messages: Chatly Messages (documents or dicts) with name, channel_id, owner, creation, message_type and file
+	"""
+	messages = [
+		message
+		for message in messages
+		if message.get("file") and message.get("message_type") in ("File", "Image")
+	]
+	if not messages:
+		return
+
+	message_ids = [message.get("name") for message in messages]
+
+	# Imported messages can refer to a file by URL without a File document
+	files = {
+		(file.attached_to_name, file.file_url): file
+		for file in frappe.get_all(
+			"File",
+			filters={"attached_to_doctype": "Chatly Message", "attached_to_name": ("in", message_ids)},
+			fields=["name", "file_name", "file_url", "file_size", "attached_to_name"],
+		)
+	}
+
+	now = frappe.utils.now_datetime()
+	user = frappe.session.user
+
+	values = []
+	for message in messages:
+		file = files.get((message.get("name"), message.get("file"))) or frappe._dict()
+		file_name = file.file_name or message.get("file").rsplit("/", 1)[-1]
+		extension = get_file_extension(file_name)
+
+		values.append(
+			[
+				message.get("name"),
+				# The catalogue is sorted like the messages
+				message.get("creation"),
+				now,
+				message.get("owner"),
+				user,
+				message.get("channel_id"),
+				message.get("name"),
+				message.get("message_type"),
+				file.name,
+				file_name,
+				message.get("file"),
+				extension,
+				get_file_category(extension, message.get("message_type")),
+				file.file_size or 0,
+			]
+		)
+
+	frappe.db.delete("Chatly Message Attachment", {"name": ("in", message_ids)})
+	frappe.db.bulk_insert(
+		"Chatly Message Attachment",
+		[
+			"name",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+			"channel_id",
+			"message_id",
+			"message_type",
+			"file",
+			"file_name",
+			"file_url",
+			"file_extension",
+			"file_category",
+			"file_size",
+		],
+		values,
+	)
+
+
+def on_doctype_update():
+	"""
+	Add indexes to Chatly Message Attachment table
+	"""
+	# Files of a channel (latest first), and files of a category in a channel
+	frappe.db.add_index("Chatly Message Attachment", ["channel_id", "creation"])
+	frappe.db.add_index("Chatly Message Attachment", ["channel_id", "file_category", "creation"])
@@ -0,0 +1,61 @@
+# Copyright (c) 2026, The Commit Company and contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from chatly.api.chatly_message import get_all_files_shared_in_channel
+from chatly.chatly_messaging.doctype.chatly_message_attachment.chatly_message_attachment import (
+	get_file_category,
+	get_file_extension,
+)
+
+CHANNEL_ID = "test-attachments"
+
+
+class TestChatlyMessageAttachment(FrappeTestCase):
+	def setUp(self):
+		frappe.get_doc(
+			{
+				"doctype": "Chatly Channel",
+				"name": CHANNEL_ID,
+				"channel_name": "Test Attachments",
+				"type": "Public",
+			}
+		).insert()
+
+	def tearDown(self):
+		frappe.delete_doc("Chatly Channel", CHANNEL_ID)
+
+	def test_file_category(self):
+		self.assertEqual(get_file_extension("Report.Final.PDF"), "pdf")
+		self.assertEqual(get_file_extension("README"), "")
+		self.assertEqual(get_file_category("xlsx"), "xls")
+		self.assertEqual(get_file_category("zip"), "other")
+		self.assertEqual(get_file_category("tiff", "Image"), "image")
+
+	def test_files_in_channel(self):
+		"""
+		Files of messages should be listed from the catalogue, and filtered by their category
+		"""
+		for i, file_url in enumerate(["/files/budget.xlsx", "/files/notes.docx", "/files/plan.XLS"]):
+			frappe.get_doc(
+				{
+					"doctype": "Chatly Message",
+					"channel_id": CHANNEL_ID,
+					"message_type": "File",
+					"file": file_url,
+					"creation": frappe.utils.add_to_date(None, minutes=i),
+				}
+			).insert()
+
+		files = get_all_files_shared_in_channel(CHANNEL_ID, file_type="xls")["files"]
+		self.assertEqual([file.file_name for file in files], ["plan.XLS", "budget.xlsx"])
+		self.assertEqual(files[0].file_type, "xls")
+
+		first_page = get_all_files_shared_in_channel(CHANNEL_ID, page_length=2)
+		second_page = get_all_files_shared_in_channel(
+			CHANNEL_ID, page_length=2, cursor=first_page["next_cursor"]
+		)
+		self.assertEqual([file.file_name for file in second_page["files"]], ["budget.xlsx"])
+		self.assertIsNone(second_page["next_cursor"])
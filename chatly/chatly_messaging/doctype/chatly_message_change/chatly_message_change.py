@@ -0,0 +1,134 @@
+# Copyright (c) 2026, The Commit Company and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, now_datetime
+
+from chatly.chatly_channel_management.doctype.chatly_channel_counter.chatly_channel_counter import (
+	increment_channel_counters,
+)
+
+# Number of days for which changes are kept. Clients with an older cursor need to reload the channel.
+CHANGE_RETENTION_DAYS = 30
+
+
+class ChatlyMessageChange(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		change_type: DF.Literal["Created", "Edited", "Deleted", "Reacted"]
+		channel_id: DF.Link
+		message_id: DF.Data
+		message_reactions: DF.JSON | None
+		version: DF.Int
+	# end: auto-generated types
+
+	pass
+
+
+def record_message_change(
+	channel_id: str,
+	message_id: str,
+	change_type: str,
+	message_reactions: str | None = None,
+	version: int | None = None,
+) -> int:
+	"""
+	Record a change to a message in the change feed of the channel
+
+	`version` is passed if it was already allocated along with other counters of the channel (see `set_seq`)
+
+	Returns the new version of the channel
+	"""
+	# The version is incremented with a lock on the counters of the channel,
+	# so a client syncing changes never skips over a change that is committed later.
+	if version is None:
+		version = increment_channel_counters(channel_id, change_version=1).change_version
+
+	frappe.get_doc(
+		{
+			"doctype": "Chatly Message Change",
+			"channel_id": channel_id,
+			"version": version,
+			"message_id": message_id,
+			"change_type": change_type,
+			"message_reactions": message_reactions,
+		}
+	).db_insert()
+
+	return version
+
+
+def record_message_changes(
+	channel_id: str, message_ids: list, change_type: str, last_version: int | None = None
+) -> int:
+	"""
+	Record the same change to many messages of a channel with a single INSERT (used for bulk inserts)
+
+	`last_version` is passed if the versions were already allocated along with other counters of the channel
+
+	Returns the new version of the channel
+	"""
+	if last_version is None:
+		last_version = increment_channel_counters(
+			channel_id, change_version=len(message_ids)
+		).change_version
+	first_version = last_version - len(message_ids) + 1
+
+	now = now_datetime()
+	user = frappe.session.user
+
+	frappe.db.bulk_insert(
+		"Chatly Message Change",
+		[
+			"name",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+			"channel_id",
+			"version",
+			"message_id",
+			"change_type",
+		],
+		[
+			[
+				frappe.generate_hash(),
+				now,
+				now,
+				user,
+				user,
+				channel_id,
+				first_version + i,
+				message_id,
+				change_type,
+			]
+			for i, message_id in enumerate(message_ids)
+		],
+	)
+
+	return last_version
+
+
+def delete_old_changes():
+	"""
+	Delete changes older than the retention period (runs daily)
+	"""
+	frappe.db.delete(
+		"Chatly Message Change",
+		{"creation": ("<", add_days(now_datetime(), -CHANGE_RETENTION_DAYS))},
+	)
+
+
+def on_doctype_update():
+	"""
+	Add indexes to Chatly Message Change table
+	"""
+	frappe.db.add_index("Chatly Message Change", ["channel_id", "version"])
+	frappe.db.add_index("Chatly Message Change", ["creation"])
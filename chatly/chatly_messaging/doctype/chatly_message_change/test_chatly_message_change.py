@@ -0,0 +1,9 @@
+# Copyright (c) 2026, The Commit Company and contributors
+# See license.txt
+
+# import frappe
+from frappe.tests.utils import FrappeTestCase
+
+
+class TestChatlyMessageChange(FrappeTestCase):
+	pass
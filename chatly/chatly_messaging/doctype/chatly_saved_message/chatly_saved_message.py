@@ -0,0 +1,72 @@
+# Copyright (c) 2026, The Commit Company and contributors
+# For license information, please see license.txt
+
+import json
+
+import frappe
+from frappe.model.document import Document
+
+
+class ChatlySavedMessage(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		channel_id: DF.Link
+		message_id: DF.Link
+		user: DF.Link
+	# end: auto-generated types
+
+	pass
+
+
+def save_message(message_id: str, user: str, add: bool = True) -> list:
+	"""
+	Add (or remove) a bookmark of a user on a message
+
+	The users who saved a message are also kept in `_liked_by` of the message, so that the chat stream can show
+	whether a message is saved without a lookup per message. Returns the updated list of those users.
+	"""
+	message = frappe.db.get_value(
+		"Chatly Message", message_id, ["channel_id", "_liked_by"], as_dict=True, for_update=True
+	)
+	liked_by = json.loads(message._liked_by or "[]")
+
+	if add:
+		if not frappe.db.exists("Chatly Saved Message", {"user": user, "message_id": message_id}):
+			frappe.get_doc(
+				{
+					"doctype": "Chatly Saved Message",
+					"user": user,
+					"message_id": message_id,
+					"channel_id": message.channel_id,
+				}
+			).db_insert()
+		if user not in liked_by:
+			liked_by.append(user)
+	else:
+		frappe.db.delete("Chatly Saved Message", {"user": user, "message_id": message_id})
+		if user in liked_by:
+			liked_by.remove(user)
+
+	frappe.db.set_value(
+		"Chatly Message", message_id, "_liked_by", json.dumps(liked_by), update_modified=False
+	)
+
+	return liked_by
+
+
+def on_doctype_update():
+	"""
+	Add indexes to Chatly Saved Message table
+	"""
+	# The saved messages of a user (latest first) are a range scan on this index
+	frappe.db.add_index("Chatly Saved Message", ["user", "creation"])
+	frappe.db.add_unique(
+		"Chatly Saved Message", ["user", "message_id"], constraint_name="unique_user_message"
+	)
+	frappe.db.add_index("Chatly Saved Message", ["message_id"])
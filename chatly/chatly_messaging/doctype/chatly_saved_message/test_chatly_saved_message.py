@@ -0,0 +1,69 @@
+# Copyright (c) 2026, The Commit Company and contributors
+# See license.txt
+
+import json
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from chatly.api.chatly_message import get_saved_messages, save_message
+
+CHANNEL_ID = "test-saved-messages"
+
+
+class TestChatlySavedMessage(FrappeTestCase):
+	def setUp(self):
+		frappe.get_doc(
+			{
+				"doctype": "Chatly Channel",
+				"name": CHANNEL_ID,
+				"channel_name": "Test Saved Messages",
+				"type": "Public",
+			}
+		).insert()
+
+		for i in range(5):
+			frappe.get_doc(
+				{
+					"doctype": "Chatly Message",
+					"name": f"{CHANNEL_ID}-{i}",
+					"text": f"Test Message {i}",
+					"channel_id": CHANNEL_ID,
+					"message_type": "Text",
+				}
+			).db_insert()
+
+	def tearDown(self):
+		frappe.delete_doc("Chatly Channel", CHANNEL_ID)
+
+	def test_save_message(self):
+		"""
+		Saved messages should be listed (most recently saved first) until they are unsaved
+		"""
+		save_message(f"{CHANNEL_ID}-1", add="Yes")
+		frappe.db.set_value(
+			"Chatly Saved Message",
+			{"message_id": f"{CHANNEL_ID}-1"},
+			"creation",
+			frappe.utils.add_to_date(None, minutes=-1),
+		)
+		save_message(f"{CHANNEL_ID}-3", add="Yes")
+		# Saving again should not create another bookmark
+		save_message(f"{CHANNEL_ID}-3", add="Yes")
+
+		first_page = get_saved_messages(page_length=1)
+		second_page = get_saved_messages(page_length=1, cursor=first_page["next_cursor"])
+		self.assertEqual(first_page["messages"][0].name, f"{CHANNEL_ID}-3")
+		self.assertEqual(second_page["messages"][0].name, f"{CHANNEL_ID}-1")
+		self.assertIsNone(second_page["next_cursor"])
+
+		self.assertEqual(
+			json.loads(frappe.db.get_value("Chatly Message", f"{CHANNEL_ID}-3", "_liked_by")),
+			[frappe.session.user],
+		)
+
+		save_message(f"{CHANNEL_ID}-3", add="No")
+		self.assertEqual(
+			[message.name for message in get_saved_messages()["messages"]], [f"{CHANNEL_ID}-1"]
+		)
+		self.assertEqual(frappe.db.get_value("Chatly Message", f"{CHANNEL_ID}-3", "_liked_by"), "[]")
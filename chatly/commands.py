@@ -0,0 +1,37 @@
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("chatly-import-slack")
+@click.argument("path", type=click.Path(exists=True))
+@pass_context
+def import_slack(context, path):
+	"""
+	Import the channel history of a Slack export (a directory or a zip file) into Chatly.
+
+	Run it again to continue an interrupted import from its last checkpoint.
+	"""
+	import frappe
+
+	from chatly.slack_import import import_slack_export
+
+	def show_progress(stats):
+		click.echo(
+			f"Imported {stats['messages']} messages ({stats['messages_per_second']} messages/sec)"
+		)
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		stats = import_slack_export(path, progress=show_progress)
+	finally:
+		frappe.destroy()
+
+	click.secho(
+		f"Imported {stats['messages']} messages in {stats['channels']} channels"
+		f" ({stats['messages_per_second']} messages/sec)",
+		fg="green",
+	)
+
+
+commands = [import_slack]
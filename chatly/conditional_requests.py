@@ -0,0 +1,101 @@
+"""
+Conditional requests (ETag / If-None-Match) for read APIs that clients poll often
+
+Each API computes an ETag from version counters kept in Redis - so checking if the client's copy is stale
+does not need the database. If the client already has the latest response, it gets an empty 304 response.
+
+Version counters start from the current time in milliseconds (instead of 0) when the key does not exist,
+so an expired or flushed counter never hands out a version that was used before.
+"""
+
+import hashlib
+import time
+from functools import partial
+
+import frappe
+
+# Version of the channel list - bumped whenever a channel is created, changed or deleted
+CHANNEL_LIST_VERSION_KEY = "chatly:channel_list_version"
+# Version of the channels of a user - bumped whenever the user joins or leaves a channel
+MEMBERSHIP_VERSION_KEY = "chatly:channel_membership_version"
+# Version of the list of Chatly Users
+USER_LIST_VERSION_KEY = "chatly:user_list_version"
+
+
+def get_membership_version_key(user: str) -> str:
+	return f"{MEMBERSHIP_VERSION_KEY}:{user}"
+
+
+def get_version(key: str, expiry: int | None = None) -> int:
+	"""
+	Current value of a version counter
+	"""
+	cache = frappe.cache()
+	key = cache.make_key(key)
+
+	pipeline = cache.pipeline()
+	pipeline.set(key, get_initial_version(), nx=True, ex=expiry)
+	pipeline.get(key)
+	_created, version = pipeline.execute()
+
+	return int(version)
+
+
+def bump_version(key: str, expiry: int | None = None):
+	"""
+	Increment a version counter - every ETag computed from the previous version is now stale
+	"""
+	cache = frappe.cache()
+	key = cache.make_key(key)
+
+	pipeline = cache.pipeline()
+	pipeline.set(key, get_initial_version(), nx=True)
+	pipeline.incr(key)
+	if expiry:
+		pipeline.expire(key, expiry)
+	pipeline.execute()
+
+
+def bump_version_after_commit(key: str):
+	"""
+	Bump the version once the transaction is committed.
+	Bumping before the commit would let a concurrent read tag the old response with the new version.
+	"""
+	frappe.db.after_commit.add(partial(bump_version, key))
+
+
+def get_initial_version() -> int:
+	return int(time.time() * 1000)
+
+
+def make_etag(*parts) -> str:
+	"""
+	Strong validator for a response built from the given parts (versions, user, parameters)
+	"""
+	digest = hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()
+	return f'"{digest}"'
+
+
+def is_not_modified(etag: str) -> bool:
+	"""
+	Sets the ETag of the response and checks if the client already has it (sent in the If-None-Match header).
+
+	If it does, the response status is set to 304 and the caller should return nothing.
+	"""
+	headers = getattr(frappe.local, "response_headers", None)
+	if headers is not None:
+		headers.set("ETag", etag)
+		# Let browsers keep the response, but revalidate it before every use
+		headers.set("Cache-Control", "private, no-cache")
+
+	if_none_match = frappe.get_request_header("If-None-Match")
+	if not if_none_match:
+		return False
+
+	# Proxies that compress the response (like nginx) turn strong ETags into weak ones
+	client_etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+	if etag not in client_etags and "*" not in client_etags:
+		return False
+
+	frappe.local.response["http_status_code"] = 304
+	return True
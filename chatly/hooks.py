@@ -146,6 +146,21 @@ doc_events = {
 # ],
 # }
 
+scheduler_events = {
+	"cron": {
+		"* * * * *": [
+			"chatly.channel_visits.flush_pending_visits",
+			"chatly.channel_last_message.persist_last_messages",
+		],
+	},
+	"hourly": [
+		"chatly.chatly_channel_management.doctype.chatly_channel_member.chatly_channel_member.reconcile_unread_counts",
+	],
+	"daily": [
+		"chatly.chatly_messaging.doctype.chatly_message_change.chatly_message_change.delete_old_changes",
+	],
+}
+
 # Testing
 # -------
 
@@ -172,7 +187,7 @@ doc_events = {
 # Ignore links to specified DocTypes when deleting documents
 # -----------------------------------------------------------
 
-ignore_links_on_delete = ["Chatly Message"]
+ignore_links_on_delete = ["Chatly Message", "Chatly Saved Message"]
 
 
 # User Data Protection
@@ -0,0 +1,190 @@
+"""
+Hot-tail cache for the chat stream
+
+Most channel opens only need the latest page of messages. We keep the latest `TAIL_SIZE` messages of a channel
+in a Redis list (newest first) so that `get_messages` does not need to hit the database.
+
+The list is maintained by the lifecycle hooks of Chatly Message:
+1. New messages are pushed to the head of the list (and the list is trimmed) after the transaction is committed.
+2. Edits, reactions, bookmarks and deletes invalidate the list - it is rebuilt from the database on the next read.
+
+Every change also bumps a per-channel version. A rebuild that raced with a change is discarded,
+and the list is checked for ordering on every read - if anything looks off, we fall back to the database.
+The same version is the ETag of the latest messages of the channel.
+"""
+
+import pickle
+from functools import partial
+
+import frappe
+
+from chatly.conditional_requests import bump_version, get_version
+
+# Number of latest messages cached per channel
+TAIL_SIZE = 50
+# Tails of inactive channels expire after a while
+TAIL_EXPIRY = 6 * 60 * 60
+
+HITS_KEY = "chatly:message_tail_hits"
+MISSES_KEY = "chatly:message_tail_misses"
+
+
+def get_tail_key(channel_id: str) -> str:
+	return f"chatly:message_tail:{channel_id}"
+
+
+def get_version_key(channel_id: str) -> str:
+	return f"chatly:message_tail_version:{channel_id}"
+
+
+def get_tail_version(channel_id: str) -> int:
+	return get_version(get_version_key(channel_id), TAIL_EXPIRY)
+
+
+def get_cached_messages(channel_id: str, limit: int):
+	"""
+	Returns the latest `limit` messages of a channel and whether older messages exist, or None if they are not cached
+	"""
+	if limit >= TAIL_SIZE:
+		# We cannot tell if there are older messages without fetching more than the tail
+		return None
+
+	cache = frappe.cache()
+	entries = cache.lrange(get_tail_key(channel_id), 0, -1)
+
+	if not entries:
+		record_miss()
+		return None
+
+	messages = [pickle.loads(entry) for entry in entries]
+
+	if not is_ordered(messages):
+		# Concurrent writers pushed messages out of order or twice - rebuild from the database
+		clear_tail(channel_id)
+		record_miss()
+		return None
+
+	record_hit()
+
+	# The list holds either the complete channel or the latest TAIL_SIZE messages,
+	# so there are older messages only if we have more than we need
+	return messages[:limit], len(messages) > limit
+
+
+def set_cached_messages(channel_id: str, messages: list, version=None):
+	"""
+	Replace the tail of a channel with the given messages (newest first)
+
+	`version` is the version of the tail before the messages were fetched from the database.
+	If the channel changed in the meantime, the tail is discarded since it might be stale.
+	"""
+	if not messages:
+		return
+
+	cache = frappe.cache()
+	key = cache.make_key(get_tail_key(channel_id))
+
+	pipeline = cache.pipeline()
+	pipeline.delete(key)
+	pipeline.rpush(key, *[pickle.dumps(message) for message in messages[:TAIL_SIZE]])
+	pipeline.expire(key, TAIL_EXPIRY)
+	pipeline.execute()
+
+	if get_tail_version(channel_id) != version:
+		clear_tail(channel_id)
+
+
+def is_ordered(messages: list) -> bool:
+	"""
+	Messages in the tail should be strictly ordered by their sequence number - newest first
+	"""
+	for newer, older in zip(messages, messages[1:]):
+		# Entries cached before messages had a sequence number are treated as out of order
+		if (newer.seq or 0) <= (older.seq or 0):
+			return False
+	return True
+
+
+def push_message(channel_id: str, message_id: str):
+	"""
+	Push a newly inserted message to the head of the tail (if the tail is cached)
+	"""
+	bump_tail_version(channel_id)
+
+	cache = frappe.cache()
+
+	if not cache.exists(get_tail_key(channel_id)):
+		return
+
+	from chatly.api.chat_stream import get_message_query
+
+	message = frappe.qb.DocType("Chatly Message")
+	rows = get_message_query(message).where(message.name == message_id).run(as_dict=True)
+
+	if not rows:
+		clear_tail(channel_id)
+		return
+
+	key = cache.make_key(get_tail_key(channel_id))
+
+	pipeline = cache.pipeline()
+	pipeline.lpush(key, pickle.dumps(rows[0]))
+	pipeline.ltrim(key, 0, TAIL_SIZE - 1)
+	pipeline.execute()
+
+
+def invalidate_tail(channel_id: str):
+	"""
+	Discard the tail of a channel - it will be rebuilt from the database on the next read
+	"""
+	bump_tail_version(channel_id)
+	clear_tail(channel_id)
+
+
+def clear_tail(channel_id: str):
+	frappe.cache().delete_value(get_tail_key(channel_id))
+
+
+def bump_tail_version(channel_id: str):
+	bump_version(get_version_key(channel_id), TAIL_EXPIRY)
+
+
+def push_message_after_commit(channel_id: str, message_id: str):
+	"""
+	Push the message to the tail once the transaction is committed (so that we never cache a rolled back message)
+	"""
+	frappe.db.after_commit.add(partial(push_message, channel_id, message_id))
+
+
+def invalidate_tail_after_commit(channel_id: str):
+	"""
+	Invalidate the tail once the transaction is committed.
+	Invalidating before the commit would let a concurrent read cache the old state again.
+	"""
+	frappe.db.after_commit.add(partial(invalidate_tail, channel_id))
+
+
+def record_hit():
+	frappe.cache().incr(frappe.cache().make_key(HITS_KEY))
+
+
+def record_miss():
+	frappe.cache().incr(frappe.cache().make_key(MISSES_KEY))
+
+
+@frappe.whitelist()
+def get_cache_stats():
+	"""
+	Hit and miss counters of the hot-tail message cache
+	"""
+	frappe.only_for("System Manager")
+
+	cache = frappe.cache()
+	hits = int(cache.get(cache.make_key(HITS_KEY)) or 0)
+	misses = int(cache.get(cache.make_key(MISSES_KEY)) or 0)
+
+	return {
+		"hits": hits,
+		"misses": misses,
+		"hit_ratio": hits / (hits + misses) if hits + misses else 0,
+	}
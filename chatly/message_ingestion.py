@@ -0,0 +1,219 @@
+"""
+Bulk insert of messages (for bots and importers)
+
+Inserting messages one at a time runs the full document lifecycle for every message - a row lock on the channel
+for the sequence number, a realtime event, a background job and a push notification per message.
+Here, a batch of messages is validated in memory and written with one multi-row INSERT per table.
+For every channel in the batch, the sequence numbers and change feed versions are allocated with a single
+counter update, and the channel metadata, unread counts and realtime event are handled once.
+
+Push notifications are not sent for messages inserted in bulk.
+"""
+
+import datetime
+
+import frappe
+from frappe import _
+from frappe.model.naming import set_new_name
+from frappe.utils import get_datetime
+
+from chatly.chatly_channel_management.doctype.chatly_channel_counter.chatly_channel_counter import (
+	increment_channel_counters,
+)
+from chatly.chatly_messaging.doctype.chatly_message.chatly_message import (
+	enqueue_message_pipeline_after_commit,
+)
+from chatly.chatly_messaging.doctype.chatly_message_attachment.chatly_message_attachment import (
+	index_message_attachments,
+)
+from chatly.chatly_messaging.doctype.chatly_message_change.chatly_message_change import (
+	record_message_changes,
+)
+from chatly.message_cache import invalidate_tail_after_commit
+
+# Maximum number of messages that can be inserted in one call
+MAX_BULK_MESSAGES = 500
+
+
+def insert_messages(messages: list, ignore_permissions: bool = False, publish: bool = True) -> list:
+	"""
+	Insert a batch of messages. Every message is a dict of Chatly Message fields (with the channel_id).
+	The name, owner and creation of the messages are kept if they are set (for importers).
+
+	Messages are inserted in the given order. Returns the names of the inserted messages.
+	"""
+	if len(messages) > MAX_BULK_MESSAGES:
+		frappe.throw(_("You can only send up to {0} messages at once").format(MAX_BULK_MESSAGES))
+
+	docs = [prepare_message(message) for message in messages]
+	validate_linked_messages(docs)
+
+	messages_by_channel = {}
+	for doc in docs:
+		messages_by_channel.setdefault(doc.channel_id, []).append(doc)
+
+	for channel_id, channel_messages in messages_by_channel.items():
+		if not ignore_permissions:
+			# Every message in the channel has the same owner, so checking one of them is enough
+			channel_messages[0].check_permission("create")
+
+		insert_channel_messages(channel_id, channel_messages, publish)
+
+	return [doc.name for doc in docs]
+
+
+def prepare_message(message: dict):
+	"""
+	Build and validate a message document in memory - same as `insert` does before writing it
+	"""
+	doc = frappe.get_doc({"message_type": "Text", **message, "doctype": "Chatly Message"})
+
+	doc._action = "insert"
+	doc.flags.in_insert = True
+	doc._set_defaults()
+	doc.set_user_and_timestamp()
+	for fieldname in ("owner", "creation"):
+		if message.get(fieldname):
+			doc.set(fieldname, message[fieldname])
+	doc.set_docstatus()
+	doc.set_new_name(set_name=message.get("name"))
+
+	# Computes the content and the mentions
+	doc.before_validate()
+	# Mandatory fields, lengths and options of select fields, and sanitizes the HTML in the text
+	doc._validate()
+	# Links (and linked messages) are validated for the whole batch - see `validate_linked_messages`
+	doc.validate_poll_id()
+
+	doc.set_parent_in_children()
+	for child in doc.get_all_children():
+		set_new_name(child)
+
+	return doc
+
+
+def validate_linked_messages(docs: list):
+	"""
+	Linked messages should be in the same channel - checked with one query for the batch.
+	Messages can also link to earlier messages in the same batch.
+	"""
+	channels = {doc.name: doc.channel_id for doc in docs}
+
+	batch_messages = set(channels)
+	for doc in docs:
+		validate_links(doc, batch_messages)
+
+	linked_messages = {doc.linked_message for doc in docs if doc.linked_message} - set(channels)
+	if linked_messages:
+		channels.update(
+			frappe.get_all(
+				"Chatly Message",
+				filters={"name": ("in", list(linked_messages))},
+				fields=["name", "channel_id"],
+				as_list=True,
+			)
+		)
+
+	for doc in docs:
+		if doc.linked_message and channels.get(doc.linked_message) != doc.channel_id:
+			frappe.throw(_("Linked message should be in the same channel"))
+
+
+def validate_links(doc, batch_messages: set):
+	"""
+	Same link validation as `insert`, except for links to messages in the same batch (not written yet)
+	"""
+	linked_message = doc.linked_message
+	if linked_message in batch_messages:
+		doc.linked_message = None
+
+	try:
+		doc._validate_links()
+	finally:
+		doc.linked_message = linked_message
+
+
+def insert_channel_messages(channel_id: str, docs: list, publish: bool = True):
+	# Sequence numbers and change versions of the batch are allocated with one update of the channel counters
+	counters = increment_channel_counters(
+		channel_id, last_message_seq=len(docs), change_version=len(docs)
+	)
+	for i, doc in enumerate(docs):
+		doc.seq = counters.last_message_seq - len(docs) + i + 1
+
+	set_replied_message_details(docs)
+
+	bulk_insert_docs("Chatly Message", docs)
+	bulk_insert_docs("Chatly Mention", [child for doc in docs for child in doc.get("mentions")])
+	index_message_attachments(docs)
+
+	record_message_changes(
+		channel_id, [doc.name for doc in docs], "Created", last_version=counters.change_version
+	)
+
+	# The tail is rebuilt on the next read instead of pushing every message to it
+	invalidate_tail_after_commit(channel_id)
+	# Updates the last message of the channel and publishes the new unread counts to the members
+	enqueue_message_pipeline_after_commit(channel_id)
+
+	if not publish:
+		return
+
+	frappe.publish_realtime(
+		"messages_created",
+		{
+			"channel_id": channel_id,
+			"sender": frappe.session.user,
+			"messages": [doc.get_message_details() for doc in docs],
+		},
+		doctype="Chatly Channel",
+		# Adding this to automatically add the room for the event via Frappe
+		docname=channel_id,
+		after_commit=True,
+	)
+
+
+def set_replied_message_details(docs: list):
+	"""
+	Set the replied message details of all replies in the batch with one query
+	"""
+	details = {doc.name: doc for doc in docs}
+
+	linked_messages = {
+		doc.linked_message for doc in docs if doc.is_reply and doc.linked_message
+	} - set(details)
+	if linked_messages:
+		details.update(
+			(message.name, message)
+			for message in frappe.get_all(
+				"Chatly Message",
+				filters={"name": ("in", list(linked_messages))},
+				fields=["name", "text", "content", "file", "message_type", "owner", "creation"],
+			)
+		)
+
+	for doc in docs:
+		if not (doc.is_reply and doc.linked_message in details):
+			continue
+
+		linked_message = details[doc.linked_message]
+		doc.replied_message_details = {
+			"text": linked_message.text,
+			"content": linked_message.content,
+			"file": linked_message.file,
+			"message_type": linked_message.message_type,
+			"owner": linked_message.owner,
+			"creation": datetime.datetime.strftime(
+				get_datetime(linked_message.creation), "%Y-%m-%d %H:%M:%S"
+			),
+		}
+
+
+def bulk_insert_docs(doctype: str, docs: list):
+	if not docs:
+		return
+
+	rows = [doc.get_valid_dict(convert_dates_to_str=True) for doc in docs]
+	fields = list(rows[0])
+
+	frappe.db.bulk_insert(doctype, fields, [[row.get(field) for field in fields] for row in rows])
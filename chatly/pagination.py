@@ -0,0 +1,83 @@
+"""
+Keyset (cursor) pagination for lists that are not ordered by the sequence of messages - search results and files
+
+A page is fetched with a condition on the sort values of the last row of the previous page, instead of an OFFSET,
+so a deep page reads as few rows as the first one. The client gets an opaque cursor with those values and passes it
+back as is for the next page.
+"""
+
+import base64
+import json
+import operator
+
+import frappe
+from frappe import _
+from pypika import Order
+
+
+def encode_cursor(values: list) -> str:
+	"""
+	Opaque cursor for the sort values of a row - the last value is always the name of the row (the tie-breaker)
+	"""
+	data = json.dumps(values, default=str, separators=(",", ":"))
+	return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, length: int) -> list:
+	"""
+	Sort values in a cursor - throws if the cursor is not a valid cursor for a list sorted on `length` values
+	"""
+	try:
+		values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+	except ValueError:
+		values = None
+
+	if not isinstance(values, list) or len(values) != length:
+		frappe.throw(_("Invalid cursor"), frappe.ValidationError)
+
+	return values
+
+
+def get_keyset_condition(fields: list, values: list, order: Order = Order.desc):
+	"""
+	Condition for the rows after the given sort values, in a list ordered by the fields (all in the same order):
+
+	(a < va) OR (a = va AND b < vb) OR (a = va AND b = vb AND c < vc) ...
+	"""
+	compare = operator.lt if order == Order.desc else operator.gt
+
+	condition = None
+	equal_so_far = None
+	for field, value in zip(fields, values):
+		after = compare(field, value)
+		if equal_so_far is not None:
+			after = equal_so_far & after
+
+		condition = after if condition is None else condition | after
+		equal_so_far = field == value if equal_so_far is None else equal_so_far & (field == value)
+
+	return condition
+
+
+def paginate(
+	query, fields: list, keys: list, page_length: int, cursor: str | None = None, order=Order.desc
+):
+	"""
+	Run a query one page at a time - ordered by the fields, with keys being the names of those fields in the rows
+
+	Returns the rows of the page and the cursor for the next page (None if this is the last page)
+	"""
+	if cursor:
+		query = query.where(get_keyset_condition(fields, decode_cursor(cursor, len(fields)), order))
+
+	for field in fields:
+		query = query.orderby(field, order=order)
+
+	rows = query.limit(page_length + 1).run(as_dict=True)
+
+	next_cursor = None
+	if len(rows) > page_length:
+		rows = rows[:page_length]
+		next_cursor = encode_cursor([rows[-1][key] for key in keys])
+
+	return rows, next_cursor
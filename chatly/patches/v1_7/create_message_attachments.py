@@ -0,0 +1,41 @@
+import frappe
+
+from chatly.chatly_messaging.doctype.chatly_message_attachment.chatly_message_attachment import (
+	index_message_attachments,
+)
+
+BATCH_SIZE = 1000
+
+
+def execute():
+	"""
+	Add the files of all existing messages to the attachment catalogue
+	"""
+	message = frappe.qb.DocType("Chatly Message")
+
+	last_name = ""
+	while True:
+		messages = (
+			frappe.qb.from_(message)
+			.select(
+				message.name,
+				message.channel_id,
+				message.owner,
+				message.creation,
+				message.message_type,
+				message.file,
+			)
+			.where(message.name > last_name)
+			.where(message.message_type.isin(["File", "Image"]))
+			.where(message.file.isnotnull())
+			.orderby(message.name)
+			.limit(BATCH_SIZE)
+			.run(as_dict=True)
+		)
+		if not messages:
+			break
+
+		index_message_attachments(messages)
+		frappe.db.commit()
+
+		last_name = messages[-1].name
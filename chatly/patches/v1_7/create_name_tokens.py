@@ -0,0 +1,16 @@
+import frappe
+
+from chatly.chatly.doctype.chatly_name_token.chatly_name_token import index_name
+
+
+def execute():
+	"""
+	Index the names of all channels and users for typeahead search
+	"""
+	for channel in frappe.get_all(
+		"Chatly Channel", filters={"is_direct_message": 0}, fields=["name", "channel_name"]
+	):
+		index_name("Chatly Channel", channel.name, channel.channel_name)
+
+	for user in frappe.get_all("Chatly User", fields=["name", "full_name"]):
+		index_name("Chatly User", user.name, user.full_name)
@@ -0,0 +1,46 @@
+import json
+
+import frappe
+from frappe.utils import now_datetime
+
+BATCH_SIZE = 5000
+
+
+def execute():
+	"""
+	Bookmarks were only kept in `_liked_by` of messages - create a Chatly Saved Message for each of them
+	"""
+	message = frappe.qb.DocType("Chatly Message")
+	now = now_datetime()
+
+	last_name = ""
+	while True:
+		messages = (
+			frappe.qb.from_(message)
+			.select(message.name, message.channel_id, message._liked_by)
+			.where(message.name > last_name)
+			.where(message._liked_by.isnotnull())
+			.where(message._liked_by.notin(["", "[]"]))
+			.orderby(message.name)
+			.limit(BATCH_SIZE)
+			.run(as_dict=True)
+		)
+		if not messages:
+			break
+
+		values = []
+		for row in messages:
+			for user in json.loads(row._liked_by or "[]"):
+				values.append(
+					[frappe.generate_hash(), now, now, user, user, user, row.name, row.channel_id]
+				)
+
+		frappe.db.bulk_insert(
+			"Chatly Saved Message",
+			["name", "creation", "modified", "owner", "modified_by", "user", "message_id", "channel_id"],
+			values,
+			ignore_duplicates=True,
+		)
+		frappe.db.commit()
+
+		last_name = messages[-1].name
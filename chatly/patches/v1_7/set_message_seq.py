@@ -0,0 +1,60 @@
+import frappe
+
+from chatly.chatly_channel_management.doctype.chatly_channel_counter.chatly_channel_counter import (
+	create_channel_counter,
+)
+from chatly.chatly_messaging.doctype.chatly_message.chatly_message import on_doctype_update
+
+
+def execute():
+	# Index on (channel_id, seq) for pagination
+	on_doctype_update()
+
+	for channel_id in frappe.get_all("Chatly Channel", pluck="name"):
+		set_message_seq_for_channel(channel_id)
+		frappe.db.commit()
+
+
+def set_message_seq_for_channel(channel_id: str):
+	"""
+	Number all messages of a channel (1, 2, 3...) in the order they were created
+	and set the last message sequence number in the counters of the channel
+	"""
+	if frappe.db.db_type == "postgres":
+		frappe.db.sql(
+			"""
+			UPDATE "tabChatly Message" AS message
+			SET seq = numbered.message_seq
+			FROM (
+				SELECT name, ROW_NUMBER() OVER (ORDER BY creation, name) AS message_seq
+				FROM "tabChatly Message"
+				WHERE channel_id = %(channel_id)s
+			) AS numbered
+			WHERE message.name = numbered.name
+			""",
+			{"channel_id": channel_id},
+		)
+	else:
+		frappe.db.sql(
+			"""
+			UPDATE `tabChatly Message` AS message
+			JOIN (
+				SELECT name, ROW_NUMBER() OVER (ORDER BY creation, name) AS message_seq
+				FROM `tabChatly Message`
+				WHERE channel_id = %(channel_id)s
+			) AS numbered ON message.name = numbered.name
+			SET message.seq = numbered.message_seq
+			""",
+			{"channel_id": channel_id},
+		)
+
+	last_message_seq = frappe.db.count("Chatly Message", {"channel_id": channel_id})
+
+	create_channel_counter(channel_id)
+	frappe.db.set_value(
+		"Chatly Channel Counter",
+		channel_id,
+		"last_message_seq",
+		last_message_seq,
+		update_modified=False,
+	)
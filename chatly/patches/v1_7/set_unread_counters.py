@@ -0,0 +1,41 @@
+import frappe
+
+
+def execute():
+	"""
+	Unread counts are now calculated from sequence numbers.
+	Set the last seen message of every channel member from their last visit.
+	"""
+	if frappe.db.db_type == "postgres":
+		frappe.db.sql(
+			"""
+			UPDATE "tabChatly Channel Member" AS channel_member
+			SET last_seen_seq = COALESCE(
+				(
+					SELECT MAX(message.seq)
+					FROM "tabChatly Message" AS message
+					WHERE message.channel_id = channel_member.channel_id
+					AND message.creation <= channel_member.last_visit
+				),
+				0
+			),
+			deleted_unread_count = 0
+			"""
+		)
+	else:
+		frappe.db.sql(
+			"""
+			UPDATE `tabChatly Channel Member`
+			SET last_seen_seq = COALESCE(
+				(
+					SELECT MAX(message.seq)
+					FROM `tabChatly Message` AS message
+					WHERE message.channel_id = `tabChatly Channel Member`.channel_id
+					AND message.creation <= `tabChatly Channel Member`.last_visit
+				),
+				0
+			),
+			deleted_unread_count = 0
+			"""
+		)
+	frappe.db.commit()
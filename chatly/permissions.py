@@ -1,5 +1,10 @@
+from functools import partial
+
 import frappe
 
+# Hash of user -> channels that the user can read (see `get_accessible_channels`)
+ACCESSIBLE_CHANNELS_KEY = "chatly:accessible_channels"
+
 
 def chatly_user_has_permission(doc, user=None, ptype=None):
 	if not user:
@@ -36,6 +41,83 @@ def channel_has_permission(doc, user=None, ptype=None):
 			return False
 
 
+def get_readable_channels(channel_ids: list, user=None) -> list:
+	"""
+	Returns the channels (out of the given ones) that the user can read.
+	Same rules as `channel_has_permission`, checked against the cached `get_accessible_channels`.
+	"""
+	if not channel_ids:
+		return []
+
+	accessible_channels = set(get_accessible_channels(user))
+	return [channel_id for channel_id in channel_ids if channel_id in accessible_channels]
+
+
+def get_accessible_channels(user=None) -> list:
+	"""
+	Returns all channels that the user can read - Open and Public channels, the channels they are a member of
+	and the Private channels they own that have no members (same rules as `channel_has_permission`)
+
+	The list is cached per user - it is cleared when the user joins or leaves a channel,
+	for the owner when a Private channel gets its first member or loses its last one,
+	and for everyone when a channel is created, deleted or its type changes.
+	"""
+	if not user:
+		user = frappe.session.user
+
+	if not frappe.has_permission("Chatly Channel", "read", user=user):
+		return []
+
+	return frappe.cache().hget(
+		ACCESSIBLE_CHANNELS_KEY, user, generator=lambda: fetch_accessible_channels(user)
+	)
+
+
+def fetch_accessible_channels(user: str) -> list:
+	channel = frappe.qb.DocType("Chatly Channel")
+	channel_member = frappe.qb.DocType("Chatly Channel Member")
+	any_member = frappe.qb.DocType("Chatly Channel Member").as_("any_member")
+
+	query = frappe.qb.from_(channel).select(channel.name)
+
+	if user != "Administrator":
+		owned_without_members = (
+			(channel.type == "Private")
+			& (channel.owner == user)
+			& channel.name.notin(frappe.qb.from_(any_member).select(any_member.channel_id))
+		)
+		query = (
+			query.left_join(channel_member)
+			.on((channel_member.channel_id == channel.name) & (channel_member.user_id == user))
+			.where(
+				channel.type.isin(["Open", "Public"])
+				| channel_member.user_id.isnotnull()
+				| owned_without_members
+			)
+		)
+
+	return query.run(pluck=True)
+
+
+def clear_accessible_channels(user=None):
+	"""
+	Clear the cached accessible channels of a user (or of all users)
+	"""
+	if user:
+		frappe.cache().hdel(ACCESSIBLE_CHANNELS_KEY, user)
+	else:
+		frappe.cache().delete_value(ACCESSIBLE_CHANNELS_KEY)
+
+
+def clear_accessible_channels_after_commit(user=None):
+	"""
+	Clear the cache now (for reads later in this transaction) and again once the transaction is committed,
+	so that a concurrent read does not cache the old channels again
+	"""
+	clear_accessible_channels(user)
+	frappe.db.after_commit.add(partial(clear_accessible_channels, user))
+
+
 def channel_member_has_permission(doc, user=None, ptype=None):
 
 	# Allow self to modify their own channel member document
@@ -3,9 +3,53 @@ import { fetcher } from "../../../../hooks/useFetch";
 import MessageItem from "../MessageRenderer/MessageItem";
 import DateItem from "../MessageRenderer/DateItem";
 import useSWRSubscription from "swr/subscription";
-/** Fetches messages from the backend and renders them */
+const PAGE_SIZE = 100;
+
+const countMessages = (blocks) =>
+  blocks?.filter((block) => block.block_type === "message").length ?? 0;
+
+/**
+ * Merges the loaded older blocks with the latest page (both oldest first).
+ * The latest page wins for the messages in its range, and older messages that have moved out of it are kept.
+ * Date blocks are added once per date, right before the first message of that date.
+ */
+const mergeBlocks = (olderBlocks, latestBlocks) => {
+  const latestMessages = latestBlocks.filter((block) => block.block_type === "message");
+  const oldestLatestSeq = latestMessages.length ? latestMessages[0].data.seq : Infinity;
+
+  const olderMessages = olderBlocks.filter(
+    (block) => block.block_type !== "message" || block.data.seq < oldestLatestSeq
+  );
+
+  const merged = [];
+  let pendingDate = null;
+  let lastDate = null;
+  for (const block of [...olderMessages, ...latestBlocks]) {
+    if (block.block_type === "date") {
+      pendingDate = block;
+      continue;
+    }
+    if (pendingDate && pendingDate.data !== lastDate) {
+      merged.push(pendingDate);
+      lastDate = pendingDate.data;
+    }
+    pendingDate = null;
+    merged.push(block);
+  }
+  return merged;
+};
+
+/** Fetches messages from the backend (one page at a time) and renders them */
 const MessageStream = ({ channelID }) => {
   const containerRef = React.useRef(null);
+  // All pages loaded by the user (including the latest page at the time) - the latest page is kept up to date by the subscription
+  const [olderBlocks, setOlderBlocks] = React.useState([]);
+  const [hasOlderMessages, setHasOlderMessages] = React.useState(true);
+
+  React.useEffect(() => {
+    setOlderBlocks([]);
+    setHasOlderMessages(true);
+  }, [channelID]);
 
   const scrollToBottom = () => {
     const scrollHeight = containerRef.current?.scrollHeight;
@@ -17,7 +61,7 @@ const MessageStream = ({ channelID }) => {
   };
 
   const { data } = useSWRSubscription(
-    `chatly.api.chatly_message.get_messages_with_dates?channel_id=${channelID}`,
+    `chatly.api.chatly_message.get_messages_with_dates?channel_id=${channelID}&limit=${PAGE_SIZE}`,
     (key, { next }) => {
       //Initial load
       fetcher(key).then((data) => next(null, data));
@@ -50,13 +94,42 @@ const MessageStream = ({ channelID }) => {
     }, 200);
   }, [scrollToBottom, data]);
 
+  const blocks = mergeBlocks(olderBlocks, data?.message ?? []);
+  const canLoadOlderMessages =
+    hasOlderMessages && countMessages(data?.message) >= PAGE_SIZE;
+
+  const loadOlderMessages = () => {
+    const oldestMessage = blocks.find((block) => block.block_type === "message");
+    if (!oldestMessage) return;
+
+    frappe
+      .call({
+        method: "chatly.api.chatly_message.get_messages_with_dates",
+        args: {
+          channel_id: channelID,
+          limit: PAGE_SIZE,
+          before_message: oldestMessage.data.name,
+        },
+      })
+      .then((response) => {
+        // Keep the current latest page too, so that no message is lost when new messages push it out of the latest page
+        setOlderBlocks([...response.message, ...blocks]);
+        setHasOlderMessages(countMessages(response.message) >= PAGE_SIZE);
+      });
+  };
+
   return (
     <div>
       {/* TODO: Add Loading and Error states */}
       <div className="chatly-message-stream-container" ref={containerRef}>
-        {data?.message.map((message) => {
+        {canLoadOlderMessages && (
+          <button className="btn btn-xs btn-default" onClick={loadOlderMessages}>
+            {__("Load older messages")}
+          </button>
+        )}
+        {blocks.map((message, index) => {
           if (message.block_type === "date") {
-            return <DateItem date={message.data} key={message.data} />;
+            return <DateItem date={message.data} key={`date-${message.data}-${index}`} />;
           } else {
             return (
               <MessageItem message={message.data} key={message.data.name} />
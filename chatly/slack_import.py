@@ -0,0 +1,440 @@
+"""
+Importer for the channel history of a Slack export (a directory or a zip file)
+
+A Slack export has `users.json`, `channels.json` (public channels), `groups.json` (private channels)
+and a directory per channel with one JSON file per day. Users are mapped to Chatly Users by their email,
+channels are created (or reused) by their name, and the messages are inserted in chronological order
+with their reactions, thread replies and file references.
+
+The export is streamed one day file at a time, and messages are written in chunks with the bulk insert path
+(`chatly.message_ingestion`) - so memory stays flat regardless of the size of the export.
+After every chunk, the position in the export is saved as a checkpoint in the same transaction,
+so an interrupted import continues from the last committed chunk when it is run again.
+
+Usage: bench --site <site> chatly-import-slack <path to export>
+"""
+
+import datetime
+import hashlib
+import html
+import json
+import os
+import re
+import time
+import zipfile
+from urllib.parse import urlsplit
+
+import frappe
+from frappe.utils import get_system_timezone
+from pytz import timezone, utc
+
+from chatly.chatly_channel_management.doctype.chatly_channel_counter.chatly_channel_counter import (
+	get_channel_counters,
+)
+from chatly.message_ingestion import MAX_BULK_MESSAGES, insert_messages
+
+# A Slack message has up to 10 files (each one is a separate Chatly Message)
+IMPORT_CHUNK_SIZE = MAX_BULK_MESSAGES - 10
+
+# Messages that are not sent by users (joins, topic changes etc.) are skipped
+IMPORTED_SUBTYPES = {None, "bot_message", "file_share", "me_message", "thread_broadcast"}
+
+# Links to anything else (like javascript: URLs) are imported as plain text
+LINK_SCHEMES = {"http", "https", "mailto"}
+
+# Slack reactions are names - the common ones are converted to emojis, the rest are kept as :name:
+REACTION_EMOJIS = {
+	"+1": "👍",
+	"thumbsup": "👍",
+	"-1": "👎",
+	"thumbsdown": "👎",
+	"heart": "❤️",
+	"joy": "😂",
+	"smile": "😄",
+	"slightly_smiling_face": "🙂",
+	"laughing": "😆",
+	"tada": "🎉",
+	"eyes": "👀",
+	"pray": "🙏",
+	"fire": "🔥",
+	"clap": "👏",
+	"raised_hands": "🙌",
+	"100": "💯",
+	"white_check_mark": "✅",
+	"heavy_check_mark": "✔️",
+	"rocket": "🚀",
+	"thinking_face": "🤔",
+	"ok_hand": "👌",
+	"muscle": "💪",
+	"wave": "👋",
+}
+
+
+def get_checkpoint_key(path: str) -> str:
+	return f"chatly_slack_import:{os.path.basename(os.path.normpath(path))}"
+
+
+class SlackExport:
+	"""
+	Reads files from a Slack export - either extracted to a directory or as a zip file
+	"""
+
+	def __init__(self, path: str):
+		self.path = path
+		self.zip_file = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+
+	def read_json(self, filename: str, default=None):
+		try:
+			if self.zip_file:
+				with self.zip_file.open(filename) as f:
+					return json.load(f)
+
+			with open(os.path.join(self.path, filename)) as f:
+				return json.load(f)
+		except (KeyError, FileNotFoundError):
+			return default
+
+	def get_day_files(self, channel_name: str) -> list:
+		"""
+		Names of the day files of a channel, oldest first
+		"""
+		if self.zip_file:
+			prefix = f"{channel_name}/"
+			files = [
+				name[len(prefix) :]
+				for name in self.zip_file.namelist()
+				if name.startswith(prefix) and name.endswith(".json")
+			]
+		else:
+			channel_path = os.path.join(self.path, channel_name)
+			files = os.listdir(channel_path) if os.path.isdir(channel_path) else []
+
+		return sorted(name for name in files if name.endswith(".json"))
+
+
+def import_slack_export(path: str, progress=None) -> dict:
+	"""
+	Import a Slack export. Continues from the last checkpoint if the export was partially imported before.
+
+	`progress` is called with the stats after every chunk that is written
+	"""
+	export = SlackExport(path)
+	checkpoint_key = get_checkpoint_key(path)
+	# Position of the next Slack message to import - [channel name, day file, index in the day file]
+	checkpoint = json.loads(frappe.db.get_global(checkpoint_key) or "null")
+
+	users = map_users(export.read_json("users.json", []))
+
+	stats = {"channels": 0, "messages": 0, "messages_per_second": 0}
+	start = time.monotonic()
+
+	def write_chunk(chunk: list, position: list):
+		import_messages(chunk)
+		# Saved in the same transaction as the messages - so the import never skips or repeats a message
+		frappe.db.set_global(checkpoint_key, json.dumps(position))
+		frappe.db.commit()  # nosemgrep
+
+		stats["messages"] += len(chunk)
+		stats["messages_per_second"] = round(stats["messages"] / (time.monotonic() - start), 2)
+		if progress:
+			progress(stats)
+
+	slack_channels = [(channel, "Public") for channel in export.read_json("channels.json", [])]
+	slack_channels += [(channel, "Private") for channel in export.read_json("groups.json", [])]
+	slack_channels.sort(key=lambda row: row[0]["name"])
+
+	for slack_channel, channel_type in slack_channels:
+		channel_name = slack_channel["name"]
+		if checkpoint and channel_name < checkpoint[0]:
+			# Already imported
+			continue
+
+		channel_id = get_or_create_channel(slack_channel, channel_type, users)
+		chunk = []
+		position = None
+
+		for day_file in export.get_day_files(channel_name):
+			if checkpoint and [channel_name, day_file] < checkpoint[:2]:
+				continue
+
+			# Only one day of messages of a channel is in memory at a time
+			day_messages = export.read_json(f"{channel_name}/{day_file}", [])
+			day_messages.sort(key=lambda message: float(message.get("ts", 0)))
+
+			for index, slack_message in enumerate(day_messages):
+				position = [channel_name, day_file, index + 1]
+				if checkpoint and position <= checkpoint:
+					continue
+
+				chunk.extend(convert_message(slack_message, channel_id, users))
+
+				if len(chunk) >= IMPORT_CHUNK_SIZE:
+					write_chunk(chunk, position)
+					chunk = []
+
+		if chunk:
+			write_chunk(chunk, position)
+
+		mark_channel_as_read(channel_id)
+		frappe.db.commit()  # nosemgrep
+		stats["channels"] += 1
+
+	frappe.db.set_global(checkpoint_key, None)
+	frappe.db.commit()  # nosemgrep
+
+	return stats
+
+
+def map_users(slack_users: list) -> dict:
+	"""
+	Slack user ID -> (Chatly User, display name). Users are matched by email - users who are not
+	Chatly Users (and bots) have no Chatly User, and their messages are imported as the current user.
+	"""
+	emails = {
+		user["id"]: user.get("profile", {}).get("email")
+		for user in slack_users
+		if not user.get("is_bot")
+	}
+
+	chatly_users = dict(
+		frappe.get_all(
+			"Chatly User",
+			filters={"user": ("in", [email for email in emails.values() if email]), "type": "User"},
+			fields=["user", "name"],
+			as_list=True,
+		)
+	)
+
+	return {
+		user["id"]: (
+			chatly_users.get(emails.get(user["id"])),
+			user.get("real_name") or user.get("profile", {}).get("real_name") or user.get("name"),
+		)
+		for user in slack_users
+	}
+
+
+def get_or_create_channel(slack_channel: dict, channel_type: str, users: dict) -> str:
+	channel_name = slack_channel["name"].strip().lower().replace(" ", "-")
+
+	channel_id = frappe.db.get_value(
+		"Chatly Channel", {"channel_name": channel_name, "is_direct_message": 0}
+	)
+
+	if not channel_id:
+		channel = frappe.get_doc(
+			{
+				"doctype": "Chatly Channel",
+				"channel_name": channel_name,
+				"type": channel_type,
+				"channel_description": (slack_channel.get("purpose") or {}).get("value"),
+				"is_archived": 1 if slack_channel.get("is_archived") else 0,
+			}
+		)
+		channel.insert(ignore_permissions=True)
+		channel_id = channel.name
+
+	members = [users.get(member, (None, None))[0] for member in slack_channel.get("members", [])]
+	frappe.get_doc("Chatly Channel", channel_id).add_members(list(filter(None, members)))
+
+	return channel_id
+
+
+def get_message_name(channel_id: str, ts: str) -> str:
+	"""
+	Messages are named from their channel and Slack timestamp - so replies can link to their thread
+
+	The full digest is used - with a shortened one, a large history can have two messages with the same name,
+	and since names are deterministic the import would fail on the same chunk every time it is resumed.
+	"""
+	return hashlib.sha1(f"{channel_id}:{ts}".encode()).hexdigest()
+
+
+def convert_message(slack_message: dict, channel_id: str, users: dict) -> list:
+	"""
+	A Slack message as Chatly Messages - the text, and a message for every file shared with it
+	"""
+	if slack_message.get("type") != "message":
+		return []
+	if slack_message.get("subtype") not in IMPORTED_SUBTYPES:
+		return []
+
+	ts = slack_message["ts"]
+	owner, display_name = users.get(slack_message.get("user"), (None, None))
+	display_name = display_name or slack_message.get("username")
+
+	message = {
+		"name": get_message_name(channel_id, ts),
+		"channel_id": channel_id,
+		"creation": get_creation(ts),
+		"owner": owner or frappe.session.user,
+		"message_type": "Text",
+		"reactions": [
+			(users.get(user, (None, None))[0], get_reaction_emoji(reaction["name"]))
+			for reaction in slack_message.get("reactions", [])
+			for user in reaction.get("users", [])
+		],
+	}
+
+	thread_ts = slack_message.get("thread_ts")
+	if thread_ts and thread_ts != ts:
+		message["is_reply"] = 1
+		message["linked_message"] = get_message_name(channel_id, thread_ts)
+
+	text = convert_text(slack_message.get("text") or "", users)
+	if not owner and display_name:
+		# The sender is not a Chatly User - keep their name in the message
+		text = f"<strong>{html.escape(display_name)}</strong>: {text}"
+
+	messages = []
+	if slack_message.get("text"):
+		messages.append({**message, "text": f"<p>{text}</p>"})
+
+	for i, file in enumerate(slack_message.get("files", [])):
+		url = file.get("url_private") or file.get("permalink")
+		if not url:
+			continue
+
+		messages.append(
+			{
+				**message,
+				# The first message keeps the name (so that replies to it are linked to the file)
+				"name": message["name"] if not messages else get_message_name(channel_id, f"{ts}:{i}"),
+				"message_type": "Image" if (file.get("mimetype") or "").startswith("image/") else "File",
+				"file": url,
+				"reactions": message["reactions"] if not messages else [],
+			}
+		)
+
+	return messages
+
+
+def get_creation(ts: str) -> str:
+	"""
+	Slack timestamps are seconds since the epoch - convert them to the system timezone
+	"""
+	creation = datetime.datetime.fromtimestamp(float(ts), utc).astimezone(
+		timezone(get_system_timezone())
+	)
+	return creation.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def convert_text(text: str, users: dict) -> str:
+	"""
+	Convert Slack's markup to HTML. The text is already HTML escaped by Slack (except for the <...> links).
+	"""
+
+	def convert_link(match):
+		target, _sep, label = match.group(1).partition("|")
+		if target.startswith("@"):
+			name = users.get(target[1:], (None, None))[1] or label or target[1:]
+			return f"@{name}"
+		if target.startswith("#"):
+			return f"#{label or target[1:]}"
+		if target.startswith("!"):
+			return f"@{label or target[1:]}"
+
+		# Only web and mail links are kept as links
+		url = html.unescape(target)
+		if urlsplit(url).scheme.lower() not in LINK_SCHEMES:
+			return label or target
+		return f'<a href="{html.escape(url, quote=True)}">{label or target}</a>'
+
+	text = re.sub(r"<([^<>]+)>", convert_link, text)
+	text = re.sub(r"```(.+?)```", r"<pre>\1</pre>", text, flags=re.DOTALL)
+	text = re.sub(r"`([^`\n]+)`", r"<code>\1</code>", text)
+	text = re.sub(r"(?<![\w*])\*([^*\n]+)\*(?![\w*])", r"<strong>\1</strong>", text)
+	text = re.sub(r"(?<![\w_])_([^_\n]+)_(?![\w_])", r"<em>\1</em>", text)
+	text = re.sub(r"(?<![\w~])~([^~\n]+)~(?![\w~])", r"<s>\1</s>", text)
+
+	return text.replace("\n", "<br>")
+
+
+def get_reaction_emoji(name: str) -> str:
+	# Skin tones are dropped - "+1::skin-tone-2" is imported as "+1"
+	name = name.split("::")[0]
+	return REACTION_EMOJIS.get(name, f":{name}:")
+
+
+def import_messages(chunk: list):
+	"""
+	Insert a chunk of converted messages with their reactions
+	"""
+	reactions = {message["name"]: message.pop("reactions") for message in chunk}
+
+	# Replies to messages that were not imported (like channel joins) are kept as regular messages
+	parents = {message["linked_message"] for message in chunk if message.get("linked_message")}
+	if parents:
+		existing = set(
+			frappe.get_all("Chatly Message", filters={"name": ("in", list(parents))}, pluck="name")
+		)
+		existing.update(message["name"] for message in chunk)
+		for message in chunk:
+			if message.get("linked_message") and message["linked_message"] not in existing:
+				message.pop("linked_message")
+				message.pop("is_reply")
+
+	for message in chunk:
+		message["message_reactions"] = get_message_reactions(reactions[message["name"]])
+
+	# Old messages are not published to the clients - they reload the channel
+	insert_messages(chunk, ignore_permissions=True, publish=False)
+
+	now = frappe.utils.now()
+	rows = [
+		[frappe.generate_hash(), now, now, user, user, message_id, emoji, escape_reaction(emoji)]
+		for message_id, message_reactions in reactions.items()
+		for user, emoji in message_reactions
+		if user
+	]
+	if rows:
+		frappe.db.bulk_insert(
+			"Chatly Message Reaction",
+			[
+				"name",
+				"creation",
+				"modified",
+				"owner",
+				"modified_by",
+				"message",
+				"reaction",
+				"reaction_escaped",
+			],
+			rows,
+		)
+
+
+def get_message_reactions(reactions: list) -> str | None:
+	"""
+	Reactions of a message in the format of `message_reactions` (see `calculate_message_reaction`)
+	"""
+	total_reactions = {}
+	for user, emoji in reactions:
+		if not user:
+			continue
+		reaction = total_reactions.setdefault(emoji, {"count": 0, "users": [], "reaction": emoji})
+		reaction["count"] += 1
+		reaction["users"].append(user)
+
+	return json.dumps(total_reactions) if total_reactions else None
+
+
+def escape_reaction(reaction: str) -> str:
+	return reaction.encode("unicode-escape").decode("utf-8").replace("\\u", "")
+
+
+def mark_channel_as_read(channel_id: str):
+	"""
+	Imported history should not show up as unread for the members of the channel
+	"""
+	channel_member = frappe.qb.DocType("Chatly Channel Member")
+
+	last_message_seq = get_channel_counters(channel_id).last_message_seq or 0
+
+	(
+		frappe.qb.update(channel_member)
+		.set(channel_member.last_seen_seq, last_message_seq)
+		.set(channel_member.deleted_unread_count, 0)
+		.where(channel_member.channel_id == channel_id)
+		.run()
+	)
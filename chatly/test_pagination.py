@@ -0,0 +1,25 @@
+import datetime
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from chatly.pagination import decode_cursor, encode_cursor
+
+
+class TestPagination(FrappeTestCase):
+	def test_cursor(self):
+		"""
+		A cursor should decode to the sort values it was created from - dates as strings
+		"""
+		creation = datetime.datetime(2024, 5, 1, 10, 30, 0, 123456)
+		cursor = encode_cursor([1.5, creation, "abc123"])
+
+		self.assertNotIn("=", cursor)
+		self.assertEqual(decode_cursor(cursor, 3), [1.5, "2024-05-01 10:30:00.123456", "abc123"])
+
+	def test_invalid_cursor(self):
+		"""
+		A cursor that was tampered with or is for a different sort order should not be accepted
+		"""
+		self.assertRaises(frappe.ValidationError, decode_cursor, "not a cursor", 2)
+		self.assertRaises(frappe.ValidationError, decode_cursor, encode_cursor(["a", "b"]), 3)
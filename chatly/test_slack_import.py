@@ -0,0 +1,68 @@
+import json
+
+from frappe.tests.utils import FrappeTestCase
+
+from chatly.slack_import import (
+	convert_message,
+	convert_text,
+	get_message_name,
+	get_message_reactions,
+)
+
+USERS = {"U1": ("alice@example.com", "Alice"), "U2": (None, "Bob")}
+
+
+class TestSlackImport(FrappeTestCase):
+	def test_convert_text(self):
+		self.assertEqual(
+			convert_text("Hi <@U1>, see <https://example.com|this> *now*\nthanks", USERS),
+			'Hi @Alice, see <a href="https://example.com">this</a> <strong>now</strong><br>thanks',
+		)
+
+		# Link targets are escaped, and only web and mail links are kept
+		self.assertEqual(
+			convert_text('<https://example.com/?a=1&amp;b="2"|link> <javascript:alert(1)|click>', USERS),
+			'<a href="https://example.com/?a=1&amp;b=&quot;2&quot;">link</a> click',
+		)
+
+	def test_convert_message(self):
+		"""
+		Replies link to their thread, files are separate messages,
+		and senders who are not Chatly Users keep their name in the text
+		"""
+		messages = convert_message(
+			{
+				"type": "message",
+				"user": "U2",
+				"text": "Report",
+				"ts": "1700000000.000200",
+				"thread_ts": "1700000000.000100",
+				"files": [
+					{"url_private": "https://files.slack.com/report.pdf", "mimetype": "application/pdf"}
+				],
+				"reactions": [{"name": "+1", "users": ["U1", "U2"], "count": 2}],
+			},
+			"general",
+			USERS,
+		)
+
+		self.assertEqual(len(messages), 2)
+		self.assertEqual(messages[0]["name"], get_message_name("general", "1700000000.000200"))
+		self.assertEqual(messages[0]["linked_message"], get_message_name("general", "1700000000.000100"))
+		self.assertEqual(messages[0]["text"], "<p><strong>Bob</strong>: Report</p>")
+		self.assertEqual(messages[1]["message_type"], "File")
+		self.assertEqual(messages[1]["reactions"], [])
+
+		# Only reactions of Chatly Users are imported
+		reactions = json.loads(get_message_reactions(messages[0]["reactions"]))
+		self.assertEqual(reactions["👍"]["users"], ["alice@example.com"])
+
+		# Joins and other system messages are skipped
+		self.assertEqual(
+			convert_message(
+				{"type": "message", "subtype": "channel_join", "text": "joined", "ts": "1.0"},
+				"general",
+				USERS,
+			),
+			[],
+		)
@@ -0,0 +1,120 @@
+"""
+Fan-out of unread count updates to the members of a channel
+
+When a message is sent in a channel, the members need to update the unread count of the channel in the sidebar.
+Instead of asking every connected user to refetch their counts, we publish the new unread count
+to each member of the channel (as `chatly:unread_channel_count_updated` with `unread_count` in the payload).
+
+Channels (other than DMs) are handled in a background job. While a job for a channel is waiting in the queue,
+new messages in the channel do not enqueue another one - so a burst of messages results in a single fan-out.
+"""
+
+import json
+from functools import partial
+
+import frappe
+
+from chatly.channel_last_message import get_last_message
+from chatly.channel_visits import get_pending_visits_to_channel
+from chatly.chatly_channel_management.doctype.chatly_channel_counter.chatly_channel_counter import (
+	get_channel_counters,
+)
+from chatly.chatly_channel_management.doctype.chatly_channel_member.chatly_channel_member import (
+	get_unread_count,
+)
+
+# If a job is lost, new messages schedule a fan-out again after this many seconds
+FANOUT_LOCK_EXPIRY = 60
+
+
+def get_fanout_key(channel_id: str) -> str:
+	return f"chatly:unread_count_fanout:{channel_id}"
+
+
+def schedule_unread_count_fanout_after_commit(channel_id: str):
+	"""
+	Schedule the fan-out once the transaction is committed - the job should see the new message
+	"""
+	frappe.db.after_commit.add(partial(schedule_unread_count_fanout, channel_id))
+
+
+def schedule_unread_count_fanout(channel_id: str):
+	"""
+	Enqueue a fan-out job for the channel, unless one is already waiting in the queue
+	"""
+	cache = frappe.cache()
+
+	if cache.set(cache.make_key(get_fanout_key(channel_id)), 1, nx=True, ex=FANOUT_LOCK_EXPIRY):
+		frappe.enqueue(publish_unread_counts, queue="short", channel_id=channel_id)
+
+
+def publish_unread_counts(channel_id: str):
+	"""
+	Publish the unread count of the channel to each of its members
+	"""
+	# Messages sent from now on are not part of the counts below, so they need to schedule another fan-out
+	frappe.cache().delete(frappe.cache().make_key(get_fanout_key(channel_id)))
+
+	last_message_details = get_last_message(channel_id)["last_message_details"]
+	sent_by = json.loads(last_message_details).get("owner") if last_message_details else None
+
+	for user, unread_count in get_unread_counts_for_members(channel_id).items():
+		frappe.publish_realtime(
+			"chatly:unread_channel_count_updated",
+			{
+				"channel_id": channel_id,
+				"play_sound": False,
+				"sent_by": sent_by,
+				"unread_count": unread_count,
+			},
+			user=user,
+		)
+
+
+def get_unread_counts_for_members(channel_id: str, users: list | None = None) -> dict:
+	"""
+	Unread counts of the (human) members of a channel - user -> unread count
+	"""
+	if not frappe.db.exists("Chatly Channel", channel_id):
+		return {}
+
+	channel = get_channel_counters(channel_id)
+
+	channel_member = frappe.qb.DocType("Chatly Channel Member")
+	chatly_user = frappe.qb.DocType("Chatly User")
+
+	query = (
+		frappe.qb.from_(channel_member)
+		.join(chatly_user)
+		.on(chatly_user.name == channel_member.user_id)
+		.select(
+			channel_member.name,
+			channel_member.user_id,
+			channel_member.last_seen_seq,
+			channel_member.deleted_unread_count,
+		)
+		.where(channel_member.channel_id == channel_id)
+		.where(chatly_user.type == "User")
+	)
+
+	if users is not None:
+		query = query.where(channel_member.user_id.isin(users or [""]))
+
+	members = query.run(as_dict=True)
+
+	pending_visits = get_pending_visits_to_channel(
+		channel_id, [member.user_id for member in members]
+	)
+
+	return {
+		member.user_id: get_unread_count(
+			channel.last_message_seq,
+			channel.deleted_message_count,
+			member.name,
+			member.last_seen_seq,
+			member.deleted_unread_count,
+			pending_visits.get(member.user_id),
+			channel_id,
+		)
+		for member in members
+	}
@@ -1,10 +1,23 @@
 import frappe
 
+from chatly.channel_visits import record_visit, record_visit_if_newer
+from chatly.chatly_channel_management.doctype.chatly_channel_counter.chatly_channel_counter import (
+	get_channel_counters,
+)
 
-def track_channel_visit(channel_id, user=None, commit=False, publish_event_for_user=False):
+
+def track_channel_visit(
+	channel_id, user=None, commit=False, publish_event_for_user=False, last_seen_seq=None
+):
 	"""
 	Track the last visit of the user to the channel.
 	    If the user is not a member of the channel, create a new member record
+
+	The visit of a member is buffered in Redis and written to the database in batches (see `chatly.channel_visits`),
+	so `commit` is only needed when a new member record is created in a GET request.
+
+	`last_seen_seq` is the last message the user has seen, if it's not the latest message in the channel
+	(e.g. the message the user sent, when the visit is tracked in a background job)
 	"""
 
 	if not user:
@@ -14,8 +27,13 @@ def track_channel_visit(channel_id, user=None, commit=False, publish_event_for_u
 	channel_member = get_channel_member(channel_id, user)
 
 	if channel_member:
-		# Update the last visit
-		frappe.db.set_value("Chatly Channel Member", channel_member, "last_visit", frappe.utils.now())
+		if last_seen_seq is not None:
+			# Messages sent after it are still unread - unless the user has visited the channel since
+			record_visit_if_newer(channel_id, user, last_seen_seq)
+		else:
+			# Update the last visit - the user has seen all messages in the channel till now
+			last_message_seq = get_channel_counters(channel_id).last_message_seq
+			record_visit(channel_id, user, last_message_seq or 0)
 
 	# Else if the user is not a member of the channel and the channel is open, create a new member record
 	elif frappe.get_cached_value("Chatly Channel", channel_id, "type") == "Open":
@@ -23,20 +41,23 @@ def track_channel_visit(channel_id, user=None, commit=False, publish_event_for_u
 			{
 				"doctype": "Chatly Channel Member",
 				"channel_id": channel_id,
-				"user_id": frappe.session.user,
+				"user_id": user,
 				"last_visit": frappe.utils.now(),
+				"last_seen_seq": last_seen_seq,
 			}
 		).insert()
 
-	# Need to commit the changes to the database if the request is a GET request
-	if commit:
-		frappe.db.commit()  # nosempgrep
+		# Need to commit the changes to the database if the request is a GET request
+		if commit:
+			frappe.db.commit()  # nosempgrep
 
 	if publish_event_for_user:
 		frappe.publish_realtime(
 			"chatly:unread_channel_count_updated",
 			{
 				"channel_id": channel_id,
+				# The user has seen all messages in the channel
+				"unread_count": 0,
 			},
 			user=user,
 		)
@@ -51,7 +72,7 @@ def get_channel_member(channel_id, user=None):
 		user = frappe.session.user
 	# TODO: Read this from the cache (https://github.com/The-Commit-Company/Chatly/issues/762)
 	return frappe.db.get_value(
-		"Chatly Channel Member", {"channel_id": channel_id, "user_id": frappe.session.user}, "name"
+		"Chatly Channel Member", {"channel_id": channel_id, "user_id": user}, "name"
 	)
 
 
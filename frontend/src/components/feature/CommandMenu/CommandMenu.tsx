@@ -1,7 +1,7 @@
 import { DIALOG_CONTENT_CLASS } from '@/utils/layout/dialog'
 import { Dialog } from '@radix-ui/themes'
 import { Command } from 'cmdk'
-import { useEffect } from 'react'
+import { useEffect, useState } from 'react'
 import './commandMenu.styles.css'
 import ChannelList from './ChannelList'
 import UserList from './UserList'
@@ -61,14 +61,17 @@ const CommandMenu = () => {
 
 export const CommandList = () => {
     const isDesktop = useIsDesktop()
+    const [search, setSearch] = useState('')
     return <Command label="Global Command Menu" className='command-menu'>
         <Command.Input
             autoFocus={isDesktop}
+            value={search}
+            onValueChange={setSearch}
             placeholder='Search or type a command' />
         <Command.List>
             <Command.Empty>No results found.</Command.Empty>
             <ChannelList />
-            <UserList />
+            <UserList search={search} />
 
             {/* TODO: Make these commands work */}
             {/* <Command.Group heading="Commands">
@@ -1,38 +1,51 @@
 import { UserAvatar } from '@/components/common/UserAvatar'
-import { useGetUser } from '@/hooks/useGetUser'
+import { useDebounce } from '@/hooks/useDebounce'
 import { useFetchChannelList } from '@/utils/channel/ChannelListProvider'
-import { UserListContext } from '@/utils/users/UserListProvider'
 import { Command } from 'cmdk'
-import { useContext } from 'react'
 import DMChannelItem from './DMChannelItem'
 import { useNavigate } from 'react-router-dom'
 import { useSetAtom } from 'jotai'
 import { commandMenuOpenAtom } from './CommandMenu'
-import { useFrappePostCall } from 'frappe-react-sdk'
+import { useFrappeGetCall, useFrappePostCall } from 'frappe-react-sdk'
 import { Flex } from '@radix-ui/themes'
 import { Loader } from '@/components/common/Loader'
 import { toast } from 'sonner'
 import { getErrorMessage } from '@/components/layout/AlertBanner/ErrorBanner'
 
-const UserList = () => {
+type TypeaheadUser = {
+    name: string,
+    full_name: string,
+    user_image?: string,
+    type: 'User' | 'Bot',
+}
+
+const UserList = ({ search }: { search: string }) => {
 
     const { dm_channels } = useFetchChannelList()
 
-    const { users } = useContext(UserListContext)
+    const debouncedSearch = useDebounce(search, 200)
+
+    // Users are looked up on the server as the user types, instead of going through the whole directory
+    const { data } = useFrappeGetCall<{ message: { users: TypeaheadUser[] } }>('chatly.api.search.get_typeahead_results', {
+        search_text: debouncedSearch,
+        limit: 20
+    }, debouncedSearch ? undefined : null, {
+        revalidateOnFocus: false
+    })
 
-    const usersWithoutChannels = users.filter((user) => !dm_channels.find((channel) => channel.peer_user_id === user.name))
+    const usersWithoutChannels = (debouncedSearch ? data?.message.users ?? [] : []).filter((user) => !dm_channels.find((channel) => channel.peer_user_id === user.name))
 
     return (
         <Command.Group heading="Members">
             {dm_channels.map((channel) => <DMChannelItem key={channel.name} channelID={channel.name} peer_user_id={channel.peer_user_id} />)}
-            {usersWithoutChannels.map((user) => <UserWithoutDMItem key={user.name} userID={user.name} />)}
+            {usersWithoutChannels.map((user) => <UserWithoutDMItem key={user.name} user={user} />)}
         </Command.Group>
     )
 }
 
-const UserWithoutDMItem = ({ userID }: { userID: string }) => {
+const UserWithoutDMItem = ({ user }: { user: TypeaheadUser }) => {
 
-    const user = useGetUser(userID)
+    const userID = user.name
     const navigate = useNavigate()
     const setOpen = useSetAtom(commandMenuOpenAtom)
     const { call, loading } = useFrappePostCall<{ message: string }>('chatly.api.chatly_channel.create_direct_message_channel')
@@ -3,7 +3,7 @@ import { useFrappeGetCall } from 'frappe-react-sdk'
 import { useState } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { useDebounce } from '../../../hooks/useDebounce'
-import { GetChannelSearchResult } from '../../../../../types/Search/Search'
+import { GetChannelSearchResult, SearchResults } from '../../../../../types/Search/Search'
 import { ErrorBanner } from '../../layout/AlertBanner'
 import { EmptyStateForSearch } from '../../layout/EmptyState/EmptyState'
 import { ChannelIcon } from '@/utils/layout/channelIcon'
@@ -29,7 +29,7 @@ export const ChannelSearch = ({ onToggleMyChannels, isOpenMyChannels, input, onC
         setSearchText(e.target.value)
     }
 
-    const { data, error, isLoading } = useFrappeGetCall<{ message: GetChannelSearchResult[] }>("chatly.api.search.get_search_result", {
+    const { data, error, isLoading } = useFrappeGetCall<{ message: SearchResults<GetChannelSearchResult> }>("chatly.api.search.get_search_result", {
         filter_type: 'Channel',
         doctype: 'Chatly Channel',
         search_text: debouncedText,
@@ -106,11 +106,11 @@ export const ChannelSearch = ({ onToggleMyChannels, isOpenMyChannels, input, onC
             </Flex>
             <ScrollArea type="always" scrollbars="vertical" className='sm:h-[420px] h-[58vh]' mt='4'>
                 <ErrorBanner error={error} />
-                {data?.message?.length === 0 && <EmptyStateForSearch />}
-                {data?.message && data.message.length > 0 ?
+                {data?.message?.results.length === 0 && <EmptyStateForSearch />}
+                {data?.message && data.message.results.length > 0 ?
                     <Flex direction='column' gap='2' pr='4'>
 
-                        {data.message.map((channel: GetChannelSearchResult) => {
+                        {data.message.results.map((channel: GetChannelSearchResult) => {
                             return (
                                 <Box p='2'
                                     role='link'
@@ -2,7 +2,7 @@ import { BiSearch } from 'react-icons/bi'
 import { useFrappeGetCall } from 'frappe-react-sdk'
 import { useState, useContext } from 'react'
 import { useDebounce } from '../../../hooks/useDebounce'
-import { GetFileSearchResult } from '../../../../../types/Search/Search'
+import { GetFileSearchResult, SearchResults } from '../../../../../types/Search/Search'
 import { FileExtensionIcon } from '../../../utils/layout/FileExtIcon'
 import { getFileExtension, getFileName } from '../../../utils/operations'
 import { ErrorBanner } from '../../layout/AlertBanner'
@@ -60,7 +60,7 @@ export const FileSearch = ({ onToggleMyChannels, isOpenMyChannels, onToggleSaved
     }
 
 
-    const { data, error, isLoading } = useFrappeGetCall<{ message: GetFileSearchResult[] }>("chatly.api.search.get_search_result", {
+    const { data, error, isLoading } = useFrappeGetCall<{ message: SearchResults<GetFileSearchResult> }>("chatly.api.search.get_search_result", {
         filter_type: 'File',
         doctype: 'Chatly Message',
         search_text: debouncedText,
@@ -228,11 +228,11 @@ export const FileSearch = ({ onToggleMyChannels, isOpenMyChannels, onToggleSaved
             </Flex>
             <ScrollArea type="always" scrollbars="vertical" className='sm:h-[420px] h-[58vh]' mt='4'>
                 <ErrorBanner error={error} />
-                {data?.message?.length === 0 && <EmptyStateForSearch />}
-                {data?.message && data.message.length > 0 ?
+                {data?.message?.results.length === 0 && <EmptyStateForSearch />}
+                {data?.message && data.message.results.length > 0 ?
 
                     <Flex direction='column' gap='4'>
-                        {data.message.map((f: FileSearchResult) => {
+                        {data.message.results.map((f: FileSearchResult) => {
                             return (
                                 <Flex gap='3' key={f.name} align='center'>
                                     <Flex align='center' justify='center' className='w-[10%] sm:w-[5%]'>
@@ -7,13 +7,19 @@ import { useGetUser } from "@/hooks/useGetUser"
 import { Message } from "../../../../../types/Messaging/Message"
 import { useMemo } from "react"
 import { DateMonthYear } from "@/utils/dateConversions"
+import { SearchSnippet } from "./SearchSnippet"
 
 type MessageBoxProps = {
     message: Message
     handleScrollToMessage: (messageName: string, channelID: string) => void
+    /** Snippet of a search result - shown instead of the whole message */
+    snippet?: {
+        snippet: string,
+        highlights: [number, number][]
+    }
 }
 
-export const MessageBox = ({ message, handleScrollToMessage }: MessageBoxProps) => {
+export const MessageBox = ({ message, handleScrollToMessage, snippet }: MessageBoxProps) => {
 
     const { owner, creation, channel_id } = message
     const users = useGetUserRecords()
@@ -55,7 +61,7 @@ export const MessageBox = ({ message, handleScrollToMessage }: MessageBoxProps)
                     <Box mt='-1'>
                         <UserHoverCard user={user} userID={owner} isActive={false} />
                     </Box>
-                    <MessageContent message={message} user={user} />
+                    {snippet ? <SearchSnippet snippet={snippet.snippet} highlights={snippet.highlights} /> : <MessageContent message={message} user={user} />}
                 </Flex>
             </Flex>
         </Flex>
@@ -2,7 +2,7 @@ import { BiSearch } from 'react-icons/bi'
 import { useFrappeGetCall } from 'frappe-react-sdk'
 import { useContext, useState, useMemo } from 'react'
 import { useDebounce } from '../../../hooks/useDebounce'
-import { GetMessageSearchResult } from '../../../../../types/Search/Search'
+import { GetMessageSearchResult, SearchResults } from '../../../../../types/Search/Search'
 import { ErrorBanner } from '../../layout/AlertBanner'
 import { EmptyStateForSearch } from '../../layout/EmptyState/EmptyState'
 import { useNavigate } from 'react-router-dom'
@@ -32,7 +32,8 @@ interface MessageSearchResult {
     name: string,
     owner: string,
     creation: string,
-    text: string,
+    snippet: string,
+    highlights: [number, number][],
 }
 
 export const MessageSearch = ({ onToggleMyChannels, isOpenMyChannels, onToggleSaved, isSaved, input, fromFilter, inFilter, withFilter, onClose }: Props) => {
@@ -78,7 +79,7 @@ export const MessageSearch = ({ onToggleMyChannels, isOpenMyChannels, onToggleSa
         return (debouncedText.length > 2 || isChannelFilterApplied || isUserFilterApplied || isDateFilterApplied || isOpenMyChannels === true)
     }, [debouncedText, channelFilter, userFilter, isOpenMyChannels, dateFilter])
 
-    const { data, error, isLoading } = useFrappeGetCall<{ message: GetMessageSearchResult[] }>("chatly.api.search.get_search_result", {
+    const { data, error, isLoading } = useFrappeGetCall<{ message: SearchResults<GetMessageSearchResult> }>("chatly.api.search.get_search_result", {
         filter_type: 'Message',
         doctype: 'Chatly Message',
         search_text: debouncedText,
@@ -193,19 +194,22 @@ export const MessageSearch = ({ onToggleMyChannels, isOpenMyChannels, onToggleSa
             </Flex>
             <ScrollArea type="always" scrollbars="vertical" className='sm:h-[420px] h-[58vh]' mt='4'>
                 <ErrorBanner error={error} />
-                {data?.message?.length === 0 && <EmptyStateForSearch />}
-                {data?.message?.length && data?.message.length > 0 ? <Flex direction='column' gap='2'>
-                    {data.message.map((message: MessageSearchResult) => {
+                {data?.message?.results.length === 0 && <EmptyStateForSearch />}
+                {data?.message?.results.length && data?.message.results.length > 0 ? <Flex direction='column' gap='2'>
+                    {data.message.results.map((message: MessageSearchResult) => {
                         return (
                             <MessageBox
                                 key={message.name}
                                 message={{
                                     ...message,
+                                    text: message.snippet,
                                     message_type: 'Text',
                                     is_continuation: 0,
                                     is_reply: 0,
                                     _liked_by: '[]',
-                                }} handleScrollToMessage={handleScrollToMessage} />
+                                }}
+                                snippet={message}
+                                handleScrollToMessage={handleScrollToMessage} />
                         )
                     })}
                 </Flex> : !showResults && <Box className='text-center' py='8'>
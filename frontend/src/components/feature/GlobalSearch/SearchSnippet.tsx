@@ -0,0 +1,37 @@
+import { Text } from '@radix-ui/themes'
+import { Fragment, useMemo } from 'react'
+
+type SearchSnippetProps = {
+    snippet: string,
+    /** [start, end] offsets of the matched words in the snippet */
+    highlights: [number, number][]
+}
+
+/**
+ * Snippet of a message around the matched words of a search, with the matches highlighted
+ */
+export const SearchSnippet = ({ snippet, highlights }: SearchSnippetProps) => {
+
+    const parts = useMemo(() => {
+        const parts: { text: string, isMatch: boolean }[] = []
+        let position = 0
+        highlights.forEach(([start, end]) => {
+            if (start > position) {
+                parts.push({ text: snippet.slice(position, start), isMatch: false })
+            }
+            parts.push({ text: snippet.slice(start, end), isMatch: true })
+            position = end
+        })
+        if (position < snippet.length) {
+            parts.push({ text: snippet.slice(position), isMatch: false })
+        }
+        return parts
+    }, [snippet, highlights])
+
+    return <Text as='p' size='2' className='break-words'>
+        {parts.map((part, index) => part.isMatch ?
+            <mark key={index} className='bg-[var(--yellow-a5)] text-gray-12 rounded-sm'>{part.text}</mark> :
+            <Fragment key={index}>{part.text}</Fragment>
+        )}
+    </Text>
+}
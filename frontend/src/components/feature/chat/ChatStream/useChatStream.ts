@@ -210,6 +210,44 @@ const useChatStream = (scrollRef: MutableRefObject<HTMLDivElement | null>) => {
         }
     })
 
+    // Messages sent in bulk (by bots and importers) come in a single event
+    useFrappeEventListener('messages_created', (event) => {
+        if (event.channel_id === channelID) {
+
+            mutate((d) => {
+                if (d && d.message.has_new_messages === false) {
+                    const newMessages = [...(d.message.messages ?? [])]
+
+                    event.messages?.forEach((messageDetails: Message) => {
+                        const messageIndex = newMessages.findIndex(message => message.name === messageDetails.name)
+
+                        if (messageIndex !== -1) {
+                            newMessages[messageIndex] = messageDetails
+                        } else {
+                            newMessages.push(messageDetails)
+                        }
+                    })
+
+                    newMessages.sort((a, b) => {
+                        return new Date(b.creation).getTime() - new Date(a.creation).getTime()
+                    })
+                    return ({
+                        message: {
+                            messages: newMessages,
+                            has_old_messages: d.message.has_old_messages ?? false,
+                            has_new_messages: d.message.has_new_messages ?? false
+                        }
+                    })
+                } else {
+                    return d
+                }
+
+            }, {
+                revalidate: false,
+            })
+        }
+    })
+
     // If a message is edited, update the specific message
     useFrappeEventListener('message_edited', (event) => {
 
@@ -1,5 +1,4 @@
 import { useDebounce } from "@/hooks/useDebounce"
-import { usePagination } from "@/hooks/usePagination"
 import { useFrappeGetCall } from "frappe-react-sdk"
 import { ChangeEvent, useState } from "react"
 import { Box, Dialog, Flex, Heading, IconButton, Select, Text, TextField } from "@radix-ui/themes"
@@ -25,6 +24,7 @@ export type FileInChannel = {
     file_name: string,
     file_size: number,
     file_type: string,
+    file_category: 'image' | 'pdf' | 'doc' | 'ppt' | 'xls' | 'other',
     file_url: string,
     message_type: 'File' | 'Image',
     thumbnail_width?: number,
@@ -37,29 +37,58 @@ const ViewFilesContent = () => {
     const [searchText, setSearchText] = useState("")
     const debouncedText = useDebounce(searchText, 200)
 
+    const { channelID } = useParams<{ channelID: string }>()
+    const [fileType, setFileType] = useState<string | undefined>()
+    const [pageLength, setPageLength] = useState(10)
+
+    // Cursors of the pages before the current one - the last one is the cursor of the current page
+    const [cursors, setCursors] = useState<string[]>([])
+
     const handleChange = (event: ChangeEvent<HTMLInputElement>) => {
         setSearchText(event.target.value)
+        setCursors([])
     }
 
-    const { channelID } = useParams<{ channelID: string }>()
-    const [fileType, setFileType] = useState<string | undefined>()
+    const onFileTypeChange = (value: string) => {
+        setFileType(value)
+        setCursors([])
+    }
 
+    const onPageLengthChange = (value: number) => {
+        setPageLength(value)
+        setCursors([])
+    }
+
+    // The count is only an estimate (cached on the server) - it is not needed to get the pages
     const { data: count, error: countError } = useFrappeGetCall<{ message: number }>("chatly.api.chatly_message.get_count_for_pagination_of_files", {
         "channel_id": channelID,
         "file_name": debouncedText,
         "file_type": fileType === 'any' ? undefined : fileType
     })
 
-    const { start, selectedPageLength, setPageLength, nextPage, previousPage } = usePagination(10, count?.message ?? 0)
-
-    const { data, error, isLoading } = useFrappeGetCall<{ message: FileInChannel[] }>("chatly.api.chatly_message.get_all_files_shared_in_channel", {
+    const { data, error, isLoading } = useFrappeGetCall<{ message: { files: FileInChannel[], next_cursor: string | null } }>("chatly.api.chatly_message.get_all_files_shared_in_channel", {
         "channel_id": channelID,
         "file_name": debouncedText,
         "file_type": fileType === 'any' ? undefined : fileType,
-        "start_after": start > 0 ? (start - 1) : 0,
-        "page_length": selectedPageLength
+        "cursor": cursors.length > 0 ? cursors[cursors.length - 1] : undefined,
+        "page_length": pageLength
     })
 
+    const nextPage = () => {
+        if (data?.message.next_cursor) {
+            setCursors([...cursors, data.message.next_cursor])
+        }
+    }
+
+    const previousPage = () => {
+        setCursors(cursors.slice(0, -1))
+    }
+
+    const start = data?.message.files.length ? cursors.length * pageLength + 1 : 0
+    const end = start + (data?.message.files.length ?? 0) - 1
+    // The estimate can be stale - the last page is known from the cursor
+    const totalRows = data?.message.next_cursor ? Math.max(count?.message ?? 0, end + 1) : Math.max(end, 0)
+
     const isDesktop = useIsDesktop()
 
     return (
@@ -87,7 +116,7 @@ const ViewFilesContent = () => {
                                 {isLoading && <Loader />}
                             </TextField.Slot>
                         </TextField.Root>
-                        <Select.Root value={fileType} onValueChange={setFileType}>
+                        <Select.Root value={fileType} onValueChange={onFileTypeChange}>
                             <Select.Trigger placeholder='File Type' className="w-full sm:w-[200px]" />
                             <Select.Content className="z-50">
                                 <Select.Group>
@@ -138,12 +167,12 @@ const ViewFilesContent = () => {
                     <Flex justify='end' gap='2' align='center'>
                         <PageLengthSelector
                             options={[10, 20, 50, 100]}
-                            selectedValue={selectedPageLength}
-                            updateValue={(value) => setPageLength(value)} />
+                            selectedValue={pageLength}
+                            updateValue={onPageLengthChange} />
                         <PageSelector
-                            rowsPerPage={selectedPageLength}
+                            rowsPerPage={pageLength}
                             start={start}
-                            totalRows={count?.message ?? 0}
+                            totalRows={totalRows}
                             gotoNextPage={() => nextPage()}
                             gotoPreviousPage={() => previousPage()} />
                     </Flex>
@@ -154,13 +183,13 @@ const ViewFilesContent = () => {
 
                 {!data && !error && <TableLoader columns={3} />}
 
-                {data && data.message.length === 0 && (debouncedText.length >= 2 || debouncedText.length == 0) &&
+                {data && data.message.files.length === 0 && (debouncedText.length >= 2 || debouncedText.length == 0) &&
                     <Flex align='center' justify='center' direction='column' gap='2' className="min-h-[32rem]">
                         <Heading size='3'>Nothing to see here</Heading>
                         <Text size='2' align='center'>No files found in this channel</Text>
                     </Flex>}
 
-                {data && data.message.length !== 0 && <FilesTable data={data.message} />}
+                {data && data.message.files.length !== 0 && <FilesTable data={data.message.files} />}
 
             </Flex>
         </div>
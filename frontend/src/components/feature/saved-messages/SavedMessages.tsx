@@ -5,17 +5,22 @@ import { ErrorBanner } from "../../layout/AlertBanner"
 import { EmptyStateForSavedMessages } from "../../layout/EmptyState/EmptyState"
 import { PageHeader } from "../../layout/Heading/PageHeader"
 import { MessageBox } from "../GlobalSearch/MessageBox"
-import { Heading } from "@radix-ui/themes"
+import { Button, Heading } from "@radix-ui/themes"
 import { Box, Flex } from '@radix-ui/themes'
 import { BiChevronLeft } from "react-icons/bi"
+import { useState } from "react"
+
+type SavedMessagesResponse = {
+    messages: Message[],
+    next_cursor: string | null
+}
 
 const SavedMessages = () => {
 
     const navigate = useNavigate()
 
-    const { data, error } = useFrappeGetCall<{ message: Message[] }>("chatly.api.chatly_message.get_saved_messages", undefined, undefined, {
-        revalidateOnFocus: false
-    })
+    // Cursors of the pages loaded so far - the first page has no cursor
+    const [cursors, setCursors] = useState<(string | undefined)[]>([undefined])
 
     const handleNavigateToChannel = (channelID: string, baseMessage?: string) => {
         navigate(`/channel/${channelID}`, {
@@ -40,14 +45,15 @@ const SavedMessages = () => {
                 </Flex>
             </PageHeader>
             <Box className="min-h-screen pt-16 pb-8">
-                <ErrorBanner error={error} />
-                {data && data.message?.length === 0 && <EmptyStateForSavedMessages />}
                 <Flex direction='column' gap='3' justify='start' px='4'>
-                    {data?.message?.map((message) => {
-                        return (
-                            <MessageBox key={message.name} message={message} handleScrollToMessage={handleScrollToMessage} />
-                        )
-                    })}
+                    {cursors.map((cursor, index) => <SavedMessagesPage
+                        key={cursor ?? 'first'}
+                        cursor={cursor}
+                        isFirstPage={index === 0}
+                        isLastPage={index === cursors.length - 1}
+                        loadMore={(nextCursor) => setCursors([...cursors, nextCursor])}
+                        handleScrollToMessage={handleScrollToMessage} />
+                    )}
                 </Flex>
             </Box>
 
@@ -55,4 +61,39 @@ const SavedMessages = () => {
     )
 }
 
+interface SavedMessagesPageProps {
+    cursor?: string,
+    isFirstPage: boolean,
+    isLastPage: boolean,
+    loadMore: (nextCursor: string) => void,
+    handleScrollToMessage: (messageName: string, channelID: string) => void
+}
+
+const SavedMessagesPage = ({ cursor, isFirstPage, isLastPage, loadMore, handleScrollToMessage }: SavedMessagesPageProps) => {
+
+    const { data, error } = useFrappeGetCall<{ message: SavedMessagesResponse }>("chatly.api.chatly_message.get_saved_messages", {
+        cursor
+    }, undefined, {
+        revalidateOnFocus: false
+    })
+
+    return (
+        <>
+            <ErrorBanner error={error} />
+            {isFirstPage && data && data.message.messages.length === 0 && <EmptyStateForSavedMessages />}
+            {data?.message.messages.map((message) => {
+                return (
+                    <MessageBox key={message.name} message={message} handleScrollToMessage={handleScrollToMessage} />
+                )
+            })}
+            {isLastPage && data?.message.next_cursor &&
+                <Flex justify='center'>
+                    <Button variant='soft' color='gray' onClick={() => loadMore(data.message.next_cursor as string)}>
+                        Load more
+                    </Button>
+                </Flex>}
+        </>
+    )
+}
+
 export const Component = SavedMessages
\ No newline at end of file
@@ -39,15 +39,19 @@ const useUnreadMessageCount = () => {
 
     const { call } = useContext(FrappeContext) as FrappeConfig
 
-    const fetchUnreadCountForChannel = async (channelID: string) => {
+    const fetchUnreadCountForChannel = async (channelID: string, unreadCount?: number) => {
 
         updateCount(d => {
             if (d) {
                 // If the channel ID is present in the unread count, then fetch and update the unread count for the channel
                 if (d.message.channels.find(c => c.name === channelID)) {
-                    return call.get('chatly.api.chatly_message.get_unread_count_for_channel', {
-                        channel_id: channelID
-                    }).then((data: { message: number }) => {
+                    // The realtime event carries the new count - only fetch it if it's missing
+                    const countPromise: Promise<{ message: number }> = unreadCount !== undefined && unreadCount !== null ?
+                        Promise.resolve({ message: unreadCount }) :
+                        call.get('chatly.api.chatly_message.get_unread_count_for_channel', {
+                            channel_id: channelID
+                        })
+                    return countPromise.then((data: { message: number }) => {
                         const newChannels = d.message.channels.map(c => {
                             if (c.name === channelID)
                                 return {
@@ -104,9 +108,7 @@ const useUnreadMessageCount = () => {
             // If the user is already on the channel and is at the bottom of the chat (no base message), then don't update the unread count
             if (channelID === event.channel_id && !state?.baseMessage) {
             } else {
-                //TODO: perf: Can try to just increment the count by one instead of fetching the count again
-                // https://github.com/The-Commit-Company/Chatly/pull/745#issuecomment-2014313429
-                fetchUnreadCountForChannel(event.channel_id)
+                fetchUnreadCountForChannel(event.channel_id, event.unread_count)
             }
         }
 
@@ -18,4 +18,8 @@ export interface ChatlyChannelMember{
 	is_admin?: 0 | 1
 	/**	Last Visit : Datetime	*/
 	last_visit: string
+	/**	Last Seen Sequence : Int	*/
+	last_seen_seq?: number
+	/**	Deleted Unread Count : Int	*/
+	deleted_unread_count?: number
 }
\ No newline at end of file
@@ -21,6 +21,8 @@ export interface BaseMessage {
     is_bot_message?: 1 | 0,
     bot?: string,
     hide_link_preview?: 1 | 0,
+    /** Position of the message in its channel */
+    seq?: number,
 }
 
 export interface FileMessage extends BaseMessage {
@@ -51,6 +53,19 @@ export interface PollMessage extends BaseMessage {
     content?: string
 }
 
+/**
+ * Page of messages in the compact wire format (requested with `compact: true`)
+ * Each row has the values of `columns` in order - trailing nulls are dropped.
+ * `owner` and `channel_id` are indexes into `owners` and `channels`,
+ * and `message_reactions` and `replied_message_details` are parsed JSON.
+ */
+export interface CompactMessages {
+    columns: string[],
+    rows: unknown[][],
+    owners: string[],
+    channels: string[],
+}
+
 export type DateBlock = {
     block_type: 'date',
     data: string
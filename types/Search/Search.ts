@@ -2,6 +2,8 @@ export interface GetFileSearchResult {
     channel_id: string
     creation: string
     file: string
+    file_name: string
+    file_category: 'image' | 'pdf' | 'doc' | 'ppt' | 'xls' | 'other'
     message_type: string
     name: string
     owner: string
@@ -10,7 +12,10 @@ export interface GetFileSearchResult {
 export interface GetMessageSearchResult {
     channel_id: string
     creation: string
-    text: string
+    /** A part of the message around the matched words */
+    snippet: string
+    /** [start, end] offsets of the matched words in the snippet */
+    highlights: [number, number][]
     name: string
     owner: string
 }
@@ -20,4 +25,10 @@ export interface GetChannelSearchResult {
     name: string
     channel_name: string
     is_archived: 1 | 0
-}
\ No newline at end of file
+}
+
+/** A page of search results - pass next_cursor back as the cursor to get the next page */
+export interface SearchResults<T> {
+    results: T[]
+    next_cursor: string | null
+}